@@ -20,7 +20,7 @@ class TextbookRAG:
     RAG system for textbook content retrieval and quiz analysis.
     """
     
-    def __init__(self, textbook_dir: str = "RAG_textbook", persist_directory: str = "RAG_textbook/chroma_db", openai_api_key: str = None):
+    def __init__(self, textbook_dir: str = "RAG_textbook", persist_directory: str = "RAG_textbook/chroma_db", openai_api_key: str = None, max_distance: Optional[float] = None):
         """
         Initialize RAG system.
         
@@ -28,10 +28,12 @@ class TextbookRAG:
             textbook_dir: Directory containing PDF files
             persist_directory: Directory to persist Chroma vector store
             openai_api_key: OpenAI API key (if None, will try to get from environment)
+            max_distance: Opt-in cosine distance cutoff for coverage checks, e.g. 0.25 (None keeps all top-k hits)
         """
         self.textbook_dir = textbook_dir
         self.persist_directory = persist_directory
         self.openai_api_key = openai_api_key
+        self.max_distance = max_distance
         # Initialize embeddings with API key
         if openai_api_key:
             self.embeddings = OpenAIEmbeddings(openai_api_key=openai_api_key)
@@ -191,30 +193,35 @@ Answer:"""
             ]
         }
     
-    def search_similar_content(self, query: str, k: int = 5) -> List[Dict]:
+    def search_similar_content(self, query: str, k: int = 5, max_distance: Optional[float] = None) -> List[Dict]:
         """
         Search for similar content in textbooks.
         
         Args:
             query: Search query
             k: Number of results to return
+            max_distance: Only return chunks within this cosine distance (up to k)
             
         Returns:
-            List of similar content chunks
+            List of similar content chunks; "score" is the cosine distance (lower is closer)
         """
         if self.vectorstore is None:
             self.build_vectorstore()
         
-        # Search for similar documents
-        docs = self.vectorstore.similarity_search(query, k=k)
+        # Chroma returns squared L2 distances; for unit-length OpenAI embeddings
+        # cosine distance = d / 2. Results come back nearest first.
+        docs_and_scores = self.vectorstore.similarity_search_with_score(query, k=k)
         
         results = []
-        for doc in docs:
+        for doc, distance in docs_and_scores:
+            distance = distance / 2.0
+            if max_distance is not None and distance > max_distance:
+                break
             results.append({
                 "content": doc.page_content,
                 "source": doc.metadata.get("source", "unknown"),
                 "page": doc.metadata.get("page", "unknown"),
-                "score": None  # Chroma doesn't return scores by default
+                "score": distance
             })
         
         return results
@@ -233,9 +240,9 @@ Answer:"""
             self.build_vectorstore()
         
         # Search for quiz topics in textbook
-        similar_content = self.search_similar_content(quiz_text, k=10)
+        similar_content = self.search_similar_content(quiz_text, k=10, max_distance=self.max_distance)
         
-        # Analyze coverage
+        # Analyze coverage: share of the top 10 chunks within max_distance
         topics_found = len(similar_content) > 0
         coverage_score = min(len(similar_content) / 10.0, 1.0) if similar_content else 0.0
         
@@ -261,14 +268,14 @@ Answer:"""
             self.build_vectorstore()
         
         # Search for assignment topics in textbook
-        assignment_matches = self.search_similar_content(assignment_content, k=10)
+        assignment_matches = self.search_similar_content(assignment_content, k=10, max_distance=self.max_distance)
         
         # If quiz texts provided, check similarity with quizzes
         quiz_similarity = 0.0
         if quiz_texts:
             total_similarity = 0.0
             for quiz_text in quiz_texts:
-                quiz_matches = self.search_similar_content(quiz_text, k=5)
+                quiz_matches = self.search_similar_content(quiz_text, k=5, max_distance=self.max_distance)
                 # Simple similarity: check if assignment topics appear in quiz matches
                 assignment_topics = set(assignment_content.lower().split())
                 for match in quiz_matches:
@@ -6,6 +6,8 @@ import io
 import os
 import uuid
 import re
+import threading
+import time
 from dotenv import load_dotenv
 from typing import Dict, List, Optional
 from model import init_db, save_analysis, get_analysis, get_all_analyses
@@ -28,19 +30,75 @@ client = OpenAI(api_key=openai_api_key)
 
 # Initialize RAG system (lazy loading)
 rag_system = None
+rag_lock = threading.Lock()
+
+# Opt-in start-up warm-up: load the vector store and QA chain before the first request.
+RAG_WARMUP = os.getenv("RAG_WARMUP", "false").lower() in ("1", "true", "yes")
+RAG_WARMUP_QUERY = os.getenv("RAG_WARMUP_QUERY", "warm-up probe")
+# Seconds before retrying a failed warm-up; doubles up to the max.
+RAG_WARMUP_RETRY_DELAY = float(os.getenv("RAG_WARMUP_RETRY_DELAY", "5"))
+RAG_WARMUP_RETRY_MAX_DELAY = float(os.getenv("RAG_WARMUP_RETRY_MAX_DELAY", "300"))
+# "disabled" (lazy loading), "pending", "warming", "ready" or "failed"
+warmup_status = {"state": "disabled"}
 
 def get_rag_system():
     """Get or initialize RAG system."""
     global rag_system
-    if rag_system is None:
-      rag_system = TextbookRAG(openai_api_key=openai_api_key)
-      try:
-          rag_system.build_vectorstore(force_rebuild=False)
-      except Exception as e:
-          print(f"Warning: Could not load RAG system: {str(e)}")
-          rag_system = None
+    with rag_lock:
+        if rag_system is None:
+            rag_system = TextbookRAG(openai_api_key=openai_api_key)
+            try:
+                rag_system.build_vectorstore(force_rebuild=False)
+            except Exception as e:
+                print(f"Warning: Could not load RAG system: {str(e)}")
+                rag_system = None
     return rag_system
 
+
+def warm_up_rag():
+    """Load the RAG system, build its QA chain and run a probe search (no LLM call)."""
+    global warmup_status
+    attempts = warmup_status.get("attempts", 0) + 1
+    warmup_status = {"state": "warming", "attempts": attempts}
+    started = time.perf_counter()
+    try:
+        rag = get_rag_system()
+        if rag is None:
+            raise RuntimeError("RAG system not available. Please build vector store first.")
+        if rag.qa_chain is None:
+            rag.initialize_qa_chain()
+        rag.search_similar_content(RAG_WARMUP_QUERY, k=1)
+    except Exception as e:
+        print(f"Warning: RAG warm-up failed: {str(e)}")
+        warmup_status = {"state": "failed", "attempts": attempts, "error": str(e)}
+        return
+    warmup_status = {
+        "state": "ready",
+        "attempts": attempts,
+        "seconds": round(time.perf_counter() - started, 3),
+    }
+
+
+def warm_up_rag_until_ready():
+    """Retry warm_up_rag with exponential backoff until it succeeds."""
+    global warmup_status
+    delay = RAG_WARMUP_RETRY_DELAY
+    while True:
+        warm_up_rag()
+        if warmup_status["state"] != "failed":
+            return
+        warmup_status = {**warmup_status, "retry_in": delay}
+        time.sleep(delay)
+        delay = min(delay * 2, RAG_WARMUP_RETRY_MAX_DELAY)
+
+
+@app.on_event("startup")
+def start_rag_warm_up():
+    global warmup_status
+    if RAG_WARMUP:
+        warmup_status = {"state": "pending"}
+        threading.Thread(target=warm_up_rag_until_ready, name="rag-warm-up", daemon=True).start()
+
 # Initialize OpenAI client
 openai_api_key = os.getenv("OPENAI_API_KEY")
 if not openai_api_key:
@@ -228,6 +286,16 @@ async def root():
     return {"message": "Assignment Analyzer API is running"}
 
 
+@app.get("/ready")
+async def ready():
+    """Readiness probe: 503 until the optional RAG warm-up has succeeded"""
+    is_ready = warmup_status["state"] in ("disabled", "ready")
+    return JSONResponse(
+        status_code=200 if is_ready else 503,
+        content={"ready": is_ready, "warmup": warmup_status},
+    )
+
+
 @app.post("/analyze-assignment")
 async def analyze_assignment_endpoint(file: UploadFile = File(...)):
     """
@@ -4,16 +4,30 @@ from __future__ import annotations
 import io
 import json
 import re
+import threading
+import time
 import uuid
+from datetime import datetime, timezone
 from pathlib import Path
-from typing import Dict, List, Optional
+from typing import TYPE_CHECKING, Dict, List, Optional, Tuple, Union
 
-import PyPDF2
 from fastapi import HTTPException
-from openai import OpenAI
 
 from ..config import settings
-from .rag import TextbookRAG, load_quiz_from_pdf
+from .routing import ModelRouter, ModelTier, estimate_tokens, parse_tiers
+
+# The OpenAI SDK, PyPDF2 and the LangChain/Chroma stack behind ``.rag`` take
+# around a second to import, so they are imported on first use; auth-only
+# workers never pay for them (see ``app.import_budget``).
+if TYPE_CHECKING:
+    from openai import OpenAI
+
+    from .quiz_corpus import QuizCorpus
+    from .quiz_index import QuizTopicIndex
+    from .rag import TextbookRAG
+    from .shards import ShardedRAG
+
+    RAGService = Union[TextbookRAG, ShardedRAG]
 
 
 class AssignmentAIService:
@@ -21,8 +35,14 @@ class AssignmentAIService:
 
     def __init__(self) -> None:
         self._client: Optional[OpenAI] = None
-        self._rag: Optional[TextbookRAG] = None
-        self._quiz_texts: Optional[List[str]] = None
+        self._rag: Optional[RAGService] = None
+        # Keyed by subject (``None`` without per-subject shards).
+        self._quiz_corpora: Dict[Optional[str], QuizCorpus] = {}
+        self._quiz_index: Dict[Optional[str], QuizTopicIndex] = {}
+        self._rag_lock = threading.Lock()
+        self.model_router = self._create_model_router()
+        # "disabled" (lazy start-up), "pending", "warming", "ready" or "failed".
+        self.warmup_status: Dict = {"state": "disabled"}
 
     # ------------------------------------------------------------------
     # OpenAI helpers
@@ -34,10 +54,26 @@ class AssignmentAIService:
                     status_code=500,
                     detail="OPENAI_API_KEY is not configured on the server.",
                 )
+            from openai import OpenAI
+
             self._client = OpenAI(api_key=settings.OPENAI_API_KEY)
         return self._client
 
-    def analyze_assignment(self, pdf_text: str) -> Dict:
+    @staticmethod
+    def _create_model_router() -> ModelRouter:
+        """Router over ``OPENAI_MODEL_TIERS``; a malformed value is reported and
+        ``OPENAI_MODEL`` serves every analysis, so the workers still start."""
+        try:
+            return ModelRouter(parse_tiers(settings.OPENAI_MODEL_TIERS, settings.OPENAI_MODEL))
+        except ValueError as exc:
+            error = f"Ignoring OPENAI_MODEL_TIERS: {exc}"
+            print(f"{error} Using {settings.OPENAI_MODEL} for every analysis.")
+            return ModelRouter([ModelTier(model=settings.OPENAI_MODEL)], config_error=error)
+
+    def analyze_assignment(self, pdf_text: str, *, detail: str = "standard") -> Dict:
+        """Structured analysis of an assignment from the model tier picked by
+        ``model_router``; a reply that is not valid JSON is retried on the next
+        larger tier. Raises ``ValueError`` for an unknown ``detail``."""
         client = self._ensure_client()
         prompt = (
             "Please analyze the following assignment document and extract key information.\n"
@@ -50,18 +86,39 @@ class AssignmentAIService:
             f"Assignment content:\n{pdf_text}\n\n"
             "Respond with valid JSON only."
         )
-        try:
-            response = client.chat.completions.create(
-                model=settings.OPENAI_MODEL,
-                temperature=0,
-                messages=[{"role": "user", "content": prompt}],
-            )
-        except Exception as exc:  # pragma: no cover - network/SDK errors
-            raise HTTPException(status_code=502, detail=f"OpenAI error: {exc}") from exc
-
-        content = response.choices[0].message.content or ""
-        data = self._coerce_json_response(content)
-        return data
+        router = self.model_router
+        position = router.route(estimate_tokens(prompt), detail)
+        while True:
+            started = time.perf_counter()
+            try:
+                response = client.chat.completions.create(
+                    model=router.tiers[position].model,
+                    temperature=0,
+                    messages=[{"role": "user", "content": prompt}],
+                )
+            except Exception as exc:  # pragma: no cover - network/SDK errors
+                latency_ms = (time.perf_counter() - started) * 1000
+                router.record(position, latency_ms=latency_ms, error=True)
+                raise HTTPException(status_code=502, detail=f"OpenAI error: {exc}") from exc
+            latency_ms = (time.perf_counter() - started) * 1000
+            usage = {
+                "prompt_tokens": getattr(response.usage, "prompt_tokens", None) or 0,
+                "completion_tokens": getattr(response.usage, "completion_tokens", None) or 0,
+            }
+            content = response.choices[0].message.content or ""
+            try:
+                data = self._coerce_json_response(content)
+            except HTTPException:
+                fall_back = position + 1 < len(router.tiers)
+                router.record(
+                    position, latency_ms=latency_ms, valid_json=False, fell_back=fall_back, **usage
+                )
+                if not fall_back:
+                    raise
+                position += 1
+                continue
+            router.record(position, latency_ms=latency_ms, **usage)
+            return data
 
     def _coerce_json_response(self, content: str) -> Dict:
         payload = content.strip()
@@ -83,6 +140,8 @@ class AssignmentAIService:
     # ------------------------------------------------------------------
     @staticmethod
     def extract_text_from_pdf(pdf_bytes: bytes) -> str:
+        import PyPDF2
+
         try:
             pdf_reader = PyPDF2.PdfReader(io.BytesIO(pdf_bytes))
             text = ""
@@ -154,42 +213,194 @@ class AssignmentAIService:
     # ------------------------------------------------------------------
     # RAG helpers
     # ------------------------------------------------------------------
-    def _ensure_rag(self) -> TextbookRAG:
-        if self._rag is None:
-            self._rag = TextbookRAG(
-                textbook_dir=settings.RAG_TEXTBOOK_DIR,
-                persist_directory=settings.RAG_PERSIST_DIR,
-                openai_api_key=settings.OPENAI_API_KEY or None,
-            )
+    def _ensure_rag(self) -> RAGService:
+        with self._rag_lock:
+            if self._rag is None:
+                self._rag = self._create_rag()
         return self._rag
 
-    def _load_default_quiz_texts(self) -> List[str]:
-        if self._quiz_texts is not None:
-            return self._quiz_texts
-        quiz_dir = Path(settings.RAG_QUIZ_DIR)
-        texts: List[str] = []
-        if quiz_dir.exists():
-            for pdf_path in sorted(quiz_dir.glob("*.pdf")):
-                name = pdf_path.name.lower()
-                if "textbook" in name:
-                    continue
-                text = load_quiz_from_pdf(pdf_path)
-                if text.strip():
-                    texts.append(text)
-        self._quiz_texts = texts
-        return texts
+    @staticmethod
+    def _rag_options() -> Dict:
+        return dict(
+            textbook_dir=settings.RAG_TEXTBOOK_DIR,
+            persist_directory=settings.RAG_PERSIST_DIR,
+            openai_api_key=settings.OPENAI_API_KEY or None,
+            index_backend=settings.RAG_INDEX_BACKEND,
+            index_dtype=settings.RAG_INDEX_DTYPE,
+            rescore_candidates=settings.RAG_INDEX_RESCORE,
+            reload_interval=settings.RAG_RELOAD_INTERVAL,
+            search_mode=settings.RAG_SEARCH_MODE,
+            embedding_cache_size=settings.RAG_EMBEDDING_CACHE_SIZE,
+            result_cache_size=settings.RAG_RESULT_CACHE_SIZE,
+            query_window_chars=settings.RAG_QUERY_WINDOW_CHARS,
+            query_max_windows=settings.RAG_QUERY_MAX_WINDOWS,
+            long_query_aggregate=settings.RAG_LONG_QUERY_AGGREGATE,
+            max_distance=settings.RAG_MAX_DISTANCE,
+            coverage_max_distance=settings.RAG_COVERAGE_MAX_DISTANCE,
+            answer_cache_size=settings.RAG_ANSWER_CACHE_SIZE,
+            answer_cache_threshold=settings.RAG_ANSWER_CACHE_THRESHOLD,
+            answer_cache_ttl=settings.RAG_ANSWER_CACHE_TTL,
+            context_tokens=settings.RAG_CONTEXT_TOKENS,
+            context_candidates=settings.RAG_CONTEXT_CANDIDATES,
+            dedup_threshold=settings.RAG_DEDUP_THRESHOLD,
+            chunker=settings.RAG_CHUNKER,
+            hnsw_space=settings.RAG_HNSW_SPACE,
+            hnsw_m=settings.RAG_HNSW_M,
+            hnsw_construction_ef=settings.RAG_HNSW_CONSTRUCTION_EF,
+            hnsw_search_ef=settings.RAG_HNSW_SEARCH_EF,
+            snapshot_path=settings.RAG_SNAPSHOT_PATH or None,
+            task_context_size=settings.RAG_TASK_CONTEXT_SIZE,
+            task_context_max_distance=settings.RAG_TASK_CONTEXT_MAX_DISTANCE,
+            digest_fast_path=settings.RAG_DIGEST_FAST_PATH,
+        )
+
+    @classmethod
+    def _create_rag(cls) -> RAGService:
+        options = cls._rag_options()
+        if settings.RAG_SHARD_BY_SUBJECT:
+            from .shards import ShardedRAG
+
+            return ShardedRAG(
+                max_routed=settings.RAG_SHARD_MAX_ROUTED,
+                route_margin=settings.RAG_SHARD_ROUTE_MARGIN,
+                **options,
+            )
+        from .rag import TextbookRAG
+
+        return TextbookRAG(**options)
+
+    @staticmethod
+    def _subject_targets(rag: RAGService) -> List[Tuple[Optional[str], TextbookRAG]]:
+        """``(subject, index)`` for every shard; ``[(None, rag)]`` without sharding."""
+        if settings.RAG_SHARD_BY_SUBJECT:
+            return [(subject, rag.shard(subject)) for subject in rag.subjects]
+        return [(None, rag)]
+
+    def _quiz_corpus(self, rag: TextbookRAG, subject: Optional[str] = None) -> QuizCorpus:
+        """Quiz PDFs of ``RAG_QUIZ_DIR`` (its ``subject`` subdirectory when sharded),
+        rescanned every ``RAG_QUIZ_SCAN_INTERVAL`` seconds."""
+        corpus = self._quiz_corpora.get(subject)
+        if corpus is None:
+            from .quiz_corpus import QuizCorpus
+            from .rag import load_quiz_from_pdf
+            from .versions import QUIZ_CORPUS_DIR
+
+            quiz_dir = Path(settings.RAG_QUIZ_DIR)
+            if subject is not None:
+                quiz_dir = quiz_dir / subject
+            corpus = QuizCorpus(
+                directory=quiz_dir,
+                store_directory=rag.persist_directory / QUIZ_CORPUS_DIR,
+                load_text=load_quiz_from_pdf,
+                split=rag.text_splitter.split_text,
+                embed=rag.embeddings.embed_documents,
+                embedding_key=f"{rag._embedding_model()}/{rag.chunker}",
+                scan_interval=settings.RAG_QUIZ_SCAN_INTERVAL,
+            )
+            self._quiz_corpora[subject] = corpus
+        corpus.refresh()
+        return corpus
+
+    def _load_default_quiz_texts(
+        self, rag: TextbookRAG, subject: Optional[str] = None
+    ) -> List[str]:
+        return [text for _, text in self._quiz_corpus(rag, subject).texts()]
+
+    def _ensure_quiz_index(
+        self, rag: TextbookRAG, subject: Optional[str] = None
+    ) -> Optional[QuizTopicIndex]:
+        """Quiz-topic index for the default quiz corpus and the active textbook index.
+
+        Rebuilt when the textbook index version or the quiz files change; a quiz
+        file change only re-embeds and re-searches the added or changed files.
+        """
+        corpus = self._quiz_corpus(rag, subject)
+        if not corpus.files:
+            return None
+        fingerprint = corpus.fingerprint
+        rag._ensure_index()
+        cached = self._quiz_index.get(subject)
+        if cached and cached.version == rag.version and cached.fingerprint == fingerprint:
+            return cached
+        quiz_index = rag.load_quiz_topic_index(fingerprint)
+        if quiz_index is None:
+            quizzes = corpus.embedded()
+            quiz_index = rag.build_quiz_topic_index(
+                [(quiz.name, quiz.text) for quiz in quizzes],
+                fingerprint=fingerprint,
+                vectors=[quiz.vectors for quiz in quizzes],
+                stamps=[quiz.stamp for quiz in quizzes],
+            )
+        self._quiz_index[subject] = quiz_index
+        return quiz_index
 
     def check_high_occurrence(
-        self, assignment_text: str, quiz_texts: Optional[List[str]] = None
+        self,
+        assignment_text: str,
+        quiz_texts: Optional[List[str]] = None,
+        *,
+        subject: Optional[str] = None,
     ) -> Optional[Dict]:
         if not assignment_text.strip():
             return None
         rag = self._ensure_rag()
-        texts = quiz_texts if quiz_texts is not None else self._load_default_quiz_texts()
-        texts = texts or None
+        if not settings.RAG_SHARD_BY_SUBJECT:
+            return self._check_high_occurrence(rag, None, assignment_text, quiz_texts)
+        # Compare against the most likely subject's textbooks and quizzes.
+        subject = rag.route(assignment_text, subject=subject)[0]
+        report = self._check_high_occurrence(
+            rag.shard(subject), subject, assignment_text, quiz_texts
+        )
+        return {**report, "subject": subject}
+
+    def _check_high_occurrence(
+        self,
+        rag: TextbookRAG,
+        subject: Optional[str],
+        assignment_text: str,
+        quiz_texts: Optional[List[str]],
+    ) -> Dict:
+        if quiz_texts is None:
+            quiz_index = self._ensure_quiz_index(rag, subject)
+            if quiz_index is not None:
+                return rag.check_high_occurrence_in_tests(
+                    assignment_text, quiz_index=quiz_index
+                )
+        if quiz_texts is None:
+            quiz_texts = self._load_default_quiz_texts(rag, subject)
+        texts = quiz_texts or None
         return rag.check_high_occurrence_in_tests(
             assignment_text,
             quiz_texts=texts,
+            quiz_search_mode=settings.RAG_QUIZ_SEARCH_MODE,
+        )
+
+    def remember_task(self, task_id: str, rag_report: Optional[Dict]) -> bool:
+        """Keep the textbook sections found for ``task_id`` hot for follow-up questions.
+
+        ``rag_report`` is the task's :meth:`check_high_occurrence` result; reports
+        without an index version (written before task contexts) are ignored.
+        """
+        if not rag_report or not rag_report.get("version"):
+            return False
+        coverage = rag_report.get("textbook_coverage") or {}
+        rows = coverage.get("chunk_ids") or [
+            section.get("chunk_id") for section in coverage.get("relevant_sections") or []
+        ]
+        rows = [row for row in rows if isinstance(row, int)]
+        if not rows:
+            return False
+        rag = self._ensure_rag()
+        if settings.RAG_SHARD_BY_SUBJECT:
+            if rag_report.get("subject") not in rag.shards:
+                return False
+            rag = rag.shard(rag_report["subject"])
+        return rag.remember_task(task_id, rows, version=rag_report["version"])
+
+    def has_task_context(self, task_id: str) -> bool:
+        return any(
+            index.has_task_context(task_id)
+            for _, index in self._subject_targets(self._ensure_rag())
         )
 
     def compose_ai_comment(self, analysis: Dict, rag_report: Optional[Dict]) -> str:
@@ -225,6 +436,63 @@ class AssignmentAIService:
                 parts.append("☑ Frequently appears in quizzes/exams. Prioritize review.")
         return " \n".join(parts).strip()
 
+    # ------------------------------------------------------------------
+    # Start-up warm-up / readiness
+    # ------------------------------------------------------------------
+    @property
+    def is_ready(self) -> bool:
+        return self.warmup_status["state"] in ("disabled", "ready")
+
+    def start_warm_up(self) -> threading.Thread:
+        """Run :meth:`warm_up` in a daemon thread; not ready until it succeeds."""
+        self.warmup_status = {"state": "pending"}
+        thread = threading.Thread(
+            target=self._warm_up_until_ready, name="rag-warm-up", daemon=True
+        )
+        thread.start()
+        return thread
+
+    def _warm_up_until_ready(self) -> None:
+        """:meth:`warm_up`, retried with exponential backoff until it succeeds,
+        so a worker that started before the index was reachable becomes ready."""
+        delay = settings.RAG_WARMUP_RETRY_DELAY
+        while self.warm_up()["state"] == "failed":
+            self.warmup_status = {**self.warmup_status, "retry_in": delay}
+            time.sleep(delay)
+            delay = min(delay * 2, settings.RAG_WARMUP_RETRY_MAX_DELAY)
+
+    def warm_up(self) -> Dict:
+        """Load the textbook index, QA chain and quiz-topic index before the first request."""
+        self.warmup_status = {
+            "state": "warming",
+            "attempts": self.warmup_status.get("attempts", 0) + 1,
+            "started_at": datetime.now(timezone.utc).isoformat(),
+        }
+        try:
+            rag = self._ensure_rag()
+            report = rag.warm_up(settings.RAG_WARMUP_QUERY)
+            quiz_indexes = [
+                self._ensure_quiz_index(index, subject)
+                for subject, index in self._subject_targets(rag)
+            ]
+        except Exception as exc:
+            self.warmup_status = {
+                **self.warmup_status,
+                "state": "failed",
+                "error": str(exc),
+                "finished_at": datetime.now(timezone.utc).isoformat(),
+            }
+            print(f"RAG warm-up failed: {exc}")
+            return self.warmup_status
+        self.warmup_status = {
+            **self.warmup_status,
+            **report,
+            "quiz_index": any(quiz_index is not None for quiz_index in quiz_indexes),
+            "state": "ready",
+            "finished_at": datetime.now(timezone.utc).isoformat(),
+        }
+        return self.warmup_status
+
     # ------------------------------------------------------------------
     # Convenience helpers
     # ------------------------------------------------------------------
@@ -232,7 +500,7 @@ class AssignmentAIService:
     def generate_task_id(value: Optional[str] = None) -> str:
         return value or str(uuid.uuid4())
 
-    def get_rag(self) -> TextbookRAG:
+    def get_rag(self) -> RAGService:
         return self._ensure_rag()
 
 
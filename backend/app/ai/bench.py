@@ -0,0 +1,295 @@
+"""Offline RAG index benchmarks.
+
+Run from ``backend/`` with ``python -m app.ai.bench <benchmark> [options]``. Corpus
+chunks are embedded once with the configured OpenAI embeddings; query vectors are
+perturbed chunk embeddings so no extra provider calls are needed while timing.
+"""
+from __future__ import annotations
+
+import argparse
+import itertools
+import json
+import tempfile
+import time
+from pathlib import Path
+from typing import Callable, Dict, List, Sequence, Tuple
+
+import numpy as np
+
+from ..config import settings
+from .chunker import SpanChunker
+from .rag import TextbookRAG
+from .vector_index import STORAGE_DTYPES, NumpyVectorIndex, normalize_rows, top_k_indices
+
+
+def _make_rag() -> TextbookRAG:
+    return TextbookRAG(
+        textbook_dir=settings.RAG_TEXTBOOK_DIR,
+        persist_directory=settings.RAG_PERSIST_DIR,
+        openai_api_key=settings.OPENAI_API_KEY or None,
+        hnsw_space=settings.RAG_HNSW_SPACE,
+        hnsw_m=settings.RAG_HNSW_M,
+        hnsw_construction_ef=settings.RAG_HNSW_CONSTRUCTION_EF,
+        hnsw_search_ef=settings.RAG_HNSW_SEARCH_EF,
+    )
+
+
+def _load_corpus(rag: TextbookRAG, limit: int) -> Tuple[List[str], List[dict], np.ndarray]:
+    chunks = rag.text_splitter.split_documents(rag.load_textbooks())[:limit]
+    if not chunks:
+        raise SystemExit("No textbook chunks found; check RAG_TEXTBOOK_DIR.")
+    texts = [chunk.page_content for chunk in chunks]
+    vectors = normalize_rows(np.asarray(rag.embeddings.embed_documents(texts), dtype=np.float32))
+    return texts, [chunk.metadata for chunk in chunks], vectors
+
+
+def _make_queries(vectors: np.ndarray, count: int, *, noise: float = 0.05, seed: int = 0) -> np.ndarray:
+    rng = np.random.default_rng(seed)
+    rows = rng.choice(vectors.shape[0], size=min(count, vectors.shape[0]), replace=False)
+    queries = vectors[rows] + rng.normal(0.0, noise, size=(len(rows), vectors.shape[1]))
+    return normalize_rows(queries.astype(np.float32))
+
+
+def _exact_neighbours(vectors: np.ndarray, queries: np.ndarray, k: int) -> List[List[int]]:
+    scores = queries.astype(np.float64) @ vectors.astype(np.float64).T
+    return [top_k_indices(row, k).tolist() for row in scores]
+
+
+def _run(
+    search: Callable[[np.ndarray], Sequence[int]],
+    queries: np.ndarray,
+    truth: List[List[int]],
+) -> Dict[str, float]:
+    latencies: List[float] = []
+    hits = 0
+    for query, expected in zip(queries, truth):
+        start = time.perf_counter()
+        found = search(query)
+        latencies.append((time.perf_counter() - start) * 1000)
+        hits += len(set(found) & set(expected))
+    return {
+        "recall_at_k": hits / max(sum(len(expected) for expected in truth), 1),
+        "p50_ms": float(np.percentile(latencies, 50)),
+        "p99_ms": float(np.percentile(latencies, 99)),
+    }
+
+
+def _build_chroma(directory: Path, rag: TextbookRAG, texts, metadatas, vectors, **kwargs):
+    from langchain_community.vectorstores import Chroma
+
+    kwargs.setdefault("collection_metadata", rag.hnsw_metadata)
+    store = Chroma(
+        persist_directory=str(directory),
+        embedding_function=rag.embeddings,
+        **kwargs,
+    )
+    batch = 5000
+    for offset in range(0, len(texts), batch):
+        rows = range(offset, min(offset + batch, len(texts)))
+        store._collection.add(
+            ids=[str(row) for row in rows],
+            embeddings=vectors[offset : offset + len(rows)].tolist(),
+            documents=[texts[row] for row in rows],
+            metadatas=[
+                {key: value for key, value in metadatas[row].items() if value is not None}
+                for row in rows
+            ],
+        )
+    return store
+
+
+def _chroma_search(store, k: int) -> Callable[[np.ndarray], List[int]]:
+    def search(query: np.ndarray) -> List[int]:
+        result = store._collection.query(query_embeddings=[query.tolist()], n_results=k)
+        return [int(row) for row in result["ids"][0]]
+
+    return search
+
+
+def bench_backends(args: argparse.Namespace) -> Dict:
+    """Compare Chroma and the NumPy index for load time, recall@k and latency."""
+    rag = _make_rag()
+    texts, metadatas, vectors = _load_corpus(rag, args.limit)
+    queries = _make_queries(vectors, args.queries)
+    truth = _exact_neighbours(vectors, queries, args.k)
+
+    report: Dict = {"chunks": len(texts), "queries": len(queries), "k": args.k}
+    with tempfile.TemporaryDirectory() as tmp:
+        chroma_dir = Path(tmp) / "chroma"
+        _build_chroma(chroma_dir, rag, texts, metadatas, vectors)
+        start = time.perf_counter()
+        chroma = rag._load_store(chroma_dir)
+        chroma._collection.count()
+        load_ms = (time.perf_counter() - start) * 1000
+        report["chroma"] = {"load_ms": load_ms, **_run(_chroma_search(chroma, args.k), queries, truth)}
+
+        numpy_dir = Path(tmp) / "numpy"
+        NumpyVectorIndex.from_embeddings(
+            texts, vectors, metadatas, directory=numpy_dir, embedding=rag.embeddings
+        )
+        start = time.perf_counter()
+        index = NumpyVectorIndex.load(numpy_dir, rag.embeddings)
+        load_ms = (time.perf_counter() - start) * 1000
+
+        def numpy_search(query: np.ndarray) -> List[int]:
+            return [row for row, _ in index.search_rows(query, args.k)]
+
+        report["numpy"] = {"load_ms": load_ms, **_run(numpy_search, queries, truth)}
+    return report
+
+
+def bench_quantization(args: argparse.Namespace) -> Dict:
+    """Memory footprint and recall@k of float32/float16/int8 storage, with and without rescoring."""
+    rag = _make_rag()
+    texts, metadatas, vectors = _load_corpus(rag, args.limit)
+    queries = _make_queries(vectors, args.queries)
+    truth = _exact_neighbours(vectors, queries, args.k)
+
+    report: Dict = {"chunks": len(texts), "queries": len(queries), "k": args.k}
+    with tempfile.TemporaryDirectory() as tmp:
+        for dtype in STORAGE_DTYPES:
+            for rescore in ((0,) if dtype == "float32" else (0, args.rescore)):
+                index = NumpyVectorIndex.from_embeddings(
+                    texts,
+                    vectors,
+                    metadatas,
+                    directory=Path(tmp) / dtype,
+                    embedding=rag.embeddings,
+                    dtype=dtype,
+                    rescore=rescore,
+                )
+
+                def search(query: np.ndarray) -> List[int]:
+                    return [row for row, _ in index.search_rows(query, args.k)]
+
+                name = dtype if not rescore else f"{dtype}+rescore{rescore}"
+                report[name] = {"index_bytes": index.nbytes, **_run(search, queries, truth)}
+    baseline = report["float32"]["index_bytes"]
+    for name, row in report.items():
+        if isinstance(row, dict):
+            row["memory_ratio"] = row["index_bytes"] / baseline
+    return report
+
+
+def _int_list(value: str) -> List[int]:
+    return [int(item) for item in value.split(",") if item.strip()]
+
+
+def bench_hnsw(args: argparse.Namespace) -> Dict:
+    """Recall@k and latency of Chroma's HNSW index over a grid of graph parameters.
+
+    Search ef is fixed when a collection is created, so every grid point is a
+    separate build from the same vectors; ``build_ms`` is its insertion time.
+    """
+    rag = _make_rag()
+    texts, metadatas, vectors = _load_corpus(rag, args.limit)
+    queries = _make_queries(vectors, args.queries)
+    truth = _exact_neighbours(vectors, queries, args.k)
+
+    grid = itertools.product(
+        args.hnsw_space.split(","),
+        _int_list(args.hnsw_m),
+        _int_list(args.construction_ef),
+        _int_list(args.search_ef),
+    )
+    rows: List[Dict] = []
+    with tempfile.TemporaryDirectory() as tmp:
+        for point, (space, m, construction_ef, search_ef) in enumerate(grid):
+            metadata = {
+                "hnsw:space": space,
+                "hnsw:M": m,
+                "hnsw:construction_ef": construction_ef,
+                "hnsw:search_ef": search_ef,
+            }
+            start = time.perf_counter()
+            store = _build_chroma(
+                Path(tmp) / str(point),
+                rag,
+                texts,
+                metadatas,
+                vectors,
+                collection_metadata=metadata,
+            )
+            build_ms = (time.perf_counter() - start) * 1000
+            rows.append(
+                {
+                    **metadata,
+                    "build_ms": build_ms,
+                    **_run(_chroma_search(store, args.k), queries, truth),
+                }
+            )
+    rows.sort(key=lambda row: (-row["recall_at_k"], row["p50_ms"]))
+    return {
+        "chunks": len(texts),
+        "queries": len(queries),
+        "k": args.k,
+        "configured": rag.hnsw_metadata,
+        "grid": rows,
+    }
+
+
+def bench_chunker(args: argparse.Namespace) -> Dict:
+    """Time the span chunker against LangChain's splitter and check the chunks are identical."""
+    from langchain.text_splitter import RecursiveCharacterTextSplitter
+
+    pages = _make_rag().load_textbooks()
+    if not pages:
+        raise SystemExit("No textbook pages found; check RAG_TEXTBOOK_DIR.")
+    splitters = {
+        "langchain": RecursiveCharacterTextSplitter(
+            chunk_size=512, chunk_overlap=50, length_function=len
+        ),
+        "span": SpanChunker(chunk_size=512, chunk_overlap=50),
+        "span_sentences": SpanChunker(chunk_size=512, chunk_overlap=50, sentences=True),
+    }
+    report: Dict = {"pages": len(pages), "chars": sum(len(page.page_content) for page in pages)}
+    outputs = {}
+    for name, splitter in splitters.items():
+        timings = []
+        for _ in range(args.repeat):
+            start = time.perf_counter()
+            outputs[name] = splitter.split_documents(pages)
+            timings.append((time.perf_counter() - start) * 1000)
+        report[name] = {"chunks": len(outputs[name]), "best_ms": min(timings)}
+    baseline_ms = report["langchain"]["best_ms"]
+    report["span"]["speedup"] = baseline_ms / max(report["span"]["best_ms"], 1e-9)
+
+    def key(doc):
+        return doc.page_content, doc.metadata.get("source"), doc.metadata.get("page")
+
+    expected = [key(doc) for doc in outputs["langchain"]]
+    report["identical"] = expected == [key(doc) for doc in outputs["span"]]
+    if not report["identical"]:
+        report["first_mismatch"] = next(
+            (row for row, (a, b) in enumerate(zip(expected, map(key, outputs["span"]))) if a != b),
+            min(len(expected), len(outputs["span"])),
+        )
+    return report
+
+
+BENCHMARKS = {
+    "backends": bench_backends,
+    "chunker": bench_chunker,
+    "hnsw": bench_hnsw,
+    "quantization": bench_quantization,
+}
+
+
+def main(argv: Sequence[str] | None = None) -> None:
+    parser = argparse.ArgumentParser(prog="python -m app.ai.bench")
+    parser.add_argument("benchmark", choices=sorted(BENCHMARKS))
+    parser.add_argument("--limit", type=int, default=20000, help="Max corpus chunks to index.")
+    parser.add_argument("--queries", type=int, default=200)
+    parser.add_argument("-k", type=int, default=10)
+    parser.add_argument("--rescore", type=int, default=50, help="Candidates rescored at float32.")
+    parser.add_argument("--repeat", type=int, default=5, help="Timing repetitions (chunker).")
+    parser.add_argument("--hnsw-space", default="l2,cosine", help="Distances to try (hnsw).")
+    parser.add_argument("--hnsw-m", default="8,16,32", help="Graph degrees to try (hnsw).")
+    parser.add_argument("--construction-ef", default="100,200", help="Build ef values (hnsw).")
+    parser.add_argument("--search-ef", default="10,50,100", help="Search ef values (hnsw).")
+    args = parser.parse_args(argv)
+    print(json.dumps(BENCHMARKS[args.benchmark](args), indent=2))
+
+
+if __name__ == "__main__":
+    main()
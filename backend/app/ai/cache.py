@@ -0,0 +1,193 @@
+"""Small in-process caches used by the RAG layer."""
+from __future__ import annotations
+
+import threading
+import time
+import unicodedata
+from collections import OrderedDict
+from typing import Any, Dict, Hashable, List, Optional, Sequence
+
+import numpy as np
+
+
+def normalize_query(text: str) -> str:
+    """Canonical cache key for query text.
+
+    Collapses whitespace and applies NFKC, but keeps case: chemistry symbols
+    such as "Co" and "CO" must not share an entry.
+    """
+    return " ".join(unicodedata.normalize("NFKC", text).split())
+
+
+class LRUCache:
+    """Thread-safe bounded LRU mapping with hit/miss counters."""
+
+    def __init__(self, maxsize: int) -> None:
+        self.maxsize = maxsize
+        self._data: "OrderedDict[Hashable, Any]" = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, key: Hashable) -> Optional[Any]:
+        with self._lock:
+            if key in self._data:
+                self._data.move_to_end(key)
+                self.hits += 1
+                return self._data[key]
+            self.misses += 1
+            return None
+
+    def put(self, key: Hashable, value: Any) -> None:
+        if self.maxsize <= 0:
+            return
+        with self._lock:
+            self._data[key] = value
+            self._data.move_to_end(key)
+            while len(self._data) > self.maxsize:
+                self._data.popitem(last=False)
+
+    def clear(self) -> None:
+        with self._lock:
+            self._data.clear()
+
+    def __len__(self) -> int:
+        return len(self._data)
+
+    def stats(self) -> Dict[str, Any]:
+        lookups = self.hits + self.misses
+        return {
+            "size": len(self._data),
+            "maxsize": self.maxsize,
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": self.hits / lookups if lookups else 0.0,
+        }
+
+
+class SemanticCache:
+    """Bounded cache of values keyed by embedding, matched by cosine similarity.
+
+    A lookup hits when an unexpired entry of the same scope (index version) has
+    similarity >= ``threshold`` to the query vector. Keys live in one
+    preallocated matrix, so a lookup is a single matrix-vector product. When
+    full, the least recently used entry is replaced. A scope is forgotten once
+    its last entry is evicted or expires, so per-task scopes do not accumulate.
+    """
+
+    def __init__(self, maxsize: int, *, threshold: float = 0.95, ttl: float = 3600.0) -> None:
+        self.maxsize = maxsize
+        self.threshold = threshold
+        self.ttl = ttl
+        self._lock = threading.Lock()
+        self._keys: Optional[np.ndarray] = None
+        self._scope_ids: Dict[Hashable, int] = {}
+        self._next_scope_id = 0
+        self._scopes = np.full(maxsize, -1, dtype=np.int64)
+        self._values: List[Any] = [None] * maxsize
+        self._expires = np.zeros(maxsize, dtype=np.float64)
+        self._used = np.zeros(maxsize, dtype=np.float64)
+        self.hits = 0
+        self.misses = 0
+        self.expired = 0
+        self.evictions = 0
+
+    @staticmethod
+    def _unit(vector: Sequence[float]) -> np.ndarray:
+        vector = np.asarray(vector, dtype=np.float32)
+        norm = float(np.linalg.norm(vector))
+        return vector / norm if norm else vector
+
+    def _live(self, now: float) -> np.ndarray:
+        return self._expires > now
+
+    def _vacate(self, slots: np.ndarray) -> None:
+        """Empty ``slots`` and forget the scopes left without entries."""
+        scope_ids = set(self._scopes[slots].tolist()) - {-1}
+        self._expires[slots] = 0.0
+        self._scopes[slots] = -1
+        for slot in slots:
+            self._values[slot] = None
+        gone = scope_ids - set(self._scopes.tolist())
+        if gone:
+            self._scope_ids = {
+                scope: scope_id
+                for scope, scope_id in self._scope_ids.items()
+                if scope_id not in gone
+            }
+
+    def get(self, scope: Hashable, vector: Sequence[float]) -> Optional[Any]:
+        now = time.monotonic()
+        with self._lock:
+            scope_id = self._scope_ids.get(scope)
+            if self._keys is None or scope_id is None:
+                self.misses += 1
+                return None
+            expired = np.flatnonzero((self._expires > 0) & ~self._live(now))
+            if len(expired):
+                self.expired += len(expired)
+                self._vacate(expired)
+                if scope not in self._scope_ids:
+                    self.misses += 1
+                    return None
+            candidates = np.flatnonzero(self._live(now) & (self._scopes == scope_id))
+            if len(candidates):
+                scores = self._keys[candidates] @ self._unit(vector)
+                best = int(np.argmax(scores))
+                if scores[best] >= self.threshold:
+                    slot = candidates[best]
+                    self._used[slot] = now
+                    self.hits += 1
+                    return self._values[slot]
+            self.misses += 1
+            return None
+
+    def put(self, scope: Hashable, vector: Sequence[float], value: Any) -> None:
+        if self.maxsize <= 0:
+            return
+        now = time.monotonic()
+        key = self._unit(vector)
+        with self._lock:
+            if self._keys is None or self._keys.shape[1] != key.shape[0]:
+                self._keys = np.zeros((self.maxsize, key.shape[0]), dtype=np.float32)
+                self._expires[:] = 0.0
+            free = np.flatnonzero(~self._live(now))
+            if len(free):
+                slot = int(free[0])
+            else:
+                slot = int(np.argmin(self._used))
+                self.evictions += 1
+            self._vacate(np.array([slot]))
+            if scope not in self._scope_ids:
+                self._scope_ids[scope] = self._next_scope_id
+                self._next_scope_id += 1
+            self._keys[slot] = key
+            self._scopes[slot] = self._scope_ids[scope]
+            self._values[slot] = value
+            self._expires[slot] = now + self.ttl
+            self._used[slot] = now
+
+    def clear(self) -> None:
+        with self._lock:
+            self._expires[:] = 0.0
+            self._scopes[:] = -1
+            self._scope_ids.clear()
+            self._next_scope_id = 0
+            self._values = [None] * self.maxsize
+
+    def __len__(self) -> int:
+        return int(self._live(time.monotonic()).sum())
+
+    def stats(self) -> Dict[str, Any]:
+        lookups = self.hits + self.misses
+        return {
+            "size": len(self),
+            "maxsize": self.maxsize,
+            "threshold": self.threshold,
+            "ttl": self.ttl,
+            "hits": self.hits,
+            "misses": self.misses,
+            "expired": self.expired,
+            "evictions": self.evictions,
+            "hit_rate": self.hits / lookups if lookups else 0.0,
+        }
@@ -0,0 +1,167 @@
+"""Span-based recursive chunker for textbook pages.
+
+Produces the same chunks as LangChain's ``RecursiveCharacterTextSplitter`` with
+its default separators (``keep_separator=True``, ``strip_whitespace=True``,
+``len`` as length function), but works on ``(start, end)`` offsets into the page
+instead of copying substrings at every recursion level and merge step; only the
+final chunk text is sliced out. Optionally, sentence terminators are tried
+between line breaks and spaces, with the cut placed after the terminator.
+"""
+from __future__ import annotations
+
+import copy
+import re
+from collections import deque
+from typing import Any, Iterable, Iterator, List, NamedTuple, Optional, Sequence, Tuple
+
+from langchain_core.documents import Document
+
+DEFAULT_SEPARATORS: Tuple[str, ...] = ("\n\n", "\n", " ", "")
+SENTENCE_ENDINGS: Tuple[str, ...] = ("。", "！", "？", "；", ". ", "! ", "? ", "; ")
+
+Span = Tuple[int, int]
+
+
+class Chunk(NamedTuple):
+    source: Any
+    page: Any
+    start: int
+    end: int
+    text: str
+
+
+class _Level(NamedTuple):
+    pattern: Optional["re.Pattern[str]"]  # None: split into single characters
+    cut_after: bool  # sentence endings stay with the preceding piece
+
+
+class SpanChunker:
+    """Recursive character chunker yielding page offsets.
+
+    ``sentences=True`` inserts :data:`SENTENCE_ENDINGS` as one level between
+    ``"\\n"`` and ``" "``; the default reproduces LangChain's output exactly.
+    """
+
+    def __init__(
+        self, *, chunk_size: int = 512, chunk_overlap: int = 50, sentences: bool = False
+    ) -> None:
+        if chunk_overlap > chunk_size:
+            raise ValueError("chunk_overlap must not exceed chunk_size")
+        self.chunk_size = chunk_size
+        self.chunk_overlap = chunk_overlap
+        levels: List[Sequence[str]] = [("\n\n",), ("\n",)]
+        if sentences:
+            levels.append(SENTENCE_ENDINGS)
+        levels += [(" ",), ("",)]
+        self._levels = [
+            _Level(
+                pattern=(
+                    re.compile("|".join(map(re.escape, separators)))
+                    if separators != ("",)
+                    else None
+                ),
+                cut_after=separators is SENTENCE_ENDINGS,
+            )
+            for separators in levels
+        ]
+
+    # ------------------------------------------------------------------
+    # Spans
+    # ------------------------------------------------------------------
+    def _pieces(self, text: str, start: int, end: int, level: _Level) -> Iterator[Span]:
+        if level.pattern is None:
+            for position in range(start, end):
+                yield position, position + 1
+            return
+        previous = start
+        for match in level.pattern.finditer(text, start, end):
+            cut = match.end() if level.cut_after else match.start()
+            if cut > previous:
+                yield previous, cut
+                previous = cut
+        if end > previous:
+            yield previous, end
+
+    @staticmethod
+    def _strip(text: str, start: int, end: int) -> Optional[Span]:
+        while start < end and text[start].isspace():
+            start += 1
+        while end > start and text[end - 1].isspace():
+            end -= 1
+        return (start, end) if end > start else None
+
+    def _merge(self, text: str, pieces: List[Span]) -> Iterator[Span]:
+        # Pieces are contiguous, so a run of them is just (first start, last end).
+        current: "deque[Span]" = deque()
+        total = 0
+        for start, end in pieces:
+            length = end - start
+            if total + length > self.chunk_size and current:
+                span = self._strip(text, current[0][0], current[-1][1])
+                if span:
+                    yield span
+                while total > self.chunk_overlap or (
+                    total + length > self.chunk_size and total > 0
+                ):
+                    first_start, first_end = current.popleft()
+                    total -= first_end - first_start
+            current.append((start, end))
+            total += length
+        if current:
+            span = self._strip(text, current[0][0], current[-1][1])
+            if span:
+                yield span
+
+    def _spans(self, text: str, start: int, end: int, first_level: int) -> Iterator[Span]:
+        chosen = len(self._levels) - 1
+        for index in range(first_level, len(self._levels)):
+            pattern = self._levels[index].pattern
+            if pattern is None or pattern.search(text, start, end):
+                chosen = index
+                break
+        good: List[Span] = []
+        for piece_start, piece_end in self._pieces(text, start, end, self._levels[chosen]):
+            if piece_end - piece_start < self.chunk_size:
+                good.append((piece_start, piece_end))
+                continue
+            if good:
+                yield from self._merge(text, good)
+                good = []
+            if chosen == len(self._levels) - 1:
+                yield piece_start, piece_end
+            else:
+                yield from self._spans(text, piece_start, piece_end, chosen + 1)
+        if good:
+            yield from self._merge(text, good)
+
+    def split_spans(self, text: str) -> Iterator[Span]:
+        """Lazily yield ``(start, end)`` offsets of the chunks of ``text``."""
+        return self._spans(text, 0, len(text), 0)
+
+    # ------------------------------------------------------------------
+    # TextSplitter-compatible helpers
+    # ------------------------------------------------------------------
+    def split_text(self, text: str) -> List[str]:
+        return [text[start:end] for start, end in self.split_spans(text)]
+
+    def iter_chunks(self, documents: Iterable[Document]) -> Iterator[Chunk]:
+        """Lazily yield every chunk of every page with its source, page and offsets."""
+        for doc in documents:
+            text = doc.page_content
+            for start, end in self.split_spans(text):
+                metadata = doc.metadata
+                yield Chunk(
+                    metadata.get("source"), metadata.get("page"), start, end, text[start:end]
+                )
+
+    def split_documents(self, documents: Iterable[Document]) -> List[Document]:
+        """Like ``TextSplitter.split_documents``, adding ``start``/``end`` page offsets."""
+        chunks = []
+        for doc in documents:
+            text = doc.page_content
+            for start, end in self.split_spans(text):
+                metadata = copy.deepcopy(doc.metadata)
+                metadata["start"] = start
+                metadata["end"] = end
+                chunks.append(Document(page_content=text[start:end], metadata=metadata))
+        return chunks
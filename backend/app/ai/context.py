@@ -0,0 +1,149 @@
+"""Token-budgeted packing of retrieved chunks into the QA prompt context."""
+from __future__ import annotations
+
+from typing import Callable, List, Optional, Sequence, Tuple
+
+from langchain_core.callbacks import CallbackManagerForRetrieverRun
+from langchain_core.documents import Document
+from langchain_core.retrievers import BaseRetriever
+
+from .cache import normalize_query
+
+# Longest chunk overlap looked for when stitching adjacent chunks back together
+# (the ingestion splitter uses 50 characters).
+MAX_STITCH_CHARS = 200
+
+# A retrieved chunk and its cosine distance to the question (``None`` if unknown).
+Hit = Tuple[Document, Optional[float]]
+
+
+def _stitch(left: str, right: str) -> str:
+    """Join two consecutive chunks, dropping the text they share at the seam."""
+    for size in range(min(len(left), len(right), MAX_STITCH_CHARS), 0, -1):
+        if left.endswith(right[:size]):
+            return left + right[size:]
+    return left + "\n" + right
+
+
+class ContextPacker:
+    """Select and merge retrieved chunks to fit a prompt token budget.
+
+    Input hits are ``(document, cosine distance)`` pairs, nearest first. Hits
+    beyond ``max_distance`` are dropped (the nearest one is always kept) and
+    duplicates are skipped; the rest fill ``budget_tokens`` tiktoken tokens
+    greedily, and selected chunks that are consecutive on one page are merged.
+    """
+
+    def __init__(
+        self,
+        *,
+        budget_tokens: int = 1500,
+        max_distance: Optional[float] = None,
+        model: str = "gpt-4o-mini",
+    ) -> None:
+        self.budget_tokens = budget_tokens
+        self.max_distance = max_distance
+        self.model = model
+        self._encoding = None
+
+    @property
+    def encoding(self):
+        if self._encoding is None:
+            import tiktoken
+
+            try:
+                self._encoding = tiktoken.encoding_for_model(self.model)
+            except KeyError:
+                self._encoding = tiktoken.get_encoding("cl100k_base")
+        return self._encoding
+
+    def count_tokens(self, text: str) -> int:
+        return len(self.encoding.encode(text))
+
+    def _relevant(self, hits: Sequence[Hit]) -> List[Hit]:
+        kept: List[Hit] = []
+        keys: List[str] = []
+        for doc, distance in hits:
+            if kept and None not in (self.max_distance, distance) and distance > self.max_distance:
+                continue
+            # Skip chunks whose text is already (part of) a kept chunk.
+            key = normalize_query(doc.page_content).lower()
+            if any(key in other for other in keys):
+                continue
+            kept.append((doc, distance))
+            keys.append(key)
+        return kept
+
+    @staticmethod
+    def _merge_adjacent(hits: List[Hit]) -> List[Hit]:
+        """Merge runs of consecutive ``chunk_id`` on one page, ranked by their best member."""
+
+        def same_page(row: int, doc: Document) -> bool:
+            other = hits[position_of_row[row]][0].metadata if row in position_of_row else None
+            return other is not None and (other.get("source"), other.get("page")) == (
+                doc.metadata.get("source"),
+                doc.metadata.get("page"),
+            )
+
+        position_of_row = {
+            doc.metadata["chunk_id"]: position
+            for position, (doc, _) in enumerate(hits)
+            if doc.metadata.get("chunk_id") is not None
+        }
+        merged: List[Hit] = []
+        used = set()
+        for position, (doc, distance) in enumerate(hits):
+            if position in used:
+                continue
+            row = doc.metadata.get("chunk_id")
+            if row is None:
+                used.add(position)
+                merged.append((doc, distance))
+                continue
+            start = end = row
+            while same_page(start - 1, doc):
+                start -= 1
+            while same_page(end + 1, doc):
+                end += 1
+            run = [position_of_row[r] for r in range(start, end + 1)]
+            used.update(run)
+            if len(run) == 1:
+                merged.append((doc, distance))
+                continue
+            text = hits[run[0]][0].page_content
+            for other in run[1:]:
+                text = _stitch(text, hits[other][0].page_content)
+            metadata = {**hits[run[0]][0].metadata, "chunk_ids": list(range(start, end + 1))}
+            merged.append((Document(page_content=text, metadata=metadata), distance))
+        return merged
+
+    def pack(self, hits: Sequence[Hit]) -> List[Document]:
+        selected: List[Hit] = []
+        remaining = self.budget_tokens
+        for doc, distance in self._relevant(hits):
+            tokens = self.count_tokens(doc.page_content)
+            if tokens <= remaining:
+                selected.append((doc, distance))
+                remaining -= tokens
+            elif not selected:
+                # Even the best chunk is over budget: keep its leading part.
+                text = self.encoding.decode(self.encoding.encode(doc.page_content)[:remaining])
+                selected.append((Document(page_content=text, metadata=doc.metadata), distance))
+                break
+        # Merging only removes the overlap at seams, so the budget still holds.
+        return [doc for doc, _ in self._merge_adjacent(selected)]
+
+
+class PackedRetriever(BaseRetriever):
+    """Retriever that runs a scored search and packs the hits with a :class:`ContextPacker`."""
+
+    search: Callable[[str], List[Hit]]
+    packer: ContextPacker
+
+    class Config:
+        arbitrary_types_allowed = True
+
+    def _get_relevant_documents(
+        self, query: str, *, run_manager: CallbackManagerForRetrieverRun
+    ) -> List[Document]:
+        return self.packer.pack(self.search(query))
@@ -0,0 +1,144 @@
+"""Near-duplicate chunk detection (MinHash signatures + LSH banding) for ingestion."""
+from __future__ import annotations
+
+import json
+from pathlib import Path
+from typing import Dict, List, Sequence, Tuple
+
+import numpy as np
+from langchain_core.documents import Document
+
+from .cache import normalize_query
+
+PROVENANCE_FILE = "provenance.json"
+NUM_PERM = 128
+# 16 bands of 8 rows: pairs above ~0.7 Jaccard almost always share a bucket;
+# candidates are then confirmed against the requested threshold.
+LSH_BANDS = 16
+SHINGLE_CHARS = 5
+_HASH_BASE = np.uint64(1099511628211)
+
+
+def shingle_hashes(text: str, size: int = SHINGLE_CHARS) -> np.ndarray:
+    """64-bit rolling hashes of every ``size``-character window of the normalised text.
+
+    Character shingles work the same for English and CJK text.
+    """
+    codes = np.frombuffer(normalize_query(text).lower().encode("utf-32-le"), dtype=np.uint32)
+    codes = codes.astype(np.uint64)
+    if len(codes) == 0:
+        return np.zeros(1, dtype=np.uint64)
+    size = min(size, len(codes))
+    count = len(codes) - size + 1
+    hashes = np.zeros(count, dtype=np.uint64)
+    with np.errstate(over="ignore"):
+        for offset in range(size):
+            hashes = hashes * _HASH_BASE + codes[offset : offset + count]
+    return np.unique(hashes)
+
+
+class MinHasher:
+    """MinHash with ``num_perm`` multiply-shift hash functions."""
+
+    def __init__(self, num_perm: int = NUM_PERM, seed: int = 1) -> None:
+        rng = np.random.default_rng(seed)
+        self.a = rng.integers(1, 2**63, size=num_perm, dtype=np.uint64) | np.uint64(1)
+        self.b = rng.integers(0, 2**63, size=num_perm, dtype=np.uint64)
+
+    def signature(self, text: str) -> np.ndarray:
+        hashes = shingle_hashes(text)
+        with np.errstate(over="ignore"):
+            permuted = (self.a[:, None] * hashes[None, :] + self.b[:, None]) >> np.uint64(32)
+        return permuted.min(axis=1).astype(np.uint32)
+
+
+def near_duplicate_groups(
+    texts: Sequence[str], *, threshold: float, bands: int = LSH_BANDS, num_perm: int = NUM_PERM
+) -> List[List[int]]:
+    """Partition ``texts`` into groups whose estimated Jaccard similarity is >= ``threshold``.
+
+    Groups are in order of their first member, which is also the group's
+    representative; texts without a near duplicate form singleton groups.
+    """
+    hasher = MinHasher(num_perm)
+    signatures = np.stack([hasher.signature(text) for text in texts]) if texts else None
+    parent = list(range(len(texts)))
+
+    def find(position: int) -> int:
+        while parent[position] != position:
+            parent[position] = parent[parent[position]]
+            position = parent[position]
+        return position
+
+    rows_per_band = num_perm // bands
+    for band in range(bands):
+        buckets: Dict[bytes, List[int]] = {}
+        columns = slice(band * rows_per_band, (band + 1) * rows_per_band)
+        for position in range(len(texts)):
+            members = buckets.setdefault(signatures[position, columns].tobytes(), [])
+            for other in members:
+                if find(other) == find(position):
+                    break
+                if np.mean(signatures[other] == signatures[position]) >= threshold:
+                    low, high = sorted((find(other), find(position)))
+                    parent[high] = low
+                    break
+            members.append(position)
+
+    groups: Dict[int, List[int]] = {}
+    for position in range(len(texts)):
+        groups.setdefault(find(position), []).append(position)
+    return [groups[root] for root in sorted(groups)]
+
+
+def dedup_chunks(
+    chunks: Sequence[Document], *, threshold: float
+) -> Tuple[List[Document], Dict[int, List[Dict]], Dict]:
+    """Collapse near-duplicate chunks, keeping the first of each group.
+
+    Returns the kept chunks, the provenance of every kept chunk that absorbed
+    duplicates (new row -> other ``source``/``page`` locations) and a size report.
+    """
+    groups = near_duplicate_groups([chunk.page_content for chunk in chunks], threshold=threshold)
+    kept: List[Document] = []
+    provenance: Dict[int, List[Dict]] = {}
+    for group in groups:
+        representative = chunks[group[0]]
+        own = (representative.metadata.get("source"), representative.metadata.get("page"))
+        locations: List[Dict] = []
+        seen = {own}
+        for position in group[1:]:
+            metadata = chunks[position].metadata
+            location = (metadata.get("source"), metadata.get("page"))
+            if location not in seen:
+                seen.add(location)
+                locations.append({"source": location[0], "page": location[1]})
+        if len(group) > 1:
+            provenance[len(kept)] = locations
+        kept.append(representative)
+    report = {
+        "threshold": threshold,
+        "chunks_before": len(chunks),
+        "chunks_after": len(kept),
+        "removed": len(chunks) - len(kept),
+        "shrink_ratio": (len(chunks) - len(kept)) / len(chunks) if chunks else 0.0,
+    }
+    return kept, provenance, report
+
+
+def save_provenance(directory: str | Path, provenance: Dict[int, List[Dict]], report: Dict) -> None:
+    payload = {
+        "report": report,
+        "provenance": {str(row): locations for row, locations in provenance.items()},
+    }
+    (Path(directory) / PROVENANCE_FILE).write_text(json.dumps(payload), encoding="utf-8")
+
+
+def load_provenance(directory: str | Path) -> Tuple[Dict[int, List[Dict]], Dict]:
+    """``(provenance, report)`` for an index version; empty for versions built without dedup."""
+    path = Path(directory) / PROVENANCE_FILE
+    if not path.exists():
+        return {}, {}
+    payload = json.loads(path.read_text(encoding="utf-8"))
+    provenance = {int(row): locations for row, locations in payload["provenance"].items()}
+    return provenance, payload["report"]
@@ -0,0 +1,293 @@
+"""Precomputed chapter/section digests and the query fast path that serves them.
+
+``python -m app.ai.digests`` (run from ``backend/`` after a build) splits the
+textbooks into chapters and sections by their heading lines, has the QA model
+write a short summary and key-concept list for each, and stores them in
+``digests.json`` of the active index version. ``TextbookRAG.query`` then
+answers "summarize chapter 3" / "key concepts of section 2-1" style questions from the
+file without retrieval or an LLM call.
+"""
+from __future__ import annotations
+
+import json
+import re
+import sys
+import unicodedata
+from dataclasses import asdict, dataclass, field
+from pathlib import Path
+from typing import TYPE_CHECKING, Callable, Dict, List, Optional, Sequence, Tuple
+
+if TYPE_CHECKING:
+    from langchain_core.documents import Document
+
+DIGESTS_FILE = "digests.json"
+# Bumped whenever the stored digest fields change; older files are ignored.
+DIGESTS_FORMAT = 1
+# Section text beyond this many characters is not sent to the model.
+DIGEST_INPUT_CHARS = 12000
+DIGEST_PROMPT_TEMPLATE = (
+    "Summarize this textbook {kind} for a student, in the language of the text.\n"
+    'Reply with JSON: {{"summary": "<3-5 sentences>", '
+    '"key_concepts": ["<up to 8 short terms>"]}}\n\n'
+    "Title: {title}\n\n{text}"
+)
+
+_NUMBER = r"[0-9零一二兩三四五六七八九十百]+"
+_CN_DIGITS = {c: v for v, c in enumerate("零一二三四五六七八九")}
+_CN_DIGITS["兩"] = 2
+_CHAPTER_HEADING_RE = re.compile(
+    rf"^(?:第\s*({_NUMBER})\s*章|chapter\s+(\d+))\s*[:：.、]?\s*(.{{0,40}})$", re.IGNORECASE
+)
+_SECTION_HEADING_RE = re.compile(
+    rf"^(?:第\s*({_NUMBER})\s*節|(\d+)\s*[-.]\s*(\d+))\s*[:：.、]?\s*(.{{0,40}})$"
+)
+# Questions are matched after NFKC normalisation and lower-casing.
+_CHAPTER_REF_RE = re.compile(rf"第\s*({_NUMBER})\s*章|\bch(?:apter|\.)?\s*(\d+)")
+# "N-M" only names a section next to a section keyword ("section 2-1", "§2.1",
+# "2-1節"); bare "3.5" or "1-2" in a question is a decimal or a range.
+_SECTION_WORD = r"(?:\bsections?|\bsec\b\.?|§)"
+_NUMBERED_SECTION_REF_RE = re.compile(
+    rf"{_SECTION_WORD}\s*(\d+)\s*[-.]\s*(\d+)(?!\d|\.\d)"
+    r"|(?<![\d.])(\d+)\s*[-.]\s*(\d+)\s*節"
+)
+# A section of the chapter named elsewhere in the question.
+_SECTION_REF_RE = re.compile(
+    rf"第\s*({_NUMBER})\s*節|{_SECTION_WORD}\s*(\d+)(?!\d|\s*[-.]\s*\d)"
+)
+_CONCEPTS_RE = re.compile(
+    r"key (?:concept|idea|point|term)s?|main (?:concept|idea|point)s?|concepts|重點|關鍵|概念|核心"
+)
+_SUMMARY_RE = re.compile(
+    r"summar|overview|recap|outline|摘要|總結|概要|概述|大意|整理|講什麼|講了什麼"
+)
+# Specific questions that merely mention a chapter still go through retrieval.
+_SPECIFIC_RE = re.compile(r"\bwhy\b|\bhow\b|\bcalculate\b|為何|為什麼|如何|怎麼|計算")
+
+
+def parse_number(text: str) -> int:
+    """``"12"``, ``"十二"`` or ``"二十三"`` as an int."""
+    if text.isdigit():
+        return int(text)
+    total, current = 0, 0
+    for char in text:
+        if char == "百":
+            total, current = total + (current or 1) * 100, 0
+        elif char == "十":
+            total, current = total + (current or 1) * 10, 0
+        else:
+            current = _CN_DIGITS[char]
+    return total + current
+
+
+@dataclass
+class Digest:
+    """Summary and key concepts of one chapter (``section`` is ``None``) or section."""
+
+    source: str
+    chapter: int
+    section: Optional[int]
+    title: str
+    page_from: int
+    page_to: int
+    summary: str = ""
+    key_concepts: List[str] = field(default_factory=list)
+
+    @property
+    def heading(self) -> str:
+        if self.section is None:
+            label = f"Chapter {self.chapter}"
+        else:
+            label = f"{self.chapter}-{self.section}"
+        return f"{label} {self.title}".strip()
+
+
+def _heading(
+    line: str, chapter: Optional[int], section: int
+) -> Optional[Tuple[int, Optional[int], str]]:
+    """``(chapter, section, title)`` if ``line`` is a chapter or section heading.
+
+    ``chapter``/``section`` are the last heading's numbers: "3-2" only opens a
+    section inside chapter 3, and only one or two past the previous section.
+    """
+    match = _CHAPTER_HEADING_RE.match(line)
+    if match:
+        number = parse_number(match.group(1) or match.group(2))
+        return number, None, match.group(3).strip()
+    match = _SECTION_HEADING_RE.match(line)
+    # Require a worded title, so numbered answers and formulas are not taken for headings.
+    if not match or not re.search(r"[^\W\d_]", match.group(4)):
+        return None
+    if match.group(1):
+        number, subsection = chapter, parse_number(match.group(1))
+    else:
+        number, subsection = int(match.group(2)), int(match.group(3))
+    if number is None or (chapter is not None and number != chapter):
+        return None
+    if not section < subsection <= section + 2:
+        return None
+    return number, subsection, match.group(4).strip()
+
+
+def split_sections(pages: Sequence[Document]) -> List[Tuple[Digest, str]]:
+    """Chapters and sections of each source (without summaries) and their text.
+
+    A section runs from its heading line to the next heading; a chapter to the
+    next chapter heading. When a heading occurs twice (a table of contents and
+    the chapter itself) the later one is kept.
+    """
+    by_source: Dict[str, List[Document]] = {}
+    for page in pages:
+        by_source.setdefault(str(page.metadata.get("source", "unknown")), []).append(page)
+    found: List[Tuple[Digest, str]] = []
+    for source, docs in by_source.items():
+        lines: List[Tuple[int, str]] = []
+        headings: List[Tuple[Tuple[int, Optional[int], str], int]] = []
+        chapter: Optional[int] = None
+        section = 0
+        for doc in sorted(docs, key=lambda doc: doc.metadata.get("page", 0)):
+            page = doc.metadata.get("page", 0)
+            for line in unicodedata.normalize("NFKC", doc.page_content).splitlines():
+                line = line.strip()
+                heading = _heading(line, chapter, section) if line else None
+                if heading:
+                    chapter, section = heading[0], heading[1] or 0
+                    headings.append((heading, len(lines)))
+                lines.append((page, line))
+        last = {heading[:2]: position for position, (heading, _) in enumerate(headings)}
+        headings = [item for position, item in enumerate(headings) if last[item[0][:2]] == position]
+        for position, ((number, section, title), start) in enumerate(headings):
+            ends = [
+                other_start
+                for (_, other_section, _), other_start in headings[position + 1 :]
+                if section is not None or other_section is None
+            ]
+            span = lines[start : ends[0] if ends else len(lines)]
+            digest = Digest(
+                source=source,
+                chapter=number,
+                section=section,
+                title=title,
+                page_from=span[0][0],
+                page_to=span[-1][0],
+            )
+            found.append((digest, "\n".join(line for _, line in span if line)))
+    return found
+
+
+def summarize_sections(
+    sections: Sequence[Tuple[Digest, str]],
+    summarize: Callable[[Digest, str], Tuple[str, List[str]]],
+) -> Tuple[List[Digest], List[str]]:
+    """Fill in summaries; returns the digests and one error per failed section.
+
+    Sections are summarised from their text; chapters with sections from their
+    sections' summaries, other chapters from their text.
+    """
+    digests: List[Digest] = []
+    errors: List[str] = []
+    ordered = sorted(sections, key=lambda item: item[0].section is None)
+    for digest, text in ordered:
+        if digest.section is None:
+            parts = [
+                f"{done.heading}: {done.summary}"
+                for done in digests
+                if done.source == digest.source
+                and done.chapter == digest.chapter
+                and done.section is not None
+            ]
+            text = "\n".join(parts) or text
+        try:
+            digest.summary, digest.key_concepts = summarize(digest, text[:DIGEST_INPUT_CHARS])
+        except Exception as exc:
+            errors.append(f"{digest.source} {digest.heading}: {exc}")
+            continue
+        digests.append(digest)
+    digests.sort(key=lambda d: (d.source, d.chapter, d.section is not None, d.section or 0))
+    return digests, errors
+
+
+class DigestIndex:
+    """Stored digests plus the router deciding which questions they answer."""
+
+    def __init__(self, digests: Sequence[Digest]) -> None:
+        self.digests = list(digests)
+
+    def __len__(self) -> int:
+        return len(self.digests)
+
+    def save(self, directory: str | Path) -> None:
+        payload = {"format": DIGESTS_FORMAT, "digests": [asdict(d) for d in self.digests]}
+        (Path(directory) / DIGESTS_FILE).write_text(
+            json.dumps(payload, ensure_ascii=False), encoding="utf-8"
+        )
+
+    @classmethod
+    def load(cls, directory: str | Path) -> Optional["DigestIndex"]:
+        """The stored digests, or ``None`` when missing or in an older format."""
+        path = Path(directory) / DIGESTS_FILE
+        try:
+            payload = json.loads(path.read_text(encoding="utf-8"))
+        except (FileNotFoundError, json.JSONDecodeError):
+            return None
+        if payload.get("format") != DIGESTS_FORMAT:
+            return None
+        return cls([Digest(**item) for item in payload["digests"]])
+
+    def _by_reference(self, text: str) -> List[Digest]:
+        chapter_match = _CHAPTER_REF_RE.search(text)
+        numbered_match = _NUMBERED_SECTION_REF_RE.search(text)
+        section_match = _SECTION_REF_RE.search(text)
+        chapter = section = None
+        if chapter_match:
+            chapter = parse_number(chapter_match.group(1) or chapter_match.group(2))
+        if numbered_match:
+            chapter = int(numbered_match.group(1) or numbered_match.group(3))
+            section = int(numbered_match.group(2) or numbered_match.group(4))
+        elif section_match and chapter is not None:
+            section = parse_number(section_match.group(1) or section_match.group(2))
+        if chapter is None:
+            return []
+        return [d for d in self.digests if d.chapter == chapter and d.section == section]
+
+    def _by_title(self, text: str) -> List[Digest]:
+        named = [d for d in self.digests if len(d.title) >= 2 and d.title.lower() in text]
+        longest = max((len(d.title) for d in named), default=0)
+        return [d for d in named if len(d.title) == longest]
+
+    def match(self, question: str) -> Optional[Tuple[Digest, str]]:
+        """``(digest, "summary" | "concepts")`` when ``question`` asks for an
+        overview of exactly one known chapter or section, else ``None``."""
+        text = unicodedata.normalize("NFKC", question).lower()
+        if _SPECIFIC_RE.search(text):
+            return None
+        if _CONCEPTS_RE.search(text):
+            intent = "concepts"
+        elif _SUMMARY_RE.search(text):
+            intent = "summary"
+        else:
+            return None
+        candidates = self._by_reference(text) or self._by_title(text)
+        if len(candidates) != 1 or not candidates[0].summary:
+            return None
+        return candidates[0], intent
+
+
+def render(digest: Digest, intent: str) -> str:
+    concepts = "\n".join(f"- {concept}" for concept in digest.key_concepts)
+    if intent == "concepts" and concepts:
+        return f"{digest.heading}\n{concepts}"
+    return "\n\n".join(part for part in (digest.heading, digest.summary, concepts) if part)
+
+
+def main() -> int:
+    from .analysis import AssignmentAIService
+
+    rag = AssignmentAIService._create_rag()
+    rag.build_vectorstore()
+    report = rag.build_digests()
+    print(json.dumps(report, indent=2, ensure_ascii=False))
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,226 @@
+"""Local BM25 inverted index over the same chunks as the vector store."""
+from __future__ import annotations
+
+import json
+import re
+from pathlib import Path
+from typing import Dict, List, Optional, Sequence, Tuple
+
+import numpy as np
+
+from .vector_index import top_k_indices
+
+POSTINGS_FILE = "bm25.npz"
+VOCAB_FILE = "bm25_vocab.json"
+
+# CJK characters are indexed one by one; everything else by alphanumeric run,
+# which keeps formulas and reagent names such as "h2so4" or "kmno4" intact.
+_TOKEN_RE = re.compile(r"[\u3400-\u9fff]|[^\W_]+")
+
+# Function words that say nothing about a topic; ignored when measuring
+# assignment/quiz overlap (BM25 ranking keeps them, idf already discounts them).
+STOP_WORDS = frozenset(
+    """
+    a about above after again all also an and any are as at be because been before
+    being below between both but by can could did do does doing down during each
+    few for from further had has have having he her here hers him his how i if in
+    into is it its itself just me more most my no nor not now of off on once only
+    or other our out over own same she should so some such than that the their
+    them then there these they this those through to too under until up very was
+    we were what when where which while who whom why will with would you your
+    的 了 是 在 和 與 及 或 之 其 此 這 那 有 也 都 而 並 且 就 被 把 將 於 為 以 由 對 個 些 哪 何 下 列 中 上 一 不
+    """.split()
+)
+# Terms found in more than this share of chunks are treated as stop words too.
+MAX_TOPIC_DF = 0.5
+
+
+def tokenize(text: str) -> List[str]:
+    return _TOKEN_RE.findall(text.lower())
+
+
+def topic_tokens(text: str) -> set:
+    """Distinct non-stop-word tokens of ``text``."""
+    return set(tokenize(text)) - STOP_WORDS
+
+
+class BM25Index:
+    """Okapi BM25 over chunk rows, stored as CSR postings (term -> rows, tf).
+
+    Row numbers match the ``chunk_id`` metadata written at ingestion, so lexical
+    hits can be fused with dense hits and resolved through the vector store.
+    The transposed structure (row -> distinct term ids) is kept as well for
+    topic-overlap checks against a handful of chunks.
+    """
+
+    def __init__(
+        self,
+        *,
+        vocabulary: Dict[str, int],
+        indptr: np.ndarray,
+        rows: np.ndarray,
+        tfs: np.ndarray,
+        doc_lengths: np.ndarray,
+        doc_indptr: Optional[np.ndarray] = None,
+        doc_terms: Optional[np.ndarray] = None,
+        k1: float = 1.5,
+        b: float = 0.75,
+    ) -> None:
+        self.vocabulary = vocabulary
+        self.indptr = indptr
+        self.rows = rows
+        self.tfs = tfs
+        self.doc_lengths = doc_lengths
+        if doc_indptr is None or doc_terms is None:
+            # Indexes written before the row -> terms arrays were stored.
+            doc_indptr, doc_terms = self._transpose(indptr, rows, len(doc_lengths))
+        self.doc_indptr = doc_indptr
+        self.doc_terms = doc_terms
+        self.k1 = k1
+        self.b = b
+        doc_count = max(len(doc_lengths), 1)
+        doc_freq = np.diff(indptr).astype(np.float32)
+        self.idf = np.log(1.0 + (doc_count - doc_freq + 0.5) / (doc_freq + 0.5)).astype(np.float32)
+        average = float(doc_lengths.mean()) if len(doc_lengths) else 1.0
+        self._length_norm = (k1 * (1.0 - b + b * doc_lengths / max(average, 1e-9))).astype(np.float32)
+
+    @classmethod
+    def build(cls, texts: Sequence[str]) -> "BM25Index":
+        vocabulary: Dict[str, int] = {}
+        postings: List[Dict[int, int]] = []
+        doc_lengths = np.zeros(len(texts), dtype=np.float32)
+        for row, text in enumerate(texts):
+            tokens = tokenize(text)
+            doc_lengths[row] = len(tokens)
+            for token in tokens:
+                term = vocabulary.setdefault(token, len(vocabulary))
+                if term == len(postings):
+                    postings.append({})
+                postings[term][row] = postings[term].get(row, 0) + 1
+
+        indptr = np.zeros(len(postings) + 1, dtype=np.int64)
+        np.cumsum([len(p) for p in postings], out=indptr[1:])
+        rows = np.empty(int(indptr[-1]), dtype=np.int32)
+        tfs = np.empty(int(indptr[-1]), dtype=np.float32)
+        for term, posting in enumerate(postings):
+            start = indptr[term]
+            rows[start : start + len(posting)] = list(posting.keys())
+            tfs[start : start + len(posting)] = list(posting.values())
+        doc_indptr, doc_terms = cls._transpose(indptr, rows, len(texts))
+        return cls(
+            vocabulary=vocabulary,
+            indptr=indptr,
+            rows=rows,
+            tfs=tfs,
+            doc_lengths=doc_lengths,
+            doc_indptr=doc_indptr,
+            doc_terms=doc_terms,
+        )
+
+    @staticmethod
+    def _transpose(indptr: np.ndarray, rows: np.ndarray, count: int) -> Tuple[np.ndarray, np.ndarray]:
+        """Row -> sorted distinct term ids, as CSR, from the term -> rows postings."""
+        terms = np.repeat(np.arange(len(indptr) - 1, dtype=np.int32), np.diff(indptr))
+        order = np.lexsort((terms, rows))
+        doc_indptr = np.zeros(count + 1, dtype=np.int64)
+        np.cumsum(np.bincount(rows, minlength=count), out=doc_indptr[1:])
+        return doc_indptr, terms[order]
+
+    def save(self, directory: str | Path) -> None:
+        directory = Path(directory)
+        np.savez(
+            directory / POSTINGS_FILE,
+            indptr=self.indptr,
+            rows=self.rows,
+            tfs=self.tfs,
+            doc_lengths=self.doc_lengths,
+            doc_indptr=self.doc_indptr,
+            doc_terms=self.doc_terms,
+        )
+        (directory / VOCAB_FILE).write_text(json.dumps(self.vocabulary), encoding="utf-8")
+
+    @classmethod
+    def load(cls, directory: str | Path) -> "BM25Index":
+        directory = Path(directory)
+        with np.load(directory / POSTINGS_FILE) as data:
+            arrays = {name: data[name] for name in data.files}
+        vocabulary = json.loads((directory / VOCAB_FILE).read_text(encoding="utf-8"))
+        return cls(vocabulary=vocabulary, **arrays)
+
+    @staticmethod
+    def exists(directory: str | Path) -> bool:
+        return (Path(directory) / POSTINGS_FILE).exists()
+
+    @property
+    def count(self) -> int:
+        return int(self.doc_lengths.shape[0])
+
+    def scores(self, query: str) -> np.ndarray:
+        scores = np.zeros(self.count, dtype=np.float32)
+        for token in set(tokenize(query)):
+            term = self.vocabulary.get(token)
+            if term is None:
+                continue
+            start, end = self.indptr[term], self.indptr[term + 1]
+            rows = self.rows[start:end]
+            tfs = self.tfs[start:end]
+            scores[rows] += self.idf[term] * tfs * (self.k1 + 1.0) / (tfs + self._length_norm[rows])
+        return scores
+
+    def search(
+        self, query: str, k: int, *, rows: Optional[np.ndarray] = None
+    ) -> List[Tuple[int, float]]:
+        """Return ``(row, bm25 score)`` pairs for the best ``k`` rows with a non-zero score.
+
+        With ``rows`` only those rows are ranked.
+        """
+        scores = self.scores(query)
+        if rows is not None:
+            scores = scores[rows]
+        top = top_k_indices(scores, k)
+        top_rows = top if rows is None else rows[top]
+        return [(int(row), float(score)) for row, score in zip(top_rows, scores[top]) if score > 0]
+
+    def doc_freqs(self, tokens: Sequence[str]) -> np.ndarray:
+        """Number of chunks containing each of ``tokens`` (0 for unknown tokens)."""
+        terms = np.asarray([self.vocabulary.get(token, -1) for token in tokens], dtype=np.int64)
+        known = terms >= 0
+        freqs = np.zeros(len(terms), dtype=np.int64)
+        freqs[known] = self.indptr[terms[known] + 1] - self.indptr[terms[known]]
+        return freqs
+
+    def topic_terms(self, text: str) -> np.ndarray:
+        """Term ids of ``text`` that can signal a shared topic.
+
+        Stop words, terms unknown to the corpus and terms present in more than
+        ``MAX_TOPIC_DF`` of the chunks are dropped.
+        """
+        terms = [self.vocabulary[token] for token in topic_tokens(text) if token in self.vocabulary]
+        terms = np.asarray(terms, dtype=np.int64)
+        doc_freq = self.indptr[terms + 1] - self.indptr[terms]
+        return terms[doc_freq <= MAX_TOPIC_DF * self.count]
+
+    def row_terms(self, rows: Sequence[int]) -> Tuple[np.ndarray, np.ndarray]:
+        """Distinct term ids of ``rows``, flattened, with the position in ``rows`` each belongs to."""
+        rows = np.asarray(rows, dtype=np.int64)
+        starts = self.doc_indptr[rows]
+        lengths = self.doc_indptr[rows + 1] - starts
+        owners = np.repeat(np.arange(len(rows)), lengths)
+        offsets = np.arange(int(lengths.sum())) - np.repeat(np.cumsum(lengths) - lengths, lengths)
+        return self.doc_terms[np.repeat(starts, lengths) + offsets], owners
+
+    def overlap(self, terms: np.ndarray, rows: Sequence[int]) -> np.ndarray:
+        """Number of ``terms`` (from :meth:`topic_terms`) occurring in each of ``rows``."""
+        chunk_terms, owners = self.row_terms(rows)
+        mask = np.zeros(len(self.vocabulary), dtype=bool)
+        mask[terms] = True
+        return np.bincount(owners[mask[chunk_terms]], minlength=len(rows))
+
+
+def reciprocal_rank_fusion(rankings: Sequence[Sequence[int]], *, k: int = 60) -> List[Tuple[int, float]]:
+    """Fuse ranked row lists; rows ranked highly by several lists come first."""
+    fused: Dict[int, float] = {}
+    for ranking in rankings:
+        for rank, row in enumerate(ranking):
+            fused[row] = fused.get(row, 0.0) + 1.0 / (k + rank + 1)
+    return sorted(fused.items(), key=lambda item: item[1], reverse=True)
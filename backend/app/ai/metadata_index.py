@@ -0,0 +1,154 @@
+"""Chunk metadata index (source, page, document type) for filtered searches."""
+from __future__ import annotations
+
+import re
+from dataclasses import dataclass
+from pathlib import Path
+from typing import Dict, List, Optional, Sequence
+
+import numpy as np
+
+METADATA_INDEX_FILE = "chunk_index.npz"
+DOC_TYPES = ("textbook", "quiz", "homework")
+_QUIZ_NAME_RE = re.compile(r"quiz|exam|midterm|final|test", re.IGNORECASE)
+_HOMEWORK_NAME_RE = re.compile(r"homework|assignment|worksheet", re.IGNORECASE)
+
+
+def doc_type_of(source: str) -> str:
+    """Document type of a PDF, judged from its file name."""
+    if _QUIZ_NAME_RE.search(source):
+        return "quiz"
+    if _HOMEWORK_NAME_RE.search(source):
+        return "homework"
+    return "textbook"
+
+
+@dataclass(frozen=True)
+class ChunkFilter:
+    """Restricts a search to chunks of one source file, a page range and/or a document type.
+
+    Pages use the same (zero-based) numbers as the ``page`` of search results;
+    both ends of the range are inclusive.
+    """
+
+    source: Optional[str] = None
+    page_from: Optional[int] = None
+    page_to: Optional[int] = None
+    doc_type: Optional[str] = None
+
+    def __post_init__(self) -> None:
+        if self.doc_type is not None and self.doc_type not in DOC_TYPES:
+            raise ValueError(f"Unknown document type: {self.doc_type!r}")
+        if None not in (self.page_from, self.page_to) and self.page_from > self.page_to:
+            raise ValueError("page_from must not be greater than page_to")
+
+    def __bool__(self) -> bool:
+        return any(
+            value is not None
+            for value in (self.source, self.page_from, self.page_to, self.doc_type)
+        )
+
+
+class ChunkMetadataIndex:
+    """Per-row source id and page, plus the rows ordered by (source, page).
+
+    Written next to each index version at ingestion. A filter resolves to its
+    rows with one binary search per matching source, so scoped searches only
+    score those rows instead of the whole corpus.
+    """
+
+    def __init__(
+        self, *, sources: Sequence[str], source_ids: np.ndarray, pages: np.ndarray
+    ) -> None:
+        self.sources = list(sources)
+        self.source_ids = source_ids
+        self.pages = pages
+        self.doc_types = [doc_type_of(source) for source in self.sources]
+        self.order = np.lexsort((pages, source_ids))
+        self._sorted_pages = pages[self.order]
+        self._source_bounds = np.searchsorted(
+            source_ids[self.order], np.arange(len(self.sources) + 1)
+        )
+
+    @classmethod
+    def build(cls, metadatas: Sequence[Dict]) -> "ChunkMetadataIndex":
+        """From chunk metadata in row (``chunk_id``) order; pages other than ints become -1."""
+        source_index: Dict[str, int] = {}
+        source_ids = np.empty(len(metadatas), dtype=np.int32)
+        pages = np.empty(len(metadatas), dtype=np.int32)
+        for row, metadata in enumerate(metadatas):
+            source = str(metadata.get("source", "unknown"))
+            source_ids[row] = source_index.setdefault(source, len(source_index))
+            page = metadata.get("page")
+            pages[row] = page if isinstance(page, int) else -1
+        return cls(sources=list(source_index), source_ids=source_ids, pages=pages)
+
+    def save(self, directory: str | Path) -> None:
+        np.savez(
+            Path(directory) / METADATA_INDEX_FILE,
+            sources=np.asarray(self.sources, dtype=str),
+            source_ids=self.source_ids,
+            pages=self.pages,
+        )
+
+    @classmethod
+    def load(cls, directory: str | Path) -> "ChunkMetadataIndex":
+        with np.load(Path(directory) / METADATA_INDEX_FILE) as data:
+            return cls(
+                sources=data["sources"].tolist(),
+                source_ids=data["source_ids"],
+                pages=data["pages"],
+            )
+
+    @staticmethod
+    def exists(directory: str | Path) -> bool:
+        return (Path(directory) / METADATA_INDEX_FILE).exists()
+
+    @property
+    def count(self) -> int:
+        return int(self.source_ids.shape[0])
+
+    def source_names(self, filters: ChunkFilter) -> List[str]:
+        """Sources allowed by the ``source`` and ``doc_type`` parts of ``filters``."""
+        return [
+            source
+            for source, doc_type in zip(self.sources, self.doc_types)
+            if (filters.source is None or source == filters.source)
+            and (filters.doc_type is None or doc_type == filters.doc_type)
+        ]
+
+    @staticmethod
+    def _page_from(filters: ChunkFilter) -> Optional[int]:
+        """Lower page bound; any page bound excludes chunks with an unknown page (-1)."""
+        if filters.page_from is None and filters.page_to is None:
+            return None
+        return max(filters.page_from or 0, 0)
+
+    def rows(self, filters: ChunkFilter) -> np.ndarray:
+        """Ascending rows matching ``filters``."""
+        parts = []
+        page_from = self._page_from(filters)
+        for source in self.source_names(filters):
+            source_id = self.sources.index(source)
+            low, high = self._source_bounds[source_id], self._source_bounds[source_id + 1]
+            pages = self._sorted_pages[low:high]
+            if page_from is not None:
+                low += int(np.searchsorted(pages, page_from, side="left"))
+            if filters.page_to is not None:
+                high = self._source_bounds[source_id] + int(
+                    np.searchsorted(pages, filters.page_to, side="right")
+                )
+            parts.append(self.order[low:high])
+        if not parts:
+            return np.empty(0, dtype=np.int64)
+        return np.sort(np.concatenate(parts)).astype(np.int64)
+
+    def where(self, filters: ChunkFilter) -> Dict:
+        """Equivalent Chroma ``where`` clause over the ``source``/``page`` chunk metadata."""
+        clauses: List[Dict] = [{"source": {"$in": self.source_names(filters) or [""]}}]
+        page_from = self._page_from(filters)
+        if page_from is not None:
+            clauses.append({"page": {"$gte": page_from}})
+        if filters.page_to is not None:
+            clauses.append({"page": {"$lte": filters.page_to}})
+        return clauses[0] if len(clauses) == 1 else {"$and": clauses}
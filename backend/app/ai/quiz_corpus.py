@@ -0,0 +1,256 @@
+"""Quiz PDFs of one directory, with extracted text and embeddings kept on disk."""
+from __future__ import annotations
+
+import hashlib
+import json
+import os
+import threading
+import time
+from dataclasses import dataclass
+from pathlib import Path
+from typing import Callable, Dict, List, Optional, Tuple
+
+import numpy as np
+
+from .quiz_index import corpus_fingerprint
+
+QUIZ_CORPUS_FILE = "corpus.json"
+# Bumped whenever the stored layout changes; older stores are re-extracted.
+QUIZ_CORPUS_FORMAT = 1
+
+
+def is_quiz_pdf(name: str) -> bool:
+    """Quiz/exam PDFs share ``RAG_QUIZ_DIR`` with the textbooks by default."""
+    return name.endswith(".pdf") and "textbook" not in name.lower()
+
+
+def _file_key(name: str, size: int, mtime_ns: int) -> str:
+    return hashlib.sha1(f"{name}\0{size}\0{mtime_ns}".encode("utf-8")).hexdigest()[:16]
+
+
+@dataclass
+class QuizFile:
+    """One quiz PDF as last seen: its stat, extracted text and chunk embeddings."""
+
+    name: str
+    size: int
+    mtime_ns: int
+    key: str
+    text: str
+    # One row per chunk of ``text``; ``None`` until :meth:`QuizCorpus.embedded`.
+    vectors: Optional[np.ndarray] = None
+
+    @property
+    def stamp(self) -> str:
+        return f"{self.size}:{self.mtime_ns}"
+
+
+class QuizCorpus:
+    """The quiz PDFs of ``directory``, kept in step with the files on disk.
+
+    Each file's extracted text and, once asked for, the embeddings of its chunks
+    are stored under ``store_directory`` (``<key>.txt`` / ``<key>.npy``, the key
+    derived from name, size and mtime) and listed in ``corpus.json``.
+    :meth:`refresh` rescans the directory at most every ``scan_interval``
+    seconds and only parses the files that were added or changed; removed files
+    are dropped. Embeddings are computed for new files only, and again for all
+    of them when ``embedding_key`` (model and chunker) changes. Workers sharing
+    the store reread ``corpus.json`` when another one rewrote it.
+    """
+
+    def __init__(
+        self,
+        *,
+        directory: str | Path,
+        store_directory: str | Path,
+        load_text: Callable[[Path], str],
+        split: Callable[[str], List[str]],
+        embed: Callable[[List[str]], List[List[float]]],
+        embedding_key: str,
+        scan_interval: float = 30.0,
+    ) -> None:
+        self.directory = Path(directory)
+        self.store_directory = Path(store_directory)
+        self.load_text = load_text
+        self.split = split
+        self.embed = embed
+        self.embedding_key = embedding_key
+        self.scan_interval = scan_interval
+        self.files: Dict[str, QuizFile] = {}
+        self.stats = {"scans": 0, "parsed": 0, "embedded": 0, "removed": 0}
+        self._manifest_mtime: Optional[int] = None
+        self._scanned_at: Optional[float] = None
+        self._lock = threading.Lock()
+
+    # ------------------------------------------------------------------
+    # Store
+    # ------------------------------------------------------------------
+    def _path(self, key: str, suffix: str) -> Path:
+        return self.store_directory / f"{key}{suffix}"
+
+    def _load_manifest(self) -> None:
+        """Reread ``corpus.json`` if it changed since this process last read or wrote it."""
+        path = self.store_directory / QUIZ_CORPUS_FILE
+        try:
+            mtime = path.stat().st_mtime_ns
+            if mtime == self._manifest_mtime:
+                return
+            payload = json.loads(path.read_text(encoding="utf-8"))
+        except (FileNotFoundError, json.JSONDecodeError):
+            return
+        self._manifest_mtime = mtime
+        if payload.get("format") != QUIZ_CORPUS_FORMAT:
+            return
+        same_embeddings = payload.get("embedding_key") == self.embedding_key
+        files: Dict[str, QuizFile] = {}
+        for name, entry in payload.get("files", {}).items():
+            key = entry["key"]
+            vector_path = self._path(key, ".npy")
+            known = self.files.get(name)
+            # Unchanged, and no embeddings written by another worker to pick up.
+            if (
+                known
+                and known.key == key
+                and (known.vectors is not None or not vector_path.exists())
+            ):
+                files[name] = known
+                continue
+            try:
+                text = self._path(key, ".txt").read_text(encoding="utf-8")
+            except FileNotFoundError:
+                continue
+            vectors = None
+            if same_embeddings and vector_path.exists():
+                vectors = np.load(vector_path)
+            files[name] = QuizFile(
+                name=name,
+                size=entry["size"],
+                mtime_ns=entry["mtime_ns"],
+                key=key,
+                text=text,
+                vectors=vectors,
+            )
+        self.files = files
+
+    def _save_manifest(self) -> None:
+        payload = {
+            "format": QUIZ_CORPUS_FORMAT,
+            "embedding_key": self.embedding_key,
+            "files": {
+                name: {"size": quiz.size, "mtime_ns": quiz.mtime_ns, "key": quiz.key}
+                for name, quiz in sorted(self.files.items())
+            },
+        }
+        path = self.store_directory / QUIZ_CORPUS_FILE
+        tmp_path = self.store_directory / f".{QUIZ_CORPUS_FILE}.{os.getpid()}.tmp"
+        tmp_path.write_text(json.dumps(payload), encoding="utf-8")
+        os.replace(tmp_path, path)
+        self._manifest_mtime = path.stat().st_mtime_ns
+
+    def _forget(self, quiz: QuizFile) -> None:
+        for suffix in (".txt", ".npy"):
+            self._path(quiz.key, suffix).unlink(missing_ok=True)
+
+    # ------------------------------------------------------------------
+    # Scanning
+    # ------------------------------------------------------------------
+    def _scan(self) -> Dict[str, Tuple[int, int]]:
+        """``name -> (size, mtime_ns)`` of the quiz PDFs currently in ``directory``."""
+        if not self.directory.is_dir():
+            return {}
+        found = {}
+        with os.scandir(self.directory) as entries:
+            for entry in entries:
+                if is_quiz_pdf(entry.name) and entry.is_file():
+                    stat = entry.stat()
+                    found[entry.name] = (stat.st_size, stat.st_mtime_ns)
+        return found
+
+    def refresh(self, *, force: bool = False) -> Optional[Dict[str, List[str]]]:
+        """Rescan ``directory`` and update the affected files.
+
+        Returns the ``added``/``changed``/``removed`` file names, or ``None``
+        when the last scan is less than ``scan_interval`` seconds old (and
+        ``force`` is not set).
+        """
+        with self._lock:
+            now = time.monotonic()
+            if (
+                not force
+                and self._scanned_at is not None
+                and now - self._scanned_at < self.scan_interval
+            ):
+                return None
+            self._scanned_at = now
+            self.store_directory.mkdir(parents=True, exist_ok=True)
+            self._load_manifest()
+            found = self._scan()
+            added = sorted(name for name in found if name not in self.files)
+            changed = sorted(
+                name
+                for name, quiz in self.files.items()
+                if name in found and (quiz.size, quiz.mtime_ns) != found[name]
+            )
+            removed = sorted(name for name in self.files if name not in found)
+            for name in removed:
+                self._forget(self.files.pop(name))
+            for name in added + changed:
+                size, mtime_ns = found[name]
+                key = _file_key(name, size, mtime_ns)
+                text = self.load_text(self.directory / name)
+                self._path(key, ".txt").write_text(text, encoding="utf-8")
+                if name in self.files:
+                    self._forget(self.files[name])
+                self.files[name] = QuizFile(
+                    name=name, size=size, mtime_ns=mtime_ns, key=key, text=text
+                )
+            if added or changed or removed:
+                self._save_manifest()
+            self.stats["scans"] += 1
+            self.stats["parsed"] += len(added) + len(changed)
+            self.stats["removed"] += len(removed)
+            return {"added": added, "changed": changed, "removed": removed}
+
+    # ------------------------------------------------------------------
+    # Contents
+    # ------------------------------------------------------------------
+    @property
+    def fingerprint(self) -> str:
+        """Identity of the scanned files (name, size, mtime), unreadable ones included."""
+        return corpus_fingerprint(
+            (quiz.name, quiz.size, quiz.mtime_ns) for quiz in self.files.values()
+        )
+
+    def quizzes(self) -> List[QuizFile]:
+        """Files with extracted text, by name."""
+        return [quiz for _, quiz in sorted(self.files.items()) if quiz.text.strip()]
+
+    def embedded(self) -> List[QuizFile]:
+        """:meth:`quizzes` with ``vectors`` set; missing ones are embedded in one batch."""
+        with self._lock:
+            pending = [quiz for quiz in self.quizzes() if quiz.vectors is None]
+            if pending:
+                pieces = [self.split(quiz.text) for quiz in pending]
+                flat = [piece for quiz_pieces in pieces for piece in quiz_pieces]
+                vectors = np.asarray(self.embed(flat) if flat else [], dtype=np.float32)
+                offset = 0
+                for quiz, quiz_pieces in zip(pending, pieces):
+                    quiz.vectors = vectors[offset : offset + len(quiz_pieces)]
+                    offset += len(quiz_pieces)
+                    np.save(self._path(quiz.key, ".npy"), quiz.vectors)
+                # Also records the embedding key and lets other workers load the vectors.
+                self._save_manifest()
+                self.stats["embedded"] += len(pending)
+            return self.quizzes()
+
+    def texts(self) -> List[Tuple[str, str]]:
+        return [(quiz.name, quiz.text) for quiz in self.quizzes()]
+
+    def status(self) -> Dict:
+        return {
+            "directory": str(self.directory),
+            "files": len(self.files),
+            "quizzes": len(self.quizzes()),
+            "embedded": sum(quiz.vectors is not None for quiz in self.quizzes()),
+            **self.stats,
+        }
@@ -0,0 +1,135 @@
+"""Precomputed quiz → textbook neighbourhood index for the high-occurrence check."""
+from __future__ import annotations
+
+import hashlib
+import json
+from pathlib import Path
+from typing import Iterable, List, Optional, Sequence, Tuple
+
+import numpy as np
+
+QUIZ_INDEX_FILE = "quiz_topics.json"
+# Bumped whenever the stored term representation changes; older files are rebuilt.
+QUIZ_INDEX_FORMAT = 3
+
+
+def corpus_fingerprint(files: Iterable[Tuple[str, int, int]]) -> str:
+    """Cheap identity of a set of quiz files, given as ``(name, size, mtime_ns)``."""
+    digest = hashlib.sha1()
+    for name, size, mtime_ns in sorted(files):
+        digest.update(f"{name}\0{size}\0{mtime_ns}\n".encode("utf-8"))
+    return digest.hexdigest()
+
+
+class QuizTopicIndex:
+    """For every quiz, the textbook chunks nearest to it and their vocabulary.
+
+    Built once per (index version, quiz corpus fingerprint). The vocabulary of
+    each quiz's neighbourhood is stored as a quiz × term CSR structure over the
+    version's BM25 term ids, so the per-assignment check is a single vectorised
+    membership test instead of one vector search per quiz. ``stamps`` (size and
+    mtime per quiz file) let a rebuild for a changed corpus keep the
+    neighbourhoods of the files that did not change.
+    """
+
+    def __init__(
+        self,
+        *,
+        version: str,
+        fingerprint: str,
+        names: List[str],
+        neighbours: List[List[int]],
+        indptr: np.ndarray,
+        terms: np.ndarray,
+        max_distance: Optional[float] = None,
+        stamps: Optional[List[str]] = None,
+    ) -> None:
+        self.version = version
+        self.fingerprint = fingerprint
+        self.max_distance = max_distance
+        self.names = names
+        self.stamps = stamps or [""] * len(names)
+        self.neighbours = neighbours
+        self.indptr = indptr
+        self.terms = terms
+        self._quiz_of_entry = np.repeat(np.arange(len(names)), np.diff(indptr))
+
+    @classmethod
+    def build(
+        cls,
+        *,
+        version: str,
+        fingerprint: str,
+        names: Sequence[str],
+        neighbours: Sequence[Sequence[int]],
+        neighbour_terms: Sequence[np.ndarray],
+        max_distance: Optional[float] = None,
+        stamps: Optional[Sequence[str]] = None,
+    ) -> "QuizTopicIndex":
+        """``neighbour_terms`` holds, per quiz, the term ids of its neighbour chunks."""
+        terms = [np.unique(quiz_terms).astype(np.int32) for quiz_terms in neighbour_terms]
+        indptr = np.zeros(len(terms) + 1, dtype=np.int64)
+        np.cumsum([len(quiz_terms) for quiz_terms in terms], out=indptr[1:])
+        return cls(
+            version=version,
+            fingerprint=fingerprint,
+            names=list(names),
+            neighbours=[list(rows) for rows in neighbours],
+            indptr=indptr,
+            terms=np.concatenate(terms) if terms else np.empty(0, dtype=np.int32),
+            max_distance=max_distance,
+            stamps=list(stamps) if stamps is not None else None,
+        )
+
+    def save(self, path: str | Path) -> None:
+        payload = {
+            "format": QUIZ_INDEX_FORMAT,
+            "version": self.version,
+            "fingerprint": self.fingerprint,
+            "max_distance": self.max_distance,
+            "names": self.names,
+            "stamps": self.stamps,
+            "neighbours": self.neighbours,
+            "indptr": self.indptr.tolist(),
+            "terms": self.terms.tolist(),
+        }
+        Path(path).write_text(json.dumps(payload), encoding="utf-8")
+
+    @classmethod
+    def load(cls, path: str | Path) -> Optional["QuizTopicIndex"]:
+        """Read a saved index; ``None`` if it was written in an older format."""
+        payload = json.loads(Path(path).read_text(encoding="utf-8"))
+        if payload.get("format") != QUIZ_INDEX_FORMAT:
+            return None
+        return cls(
+            version=payload["version"],
+            fingerprint=payload["fingerprint"],
+            names=payload["names"],
+            neighbours=payload["neighbours"],
+            indptr=np.asarray(payload["indptr"], dtype=np.int64),
+            terms=np.asarray(payload["terms"], dtype=np.int32),
+            max_distance=payload.get("max_distance"),
+            stamps=payload["stamps"],
+        )
+
+    def __len__(self) -> int:
+        return len(self.names)
+
+    def quiz_terms(self, position: int) -> np.ndarray:
+        """Term ids of the neighbourhood of quiz ``position``."""
+        return self.terms[self.indptr[position] : self.indptr[position + 1]]
+
+    def quiz_hits(self, terms: np.ndarray) -> np.ndarray:
+        """Boolean per quiz: does its textbook neighbourhood contain any of ``terms``?
+
+        ``terms`` are the assignment's topic term ids (``BM25Index.topic_terms``).
+        """
+        if not len(terms) or not len(self.terms):
+            return np.zeros(len(self.names), dtype=bool)
+        matched = np.isin(self.terms, terms)
+        return np.bincount(self._quiz_of_entry[matched], minlength=len(self.names)) > 0
+
+    def similarity(self, terms: np.ndarray) -> float:
+        if not self.names:
+            return 0.0
+        return float(self.quiz_hits(terms).mean())
@@ -2,8 +2,13 @@
 from __future__ import annotations
 
 import glob
+import json
+import threading
+import time
+from dataclasses import dataclass, field, replace
+from datetime import datetime, timezone
 from pathlib import Path
-from typing import Dict, List, Optional
+from typing import Dict, List, Optional, Sequence, Tuple
 
 import PyPDF2
 from langchain.chains import RetrievalQA
@@ -11,11 +16,65 @@ from langchain.prompts import PromptTemplate
 from langchain.text_splitter import RecursiveCharacterTextSplitter
 from langchain_community.document_loaders import PyPDFLoader
 from langchain_community.vectorstores import Chroma
+from langchain_core.documents import Document
+from langchain_core.vectorstores import VectorStore
 from langchain_openai import ChatOpenAI, OpenAIEmbeddings
+import numpy as np
+
+from .cache import LRUCache, SemanticCache, normalize_query
+from .chunker import SpanChunker
+from .context import ContextPacker, PackedRetriever
+from .dedup import dedup_chunks, load_provenance, save_provenance
+from .digests import (
+    DIGEST_PROMPT_TEMPLATE,
+    Digest,
+    DigestIndex,
+    render,
+    split_sections,
+    summarize_sections,
+)
+from .lexical import BM25Index, reciprocal_rank_fusion, topic_tokens
+from .metadata_index import ChunkFilter, ChunkMetadataIndex, doc_type_of
+from .quiz_index import QUIZ_INDEX_FILE, QuizTopicIndex
+from .snapshot import INSTALLED_FILE, read_manifest, read_snapshot, write_snapshot
+from .vector_index import NumpyVectorIndex, normalize_rows
+from .versions import IndexVersions
+
+INDEX_BACKENDS = ("chroma", "numpy")
+SEARCH_MODES = ("dense", "lexical", "hybrid")
+LONG_QUERY_AGGREGATES = ("max", "rrf")
+CHUNKERS = ("fast", "sentences", "langchain")
+HNSW_SPACES = ("l2", "cosine", "ip")
+QA_MODEL = "gpt-4o-mini"
+QA_PROMPT_TEMPLATE = (
+    "Use the following pieces of context from the textbook to answer the question.\n"
+    "If you don't know the answer, say you don't know.\n\n"
+    "Context: {context}\n\nQuestion: {question}\n\nAnswer:"
+)
+
+
+@dataclass(frozen=True)
+class ActiveIndex:
+    """Everything belonging to one index version, swapped in as a unit."""
+
+    version: str
+    generation: int
+    store: VectorStore
+    lexical: Optional[BM25Index] = None
+    # True when chunk rows are addressable by ``chunk_id`` (all versioned builds;
+    # not stores created before versioning).
+    row_ids: bool = False
+    # Chunk row -> other (source, page) locations of near duplicates merged
+    # into it at ingestion.
+    provenance: Dict[int, List[Dict]] = field(default_factory=dict)
+    # Source/page/doc-type lookup for filtered searches (row-id indexes only).
+    metadata: Optional[ChunkMetadataIndex] = None
+    # Chapter/section digests written by the offline digest job, if it ran.
+    digests: Optional[DigestIndex] = None
 
 
 class TextbookRAG:
-    """Utility wrapper around LangChain + Chroma for textbook retrieval."""
+    """Utility wrapper around LangChain + Chroma (or a NumPy index) for textbook retrieval."""
 
     def __init__(
         self,
@@ -23,25 +82,154 @@ class TextbookRAG:
         textbook_dir: str | Path,
         persist_directory: str | Path,
         openai_api_key: Optional[str] = None,
+        index_backend: str = "chroma",
+        index_dtype: str = "float32",
+        rescore_candidates: int = 0,
+        reload_interval: float = 5.0,
+        search_mode: str = "dense",
+        embedding_cache_size: int = 1024,
+        result_cache_size: int = 1024,
+        query_window_chars: int = 2000,
+        query_max_windows: int = 8,
+        long_query_aggregate: str = "max",
+        max_distance: Optional[float] = None,
+        coverage_max_distance: float = 0.25,
+        answer_cache_size: int = 256,
+        answer_cache_threshold: float = 0.95,
+        answer_cache_ttl: float = 3600.0,
+        context_tokens: int = 1500,
+        context_candidates: int = 8,
+        dedup_threshold: float = 0.9,
+        chunker: str = "fast",
+        hnsw_space: str = "l2",
+        hnsw_m: int = 16,
+        hnsw_construction_ef: int = 100,
+        hnsw_search_ef: int = 10,
+        snapshot_path: Optional[str | Path] = None,
+        task_context_size: int = 256,
+        task_context_max_distance: float = 0.25,
+        digest_fast_path: bool = True,
     ) -> None:
+        if index_backend not in INDEX_BACKENDS:
+            raise ValueError(f"Unknown RAG index backend: {index_backend!r}")
+        if search_mode not in SEARCH_MODES:
+            raise ValueError(f"Unknown RAG search mode: {search_mode!r}")
+        if long_query_aggregate not in LONG_QUERY_AGGREGATES:
+            raise ValueError(f"Unknown long-query aggregation: {long_query_aggregate!r}")
+        if chunker not in CHUNKERS:
+            raise ValueError(f"Unknown RAG chunker: {chunker!r}")
+        if hnsw_space not in HNSW_SPACES:
+            raise ValueError(f"Unknown HNSW distance: {hnsw_space!r}")
         self.textbook_dir = Path(textbook_dir)
         self.persist_directory = Path(persist_directory)
         self.persist_directory.mkdir(parents=True, exist_ok=True)
         self.openai_api_key = openai_api_key
+        self.index_backend = index_backend
+        # Storage dtype / full-precision rescoring only apply to the NumPy backend.
+        self.index_dtype = index_dtype
+        self.rescore_candidates = rescore_candidates
+        # HNSW graph parameters of new Chroma builds; Chroma stores them with
+        # the collection, so a version keeps the ones it was built with.
+        self.hnsw_metadata = {
+            "hnsw:space": hnsw_space,
+            "hnsw:M": hnsw_m,
+            "hnsw:construction_ef": hnsw_construction_ef,
+            "hnsw:search_ef": hnsw_search_ef,
+        }
+        self.search_mode = search_mode
+        # Estimated Jaccard similarity above which chunks are collapsed at
+        # ingestion; 0 keeps every chunk.
+        self.dedup_threshold = dedup_threshold
+        self.versions = IndexVersions(self.persist_directory)
+        # Installed instead of building when no index version exists yet.
+        self.snapshot_path = Path(snapshot_path) if snapshot_path else None
 
         self.embeddings = (
             OpenAIEmbeddings(openai_api_key=openai_api_key)
             if openai_api_key
             else OpenAIEmbeddings()
         )
-        self.vectorstore: Optional[Chroma] = None
+        self.active: Optional[ActiveIndex] = None
+        # How often (seconds) to poll the ACTIVE pointer for builds published by
+        # other worker processes.
+        self.reload_interval = reload_interval
+        self._next_reload_check = 0.0
+        self._seen_generation: Optional[int] = None
+        # Keyed by (index version, normalized query, ...); cleared on every swap.
+        self.embedding_cache = LRUCache(embedding_cache_size)
+        self.result_cache = LRUCache(result_cache_size)
+        # Answers from ``query``, matched by question embedding similarity.
+        self.answer_cache = SemanticCache(
+            answer_cache_size, threshold=answer_cache_threshold, ttl=answer_cache_ttl
+        )
+        # task_id -> (version, chunk rows, unit embeddings) of the sections an
+        # assignment analysis found; follow-up questions rank these first.
+        self.task_cache = LRUCache(task_context_size)
+        # Task chunks farther than this from a follow-up question do not answer
+        # it; when none is close enough the question is searched globally.
+        self.task_context_max_distance = task_context_max_distance
+        # Answer overview questions about a chapter/section from its digest.
+        self.digest_fast_path = digest_fast_path
         self.qa_chain: Optional[RetrievalQA] = None
-        self.text_splitter = RecursiveCharacterTextSplitter(
-            chunk_size=512,
-            chunk_overlap=50,
-            length_function=len,
+        # Retrieved chunks are filtered, merged and trimmed to this many prompt
+        # tokens before reaching the LLM.
+        self.context_candidates = context_candidates
+        self.context_packer = ContextPacker(
+            budget_tokens=context_tokens, max_distance=max_distance, model=QA_MODEL
+        )
+        self.qa_stats: Dict = {
+            "queries": 0,
+            "prompt_tokens": 0,
+            "task_context_answers": 0,
+            "task_context_fallbacks": 0,
+            "digest_answers": 0,
+        }
+        self.build_status: Dict = {"state": "idle"}
+        self._swap_lock = threading.Lock()
+        self._build_lock = threading.Lock()
+        self.chunker = chunker
+        self.text_splitter = self._make_splitter(chunk_size=512, chunk_overlap=50)
+        # Long documents used as queries are split into windows that stay well
+        # inside the embedding model's input limit.
+        self.query_splitter = self._make_splitter(
+            chunk_size=query_window_chars, chunk_overlap=query_window_chars // 10
+        )
+        self.query_max_windows = query_max_windows
+        self.long_query_aggregate = long_query_aggregate
+        # Cosine distance cutoff used by the coverage checks (quiz analysis,
+        # high-occurrence); ``None`` keeps every top-k hit.
+        self.max_distance = max_distance
+        # Hits this close count towards ``coverage_score``/``confidence``; unlike
+        # ``max_distance`` it always applies, so the scores reflect how close the
+        # top-k hits are rather than how many were returned.
+        self.coverage_max_distance = coverage_max_distance
+
+    def _make_splitter(self, *, chunk_size: int, chunk_overlap: int):
+        """``"fast"`` gives the same chunks as LangChain's splitter, plus page offsets."""
+        if self.chunker == "langchain":
+            return RecursiveCharacterTextSplitter(
+                chunk_size=chunk_size,
+                chunk_overlap=chunk_overlap,
+                length_function=len,
+            )
+        return SpanChunker(
+            chunk_size=chunk_size,
+            chunk_overlap=chunk_overlap,
+            sentences=self.chunker == "sentences",
         )
 
+    @property
+    def vectorstore(self) -> Optional[VectorStore]:
+        return self.active.store if self.active else None
+
+    @property
+    def version(self) -> Optional[str]:
+        return self.active.version if self.active else None
+
+    @property
+    def generation(self) -> Optional[int]:
+        return self.active.generation if self.active else None
+
     def load_textbooks(self) -> List:
         pdf_files = glob.glob(str(self.textbook_dir / "*.pdf"))
         documents = []
@@ -54,65 +242,844 @@ class TextbookRAG:
         return documents
 
     def build_vectorstore(self, *, force_rebuild: bool = False) -> None:
-        if not force_rebuild and self.persist_directory.exists() and any(
-            self.persist_directory.glob("**/*")
+        """Load the active index, or build a new version and swap to it.
+
+        Rebuilds are written to a fresh version directory while searches keep
+        using the current store; the swap only happens once the new index
+        passes validation.
+        """
+        if not self._claim_build():
+            # Another thread is already building; wait for it instead of racing.
+            with self._build_lock:
+                pass
+            if self.active is None:
+                # That build failed; say so instead of handing callers no index.
+                error = self.build_status.get("error", "no index version was activated")
+                raise ValueError(f"Vectorstore build failed: {error}")
+            return
+        self._run_claimed_build(force_rebuild=force_rebuild)
+
+    def try_start_build(self, *, force_rebuild: bool = False) -> bool:
+        """Claim the build and run :meth:`build_vectorstore` in a background thread.
+
+        Returns ``False`` without starting anything when a build is already
+        running; the claim is atomic, so concurrent callers cannot both start one.
+        """
+        if not self._claim_build():
+            return False
+        threading.Thread(
+            target=self._build_in_background,
+            kwargs={"force_rebuild": force_rebuild},
+            name="rag-build",
+            daemon=True,
+        ).start()
+        return True
+
+    def _claim_build(self) -> bool:
+        return self._build_lock.acquire(blocking=False)
+
+    def _release_build(self) -> None:
+        self._build_lock.release()
+
+    def _build_in_background(self, *, force_rebuild: bool) -> None:
+        try:
+            self._run_claimed_build(force_rebuild=force_rebuild)
+        except Exception as exc:
+            print(f"Vectorstore build failed: {exc}")
+
+    def _run_claimed_build(self, *, force_rebuild: bool) -> None:
+        """The build itself; the caller holds the build claim, which is released here."""
+        try:
+            active = self._loadable_version()
+            if not force_rebuild and active:
+                if self.version != active:
+                    self._activate(active, self._load_store(self.versions.directory(active)))
+                return
+            if not force_rebuild and self.snapshot_path and self.snapshot_path.exists():
+                # A fresh replica: install the shipped snapshot instead of re-embedding.
+                self._import_snapshot(self.snapshot_path)
+                return
+            self._build_new_version()
+        finally:
+            self._release_build()
+
+    def _loadable_version(self) -> Optional[str]:
+        """The active version on disk, unless it was built for another backend."""
+        active = self.versions.active()
+        if active and self._backend_of(self.versions.directory(active)) != self.index_backend:
+            # The configured backend changed since the last build.
+            return None
+        return active
+
+    @property
+    def has_index(self) -> bool:
+        """Whether an index is loaded or can be loaded without building one."""
+        return self.active is not None or self._loadable_version() is not None
+
+    @property
+    def is_building(self) -> bool:
+        return self.build_status.get("state") == "building"
+
+    def status(self) -> Dict:
+        """Running/last build, active version and rollback history."""
+        return {
+            **self.build_status,
+            "active_version": self.version,
+            "previous_versions": self.versions.history(),
+        }
+
+    def _build_new_version(self) -> None:
+        version, directory = self.versions.new_version()
+        self.build_status = {
+            "state": "building",
+            "version": version,
+            "started_at": datetime.now(timezone.utc).isoformat(),
+        }
+        try:
+            documents = self.load_textbooks()
+            if not documents:
+                raise ValueError("No textbook PDFs found for RAG setup.")
+
+            chunks = self.text_splitter.split_documents(documents)
+            if self.dedup_threshold > 0:
+                chunks, provenance, report = dedup_chunks(chunks, threshold=self.dedup_threshold)
+                save_provenance(directory, provenance, report)
+                self.build_status = {**self.build_status, "dedup": report}
+            for row, chunk in enumerate(chunks):
+                chunk.metadata["chunk_id"] = row
+            ChunkMetadataIndex.build([chunk.metadata for chunk in chunks]).save(directory)
+            if self.index_backend == "numpy":
+                store = NumpyVectorIndex.from_documents(
+                    chunks,
+                    self.embeddings,
+                    directory=directory,
+                    dtype=self.index_dtype,
+                    rescore=self.rescore_candidates,
+                )
+            else:
+                store = Chroma.from_documents(
+                    documents=chunks,
+                    embedding=self.embeddings,
+                    ids=[str(row) for row in range(len(chunks))],
+                    persist_directory=str(directory),
+                    collection_metadata=self.hnsw_metadata,
+                )
+            BM25Index.build([chunk.page_content for chunk in chunks]).save(directory)
+            self._validate_store(store)
+        except Exception as exc:
+            self.versions.discard(version)
+            self.build_status = {
+                **self.build_status,
+                "state": "failed",
+                "error": str(exc),
+                "finished_at": datetime.now(timezone.utc).isoformat(),
+            }
+            raise
+        self.versions.activate(version)
+        self._activate(version, store)
+        self.build_status = {
+            **self.build_status,
+            "state": "ready",
+            "finished_at": datetime.now(timezone.utc).isoformat(),
+        }
+
+    @staticmethod
+    def _backend_of(directory: Path) -> str:
+        return "numpy" if NumpyVectorIndex.exists(directory) else "chroma"
+
+    def _load_store(self, directory: Path) -> VectorStore:
+        if self._backend_of(directory) == "numpy":
+            return NumpyVectorIndex.load(
+                directory, self.embeddings, rescore=self.rescore_candidates
+            )
+        return Chroma(
+            persist_directory=str(directory),
+            embedding_function=self.embeddings,
+        )
+
+    @staticmethod
+    def _probe_vector(store: VectorStore) -> Optional[List[float]]:
+        """A stored embedding, for probes that should not call the provider."""
+        if isinstance(store, NumpyVectorIndex):
+            embeddings = store.vectors[:1]
+        else:
+            embeddings = store._collection.peek(limit=1).get("embeddings")
+        if embeddings is None or len(embeddings) == 0:
+            return None
+        return [float(value) for value in embeddings[0]]
+
+    @classmethod
+    def _validate_store(cls, store: VectorStore) -> None:
+        probe = cls._probe_vector(store)
+        if probe is None:
+            raise ValueError("New vectorstore is empty.")
+        if not store.similarity_search_by_vector(probe, k=1):
+            raise ValueError("New vectorstore did not return results for a probe query.")
+
+    def _activate(self, version: str, store: VectorStore) -> None:
+        directory = self.versions.directory(version)
+        has_lexical = BM25Index.exists(directory)
+        row_ids = has_lexical or isinstance(store, NumpyVectorIndex)
+        active = ActiveIndex(
+            version=version,
+            generation=self.versions.generation(),
+            store=store,
+            lexical=BM25Index.load(directory) if has_lexical else None,
+            row_ids=row_ids,
+            provenance=load_provenance(directory)[0],
+            metadata=self._load_metadata_index(directory, store) if row_ids else None,
+            digests=DigestIndex.load(directory),
+        )
+        with self._swap_lock:
+            self.active = active
+            self._seen_generation = active.generation
+            self.qa_chain = None
+            self.embedding_cache.clear()
+            self.result_cache.clear()
+            self.answer_cache.clear()
+            self.task_cache.clear()
+
+    # ------------------------------------------------------------------
+    # Snapshots
+    # ------------------------------------------------------------------
+    def _embedding_model(self) -> Optional[str]:
+        return getattr(self.embeddings, "model", None)
+
+    @staticmethod
+    def _store_contents(store: VectorStore) -> Tuple[List[str], List[Dict], np.ndarray]:
+        """Texts, metadata and float32 embeddings of a row-id store, in row order."""
+        if isinstance(store, NumpyVectorIndex):
+            vectors = store.full_vectors if store.full_vectors is not None else store.vectors
+            documents = [store.document(row) for row in range(store.count)]
+            return (
+                [doc.page_content for doc in documents],
+                [doc.metadata for doc in documents],
+                np.asarray(vectors, dtype=np.float32),
+            )
+        result = store._collection.get(include=["embeddings", "documents", "metadatas"])
+        order = np.argsort([int(chunk_id) for chunk_id in result["ids"]])
+        return (
+            [result["documents"][row] for row in order],
+            [result["metadatas"][row] or {} for row in order],
+            np.asarray(result["embeddings"], dtype=np.float32)[order],
+        )
+
+    def export_snapshot(self, path: str | Path) -> Dict:
+        """Write the active version to one compressed, checksummed file; returns its manifest."""
+        index = self._ensure_index()
+        if not index.row_ids:
+            raise ValueError("Only versioned indexes can be exported; rebuild the vectorstore.")
+        directory = self.versions.directory(index.version)
+        texts, metadatas, vectors = self._store_contents(index.store)
+        return write_snapshot(
+            path,
+            version=index.version,
+            texts=texts,
+            metadatas=metadatas,
+            vectors=vectors,
+            directory=directory,
+            info={
+                "backend": self._backend_of(directory),
+                "embedding_model": self._embedding_model(),
+                "chunker": self.chunker,
+                "dedup_threshold": self.dedup_threshold,
+            },
+        )
+
+    def import_snapshot(self, path: str | Path) -> Dict:
+        """Install a snapshot as a new index version and swap to it."""
+        with self._build_lock:
+            return self._import_snapshot(Path(path))
+
+    def _install_marker(self, version: str) -> Optional[Dict]:
+        try:
+            path = self.versions.directory(version) / INSTALLED_FILE
+            return json.loads(path.read_text(encoding="utf-8"))
+        except (FileNotFoundError, json.JSONDecodeError):
+            return None
+
+    def _installed_from(self, version: Optional[str], source_version: str) -> bool:
+        """Is ``version`` a complete index of ``source_version`` for this backend?
+
+        Snapshot installs are complete once their marker exists (it is written
+        last); other versions once they were activated, e.g. where the snapshot
+        was exported.
+        """
+        if not version or not self.versions.directory(version).exists():
+            return False
+        marker = self._install_marker(version)
+        if marker is not None:
+            return (
+                marker.get("source_version") == source_version
+                and marker.get("backend") == self.index_backend
+            )
+        return (
+            version == source_version
+            and version in (self.versions.active(), *self.versions.history())
+            and self._backend_of(self.versions.directory(version)) == self.index_backend
+        )
+
+    def _import_snapshot(self, path: Path) -> Dict:
+        started = time.perf_counter()
+        manifest = read_manifest(path)
+        # Workers warming up against the same snapshot install it one at a time;
+        # the others then find the completed install and switch to it.
+        with self.versions.install_lock():
+            return self._install_snapshot(path, manifest, started)
+
+    def _install_snapshot(self, path: Path, manifest: Dict, started: float) -> Dict:
+        version = manifest["version"]
+        installed = next(
+            (
+                candidate
+                for candidate in (self.versions.active(), version)
+                if self._installed_from(candidate, version)
+            ),
+            None,
+        )
+        if installed is not None:
+            if self.version != installed:
+                store = self._load_store(self.versions.directory(installed))
+                self._validate_store(store)
+                if self.versions.active() != installed:
+                    self.versions.activate(installed)
+                self._activate(installed, store)
+            return {**self.status(), "snapshot": {"path": str(path), "installed": False}}
+        directory = self.versions.directory(version)
+        if (
+            directory.exists()
+            and self._install_marker(version) is None
+            and version not in (self.versions.active(), *self.versions.history())
         ):
-            self.vectorstore = Chroma(
-                persist_directory=str(self.persist_directory),
-                embedding_function=self.embeddings,
+            # Left behind by an install that did not finish; nobody else holds the lock.
+            self.versions.discard(version)
+        if directory.exists():
+            # A complete index of this version for the other backend.
+            version, directory = self.versions.new_version()
+        else:
+            version, directory = self.versions.new_version(version)
+        self.build_status = {
+            "state": "building",
+            "version": version,
+            "started_at": datetime.now(timezone.utc).isoformat(),
+        }
+        try:
+            snapshot = read_snapshot(path)
+            verified = time.perf_counter()
+            model = self._embedding_model()
+            if manifest.get("embedding_model") and model and manifest["embedding_model"] != model:
+                raise ValueError(
+                    f"Snapshot was embedded with {manifest['embedding_model']}, not {model}."
+                )
+            for name, data in snapshot.side_files.items():
+                (directory / name).write_bytes(data)
+            if self.index_backend == "numpy":
+                store = NumpyVectorIndex.from_embeddings(
+                    snapshot.texts,
+                    snapshot.vectors,
+                    snapshot.metadatas,
+                    directory=directory,
+                    embedding=self.embeddings,
+                    dtype=self.index_dtype,
+                    rescore=self.rescore_candidates,
+                )
+            else:
+                store = Chroma(
+                    persist_directory=str(directory),
+                    embedding_function=self.embeddings,
+                    collection_metadata=self.hnsw_metadata,
+                )
+                batch = 5000
+                for offset in range(0, len(snapshot.texts), batch):
+                    end = min(offset + batch, len(snapshot.texts))
+                    store._collection.add(
+                        ids=[str(row) for row in range(offset, end)],
+                        embeddings=snapshot.vectors[offset:end].tolist(),
+                        documents=snapshot.texts[offset:end],
+                        metadatas=[
+                            {key: value for key, value in metadata.items() if value is not None}
+                            for metadata in snapshot.metadatas[offset:end]
+                        ],
+                    )
+            if not BM25Index.exists(directory):
+                BM25Index.build(snapshot.texts).save(directory)
+            self._validate_store(store)
+            (directory / INSTALLED_FILE).write_text(
+                json.dumps(
+                    {
+                        "source_version": manifest["version"],
+                        "backend": self.index_backend,
+                        "installed_at": datetime.now(timezone.utc).isoformat(),
+                    }
+                ),
+                encoding="utf-8",
             )
+        except Exception as exc:
+            self.versions.discard(version)
+            self.build_status = {
+                **self.build_status,
+                "state": "failed",
+                "error": str(exc),
+                "finished_at": datetime.now(timezone.utc).isoformat(),
+            }
+            raise
+        self.versions.activate(version)
+        self._activate(version, store)
+        finished = time.perf_counter()
+        self.build_status = {
+            **self.build_status,
+            "state": "ready",
+            "finished_at": datetime.now(timezone.utc).isoformat(),
+            "snapshot": {
+                "path": str(path),
+                "installed": True,
+                "source_version": manifest["version"],
+                "verify_ms": (verified - started) * 1000,
+                "install_ms": (finished - verified) * 1000,
+                "total_ms": (finished - started) * 1000,
+            },
+        }
+        return self.status()
+
+    @staticmethod
+    def _load_metadata_index(directory: Path, store: VectorStore) -> ChunkMetadataIndex:
+        if ChunkMetadataIndex.exists(directory):
+            return ChunkMetadataIndex.load(directory)
+        # Versions built before the metadata index: derive it from the store.
+        if isinstance(store, NumpyVectorIndex):
+            metadatas = [store.document(row).metadata for row in range(store.count)]
+        else:
+            result = store._collection.get(include=["metadatas"])
+            by_row = dict(zip(map(int, result["ids"]), result["metadatas"]))
+            metadatas = [by_row.get(row) or {} for row in range(len(by_row))]
+        return ChunkMetadataIndex.build(metadatas)
+
+    def _maybe_reload(self) -> None:
+        """Swap to the active version if another process published a new one."""
+        now = time.monotonic()
+        if now < self._next_reload_check:
+            return
+        self._next_reload_check = now + self.reload_interval
+        if self.versions.generation() == self._seen_generation:
             return
+        if not self._build_lock.acquire(blocking=False):
+            return
+        try:
+            active = self.versions.active()
+            if active and active != self.version:
+                self._activate(active, self._load_store(self.versions.directory(active)))
+            else:
+                self._seen_generation = self.versions.generation()
+                self._refresh_digests()
+        finally:
+            self._build_lock.release()
 
-        documents = self.load_textbooks()
-        if not documents:
-            raise ValueError("No textbook PDFs found for RAG setup.")
+    def _refresh_digests(self) -> None:
+        """Pick up digests the offline job wrote for the active version."""
+        index = self.active
+        if index is None:
+            return
+        digests = DigestIndex.load(self.versions.directory(index.version))
+        with self._swap_lock:
+            if self.active is index:
+                self.active = replace(index, digests=digests)
 
-        chunks = self.text_splitter.split_documents(documents)
-        self.vectorstore = Chroma.from_documents(
-            documents=chunks,
-            embedding=self.embeddings,
-            persist_directory=str(self.persist_directory),
-        )
+    def build_digests(self, *, llm=None) -> Dict:
+        """Offline job: summarize every textbook chapter and section of the active version.
+
+        Headings are found in the textbook PDFs (not quizzes or homework); each
+        section is summarized by ``llm`` (the QA model by default), each chapter
+        from its sections' summaries. The digests are stored in the version
+        directory and other workers pick them up on their next reload check.
+        """
+        index = self._ensure_index()
+        pages = [
+            page
+            for page in self.load_textbooks()
+            if doc_type_of(page.metadata["source"]) == "textbook"
+        ]
+        if llm is None:
+            options = {"openai_api_key": self.openai_api_key} if self.openai_api_key else {}
+            llm = ChatOpenAI(
+                model=QA_MODEL,
+                temperature=0,
+                model_kwargs={"response_format": {"type": "json_object"}},
+                **options,
+            )
+
+        def summarize(digest: Digest, text: str) -> Tuple[str, List[str]]:
+            reply = llm.invoke(
+                DIGEST_PROMPT_TEMPLATE.format(
+                    kind="section" if digest.section is not None else "chapter",
+                    title=digest.heading,
+                    text=text,
+                )
+            )
+            data = json.loads(reply.content)
+            summary = str(data.get("summary") or "").strip()
+            if not summary:
+                raise ValueError("empty summary")
+            concepts = [str(concept).strip() for concept in data.get("key_concepts") or []]
+            return summary, [concept for concept in concepts if concept][:8]
+
+        sections = split_sections(pages)
+        digests, errors = summarize_sections(sections, summarize)
+        DigestIndex(digests).save(self.versions.directory(index.version))
+        self.versions.touch(index.version)
+        self._refresh_digests()
+        return {
+            "version": index.version,
+            "sections": len(sections),
+            "digests": len(digests),
+            "errors": errors,
+        }
 
-    def _ensure_vectorstore(self) -> None:
-        if self.vectorstore is None:
+    def rollback(self) -> str:
+        """Switch back to the previously active index version."""
+        with self._build_lock:
+            version = self.versions.previous()
+            store = self._load_store(self.versions.directory(version))
+            # Validate before the pointer moves, so other workers never reload a bad version.
+            self._validate_store(store)
+            self.versions.activate_rollback(version)
+            self._activate(version, store)
+            return version
+
+    def _ensure_index(self) -> ActiveIndex:
+        if self.active is None:
             self.build_vectorstore(force_rebuild=False)
+        else:
+            self._maybe_reload()
+        return self.active
 
-    def initialize_qa_chain(self, *, openai_api_key: Optional[str] = None) -> None:
-        self._ensure_vectorstore()
-        api_key = openai_api_key or self.openai_api_key
-        retriever = self.vectorstore.as_retriever(
-            search_type="similarity",
-            search_kwargs={"k": 5},
+    def warm_up(self, probe: str) -> Dict:
+        """Pay the first-request costs up front; returns per-step timings in ms.
+
+        Loads the active index (building it if none exists), constructs the QA
+        chain and runs ``probe`` through search and the QA retriever, which
+        embeds it and loads the tokenizer. No LLM call is made.
+        """
+        timings: Dict = {}
+        started = time.perf_counter()
+        index = self._ensure_index()
+        timings["index_ms"] = (time.perf_counter() - started) * 1000
+        started = time.perf_counter()
+        qa_chain = self.qa_chain or self.initialize_qa_chain()
+        timings["qa_chain_ms"] = (time.perf_counter() - started) * 1000
+        started = time.perf_counter()
+        self.search_similar_content(probe, k=1)
+        qa_chain.retriever.invoke(probe)
+        timings["probe_ms"] = (time.perf_counter() - started) * 1000
+        return {"version": index.version, **timings}
+
+    def embed_query(self, query: str, *, version: Optional[str] = None) -> List[float]:
+        key = (version or self.version, normalize_query(query))
+        vector = self.embedding_cache.get(key)
+        if vector is None:
+            vector = self.embeddings.embed_query(query)
+            self.embedding_cache.put(key, vector)
+        return vector
+
+    def embed_queries(
+        self, queries: Sequence[str], *, version: Optional[str] = None
+    ) -> List[List[float]]:
+        """Embed many queries, sending every cache miss in a single provider call."""
+        version = version or self.version
+        keys = [(version, normalize_query(query)) for query in queries]
+        vectors: List[Optional[List[float]]] = [self.embedding_cache.get(key) for key in keys]
+        missing = [position for position, vector in enumerate(vectors) if vector is None]
+        if missing:
+            fresh = self.embeddings.embed_documents([queries[position] for position in missing])
+            for position, vector in zip(missing, fresh):
+                vectors[position] = vector
+                self.embedding_cache.put(keys[position], vector)
+        return vectors
+
+    def cache_stats(self) -> Dict:
+        return {
+            "version": self.version,
+            "embeddings": self.embedding_cache.stats(),
+            "results": self.result_cache.stats(),
+            "answers": self.answer_cache.stats(),
+            "task_contexts": self.task_cache.stats(),
+            "qa": {
+                **self.qa_stats,
+                "mean_prompt_tokens": (
+                    self.qa_stats["prompt_tokens"] / self.qa_stats["queries"]
+                    if self.qa_stats["queries"]
+                    else 0.0
+                ),
+            },
+        }
+
+    @staticmethod
+    def _nearest_rows(
+        store: VectorStore,
+        vectors: List[List[float]],
+        k: int,
+        *,
+        max_distance: Optional[float] = None,
+        rows: Optional[np.ndarray] = None,
+        where: Optional[Dict] = None,
+    ) -> List[List[Tuple[int, float]]]:
+        """Top-``k`` ``(chunk_id, cosine similarity)`` per vector in one index call.
+
+        With ``max_distance`` only hits within that cosine distance are kept.
+        A metadata filter is pushed into the index: the NumPy backend scores
+        only ``rows``, Chroma applies the equivalent ``where`` clause.
+        """
+        if not vectors:
+            return []
+        if rows is not None and len(rows) == 0:
+            return [[] for _ in vectors]
+        if isinstance(store, NumpyVectorIndex):
+            return store.search_rows_batch(vectors, k, max_distance=max_distance, rows=rows)
+        result = store._collection.query(
+            query_embeddings=[list(vector) for vector in vectors],
+            n_results=k,
+            where=where,
+            include=["distances"],
+        )
+        scale = TextbookRAG._cosine_scale(store)
+        # Chroma has no distance bound in its query API, so the cutoff trims
+        # its (sorted) top-k.
+        return [
+            [
+                (int(chunk_id), 1.0 - distance * scale)
+                for chunk_id, distance in zip(ids, distances)
+                if max_distance is None or distance * scale <= max_distance
+            ]
+            for ids, distances in zip(result["ids"], result["distances"])
+        ]
+
+    @staticmethod
+    def _cosine_scale(store: VectorStore) -> float:
+        """Factor turning a Chroma distance into cosine distance.
+
+        Squared L2 (Chroma's default space) is twice the cosine distance for
+        unit-length embeddings (OpenAI's are); the ``cosine`` and ``ip`` spaces
+        already report ``1 - similarity``.
+        """
+        space = (store._collection.metadata or {}).get("hnsw:space", "l2")
+        return 0.5 if space == "l2" else 1.0
+
+    @staticmethod
+    def _scope(index: ActiveIndex, filters: Optional[ChunkFilter]) -> Dict:
+        """``rows``/``where`` arguments of :meth:`_nearest_rows` for ``filters``."""
+        if not filters:
+            return {}
+        if index.metadata is None:
+            raise ValueError("Filtered search needs a rebuilt vectorstore.")
+        return {"rows": index.metadata.rows(filters), "where": index.metadata.where(filters)}
+
+    def _dense_search(
+        self,
+        index: ActiveIndex,
+        vector: List[float],
+        k: int,
+        max_distance: Optional[float],
+        filters: Optional[ChunkFilter] = None,
+    ) -> List[Tuple[Document, float]]:
+        """``(document, cosine distance)`` pairs for one query vector, nearest first."""
+        scope = self._scope(index, filters)
+        if index.row_ids:
+            hits = self._nearest_rows(
+                index.store, [vector], k, max_distance=max_distance, **scope
+            )[0]
+            by_row = self._documents_for_rows(index.store, [row for row, _ in hits])
+            return [(by_row[row], 1.0 - similarity) for row, similarity in hits if row in by_row]
+        # Stores built before versioning are plain Chroma collections.
+        scale = self._cosine_scale(index.store)
+        return [
+            (doc, distance * scale)
+            for doc, distance in index.store.similarity_search_by_vector_with_relevance_scores(
+                vector, k=k
+            )
+            if max_distance is None or distance * scale <= max_distance
+        ]
+
+    @staticmethod
+    def _documents_for_rows(store: VectorStore, rows: List[int]) -> Dict[int, Document]:
+        """Resolve chunk rows (``chunk_id``) to documents, keyed by row.
+
+        Rows missing from the store are left out, so callers join on the row.
+        """
+        if not rows:
+            return {}
+        if isinstance(store, NumpyVectorIndex):
+            return {row: store.document(row) for row in rows}
+        result = store._collection.get(
+            ids=[str(row) for row in rows], include=["documents", "metadatas"]
         )
-        prompt_template = (
-            "Use the following pieces of context from the textbook to answer the question.\n"
-            "If you don't know the answer, say you don't know.\n\n"
-            "Context: {context}\n\nQuestion: {question}\n\nAnswer:"
+        return {
+            int(chunk_id): Document(page_content=text, metadata=metadata or {})
+            for chunk_id, text, metadata in zip(
+                result["ids"], result["documents"], result["metadatas"]
+            )
+        }
+
+    # ------------------------------------------------------------------
+    # Task-scoped context
+    # ------------------------------------------------------------------
+    @staticmethod
+    def _row_vectors(store: VectorStore, rows: List[int]) -> np.ndarray:
+        """Unit float32 embeddings of chunk ``rows``, in that order."""
+        if isinstance(store, NumpyVectorIndex):
+            source = store.full_vectors if store.full_vectors is not None else store.vectors
+            return normalize_rows(np.asarray(source[rows], dtype=np.float32))
+        result = store._collection.get(ids=[str(row) for row in rows], include=["embeddings"])
+        by_id = dict(zip(result["ids"], result["embeddings"]))
+        return normalize_rows(np.asarray([by_id[str(row)] for row in rows], dtype=np.float32))
+
+    def remember_task(
+        self, task_id: str, rows: Sequence[int], *, version: Optional[str] = None
+    ) -> bool:
+        """Keep the chunks found for ``task_id`` (and their embeddings) hot.
+
+        ``version`` is the index version the rows come from; rows from another
+        version are ignored. Returns whether a context was stored.
+        """
+        index = self._ensure_index()
+        if not index.row_ids or (version is not None and version != index.version):
+            return False
+        rows = list(dict.fromkeys(int(row) for row in rows))
+        if not rows or self.task_cache.maxsize <= 0:
+            return False
+        vectors = self._row_vectors(index.store, rows)
+        self.task_cache.put(task_id, (index.version, np.asarray(rows, dtype=np.int64), vectors))
+        return True
+
+    def has_task_context(self, task_id: str) -> bool:
+        entry = self.task_cache.get(task_id)
+        return entry is not None and entry[0] == self.version
+
+    def _task_hits(
+        self, index: ActiveIndex, task_id: str, vector: List[float]
+    ) -> Optional[List[Tuple[Document, float]]]:
+        """``(document, cosine distance)`` of the task's chunks within
+        ``task_context_max_distance`` of the question.
+
+        ``None`` when no context is stored for ``task_id`` and the active version.
+        """
+        entry = self.task_cache.get(task_id)
+        if entry is None or entry[0] != index.version:
+            return None
+        _, rows, vectors = entry
+        query = normalize_rows(np.asarray([vector], dtype=np.float32))[0]
+        distances = 1.0 - vectors @ query
+        order = [
+            position
+            for position in np.argsort(distances, kind="stable")[: self.context_candidates]
+            if distances[position] <= self.task_context_max_distance
+        ]
+        task_rows = [int(rows[position]) for position in order]
+        docs = self._documents_for_rows(index.store, task_rows)
+        return [
+            (docs[row], float(distances[position]))
+            for row, position in zip(task_rows, order)
+            if row in docs
+        ]
+
+    def initialize_qa_chain(self, *, openai_api_key: Optional[str] = None) -> RetrievalQA:
+        index = self._ensure_index()
+        api_key = openai_api_key or self.openai_api_key
+        # Over-fetch scored candidates and let the packer decide what fits.
+        retriever = PackedRetriever(
+            search=lambda question: self._dense_search(
+                index,
+                self.embed_query(question, version=index.version),
+                self.context_candidates,
+                None,
+            ),
+            packer=self.context_packer,
         )
         prompt = PromptTemplate(
-            template=prompt_template,
+            template=QA_PROMPT_TEMPLATE,
             input_variables=["context", "question"],
         )
         llm = (
-            ChatOpenAI(model="gpt-4o-mini", temperature=0, openai_api_key=api_key)
+            ChatOpenAI(model=QA_MODEL, temperature=0, openai_api_key=api_key)
             if api_key
-            else ChatOpenAI(model="gpt-4o-mini", temperature=0)
+            else ChatOpenAI(model=QA_MODEL, temperature=0)
         )
-        self.qa_chain = RetrievalQA.from_chain_type(
+        qa_chain = RetrievalQA.from_chain_type(
             llm=llm,
             chain_type="stuff",
             retriever=retriever,
             chain_type_kwargs={"prompt": prompt},
             return_source_documents=True,
         )
+        with self._swap_lock:
+            if self.active is index:
+                self.qa_chain = qa_chain
+        return qa_chain
 
-    def query(self, question: str, *, openai_api_key: Optional[str] = None) -> Dict:
-        if self.qa_chain is None:
-            self.initialize_qa_chain(openai_api_key=openai_api_key)
-        result = self.qa_chain({"query": question})
-        return {
+    def query(
+        self,
+        question: str,
+        *,
+        openai_api_key: Optional[str] = None,
+        task_id: Optional[str] = None,
+    ) -> Dict:
+        """Answer ``question`` from the textbooks.
+
+        Questions close to one already answered against the active index version
+        (see ``answer_cache``) are served from the cache without running the chain.
+        With a ``task_id`` whose context was stored by :meth:`remember_task`, the
+        answer is built from that task's chunks within ``task_context_max_distance``;
+        only if none qualifies does the question go to the global search. Requests for an
+        overview of one chapter or section are answered from its precomputed
+        digest (see :meth:`build_digests`) with no retrieval or LLM call.
+        """
+        index = self._ensure_index()
+        if self.digest_fast_path and task_id is None and index.digests is not None:
+            routed = index.digests.match(question)
+            if routed is not None:
+                return self._digest_answer(*routed)
+        vector = None
+        task_docs: List[Document] = []
+        task_stat = None
+        if task_id is not None:
+            vector = self.embed_query(question, version=index.version)
+            hits = self._task_hits(index, task_id, vector)
+            if hits is not None:
+                task_docs = self.context_packer.pack(hits)
+                task_stat = "task_context_answers" if task_docs else "task_context_fallbacks"
+        # Task-scoped answers only come from the task's chunks, so cache them per task.
+        scope = (index.version, task_id) if task_docs else index.version
+        if self.answer_cache.maxsize > 0:
+            vector = vector or self.embed_query(question, version=index.version)
+            cached = self.answer_cache.get(scope, vector)
+            if cached is not None:
+                return {
+                    "answer": cached["answer"],
+                    "prompt_tokens": cached["prompt_tokens"],
+                    "sources": [dict(source) for source in cached["sources"]],
+                    "cached": True,
+                    "task_context": bool(task_docs),
+                }
+        qa_chain = self.qa_chain
+        if qa_chain is None:
+            qa_chain = self.initialize_qa_chain(openai_api_key=openai_api_key)
+        if task_stat:
+            self.qa_stats[task_stat] += 1
+        if task_docs:
+            answer = qa_chain.combine_documents_chain.run(
+                input_documents=task_docs, question=question
+            )
+            result = {"result": answer, "source_documents": task_docs}
+        else:
+            result = qa_chain({"query": question})
+        # The "stuff" chain joins documents with blank lines.
+        context = "\n\n".join(doc.page_content for doc in result["source_documents"])
+        prompt_tokens = self.context_packer.count_tokens(
+            QA_PROMPT_TEMPLATE.format(context=context, question=question)
+        )
+        self.qa_stats["queries"] += 1
+        self.qa_stats["prompt_tokens"] += prompt_tokens
+        response = {
             "answer": result["result"],
+            "prompt_tokens": prompt_tokens,
             "sources": [
                 {
                     "content": doc.page_content[:200] + "...",
@@ -122,53 +1089,423 @@ class TextbookRAG:
                 for doc in result["source_documents"]
             ],
         }
+        if vector is not None:
+            self.answer_cache.put(scope, vector, response)
+        return {
+            **response,
+            "sources": [dict(source) for source in response["sources"]],
+            "cached": False,
+            "task_context": bool(task_docs),
+        }
 
-    def search_similar_content(self, query: str, *, k: int = 5) -> List[Dict]:
-        self._ensure_vectorstore()
-        docs = self.vectorstore.similarity_search(query, k=k)
-        return [
-            {
-                "content": doc.page_content,
-                "source": doc.metadata.get("source", "unknown"),
-                "page": doc.metadata.get("page", "unknown"),
+    def _digest_answer(self, digest: Digest, intent: str) -> Dict:
+        self.qa_stats["digest_answers"] += 1
+        return {
+            "answer": render(digest, intent),
+            "prompt_tokens": 0,
+            "sources": [
+                {
+                    "content": digest.summary[:200] + "...",
+                    "source": digest.source,
+                    "page": digest.page_from,
+                }
+            ],
+            "cached": False,
+            "task_context": False,
+            "digest": {
+                "source": digest.source,
+                "chapter": digest.chapter,
+                "section": digest.section,
+                "title": digest.title,
+                "page_from": digest.page_from,
+                "page_to": digest.page_to,
+                "intent": intent,
+            },
+        }
+
+    def search_similar_content(
+        self,
+        query: str,
+        *,
+        k: int = 5,
+        mode: Optional[str] = None,
+        max_distance: Optional[float] = None,
+        filters: Optional[ChunkFilter] = None,
+    ) -> List[Dict]:
+        """Search the textbook chunks.
+
+        ``mode`` is ``"dense"`` (embedding similarity), ``"lexical"`` (local BM25,
+        no provider call) or ``"hybrid"`` (both, fused by reciprocal rank).
+        Each result carries ``score``, its cosine distance to the query (lower is
+        closer; ``None`` for lexical-only hits). With ``max_distance`` the dense
+        hits are limited to chunks within that distance, up to ``k``; with
+        ``filters`` only chunks of the given source/pages/document type are searched.
+        """
+        mode = mode or self.search_mode
+        if mode not in SEARCH_MODES:
+            raise ValueError(f"Unknown RAG search mode: {mode!r}")
+        index = self._ensure_index()
+        if mode != "dense" and index.lexical is None:
+            if mode == "lexical":
+                raise ValueError("The active index has no lexical index; rebuild the vectorstore.")
+            mode = "dense"
+
+        cache_key = (
+            index.version, normalize_query(query), mode, k, max_distance, filters or None
+        )
+        cached = self.result_cache.get(cache_key)
+        if cached is not None:
+            return [dict(result) for result in cached]
+
+        allowed = self._scope(index, filters).get("rows")
+        if mode == "dense":
+            hits = self._dense_search(
+                index, self.embed_query(query, version=index.version), k, max_distance, filters
+            )
+        elif mode == "lexical":
+            rows = [row for row, _ in index.lexical.search(query, k, rows=allowed)]
+            docs = self._documents_for_rows(index.store, rows)
+            hits = [(docs[row], None) for row in rows if row in docs]
+        else:
+            dense_hits = self._dense_search(
+                index, self.embed_query(query, version=index.version), k, max_distance, filters
+            )
+            by_row = {doc.metadata.get("chunk_id"): (doc, distance) for doc, distance in dense_hits}
+            lexical_rows = [row for row, _ in index.lexical.search(query, k, rows=allowed)]
+            fused = reciprocal_rank_fusion([list(by_row), lexical_rows])[:k]
+            missing = [row for row, _ in fused if row not in by_row]
+            by_row.update(
+                (row, (doc, None))
+                for row, doc in self._documents_for_rows(index.store, missing).items()
+            )
+            hits = [by_row[row] for row, _ in fused if row in by_row]
+        results = [self._to_result(index, doc, distance) for doc, distance in hits]
+        self.result_cache.put(cache_key, results)
+        return [dict(result) for result in results]
+
+    def search_similar_content_batch(
+        self,
+        queries: Sequence[str],
+        *,
+        k: int = 5,
+        mode: Optional[str] = None,
+        max_distance: Optional[float] = None,
+        filters: Optional[ChunkFilter] = None,
+    ) -> List[List[Dict]]:
+        """:meth:`search_similar_content` for many queries at once.
+
+        Dense searches embed all uncached queries in one provider call and run a
+        single nearest-neighbour query over the index. Other modes, and stores
+        without ``chunk_id`` row ids, fall back to one search per query.
+        """
+        mode = mode or self.search_mode
+        index = self._ensure_index()
+        if mode != "dense" or not index.row_ids:
+            return [
+                self.search_similar_content(
+                    query, k=k, mode=mode, max_distance=max_distance, filters=filters
+                )
+                for query in queries
+            ]
+
+        keys = [
+            (index.version, normalize_query(query), mode, k, max_distance, filters or None)
+            for query in queries
+        ]
+        results: List[Optional[List[Dict]]] = [self.result_cache.get(key) for key in keys]
+        missing = [position for position, cached in enumerate(results) if cached is None]
+        if missing:
+            vectors = self.embed_queries(
+                [queries[position] for position in missing], version=index.version
+            )
+            hits = self._nearest_rows(
+                index.store, vectors, k, max_distance=max_distance, **self._scope(index, filters)
+            )
+            rows = sorted({row for query_hits in hits for row, _ in query_hits})
+            docs = self._documents_for_rows(index.store, rows)
+            for position, query_hits in zip(missing, hits):
+                results[position] = [
+                    self._to_result(index, docs[row], 1.0 - similarity)
+                    for row, similarity in query_hits
+                    if row in docs
+                ]
+                self.result_cache.put(keys[position], results[position])
+        return [[dict(result) for result in query_results] for query_results in results]
+
+    def _query_windows(self, text: str) -> List[str]:
+        windows = self.query_splitter.split_text(text)
+        if len(windows) <= self.query_max_windows:
+            return windows
+        # Cap latency/cost: keep evenly spaced windows across the whole document.
+        step = (len(windows) - 1) / max(self.query_max_windows - 1, 1)
+        return [windows[round(position * step)] for position in range(self.query_max_windows)]
+
+    def search_long_text(
+        self,
+        text: str,
+        *,
+        k: int = 10,
+        aggregate: Optional[str] = None,
+        max_distance: Optional[float] = None,
+    ) -> List[Dict]:
+        """Search with a whole document (assignment, quiz) as the query.
+
+        The text is split into at most ``query_max_windows`` windows that are
+        embedded in one batch and searched together; hits are merged per chunk
+        by best similarity (``"max"``) or reciprocal-rank fusion (``"rrf"``).
+        Short texts and pre-versioning stores use a plain dense search. A
+        result's ``score`` is its best cosine distance to any window.
+        """
+        aggregate = aggregate or self.long_query_aggregate
+        if aggregate not in LONG_QUERY_AGGREGATES:
+            raise ValueError(f"Unknown long-query aggregation: {aggregate!r}")
+        index = self._ensure_index()
+        windows = self._query_windows(text)
+        if len(windows) <= 1 or not index.row_ids:
+            return self.search_similar_content(text, k=k, mode="dense", max_distance=max_distance)
+
+        cache_key = (index.version, normalize_query(text), "windows", aggregate, k, max_distance)
+        cached = self.result_cache.get(cache_key)
+        if cached is not None:
+            return [dict(result) for result in cached]
+
+        vectors = self.embed_queries(windows, version=index.version)
+        per_window = self._nearest_rows(index.store, vectors, k, max_distance=max_distance)
+        best: Dict[int, float] = {}
+        for hits in per_window:
+            for row, similarity in hits:
+                best[row] = max(similarity, best.get(row, float("-inf")))
+        if aggregate == "rrf":
+            merged = reciprocal_rank_fusion([[row for row, _ in hits] for hits in per_window])
+        else:
+            merged = sorted(best.items(), key=lambda item: item[1], reverse=True)
+        rows = [row for row, _ in merged[:k]]
+        docs = self._documents_for_rows(index.store, rows)
+        results = [
+            self._to_result(index, docs[row], 1.0 - best[row]) for row in rows if row in docs
+        ]
+        self.result_cache.put(cache_key, results)
+        return [dict(result) for result in results]
+
+    @staticmethod
+    def _to_result(index: ActiveIndex, doc: Document, distance: Optional[float] = None) -> Dict:
+        chunk_id = doc.metadata.get("chunk_id")
+        return {
+            "content": doc.page_content,
+            "source": doc.metadata.get("source", "unknown"),
+            "page": doc.metadata.get("page", "unknown"),
+            "chunk_id": chunk_id,
+            # Character span of the chunk within its page (None for older indexes).
+            "start": doc.metadata.get("start"),
+            "end": doc.metadata.get("end"),
+            "score": distance,
+            # Where near-identical copies of this chunk were found.
+            "also_in": index.provenance.get(chunk_id, []),
+        }
+
+    def _stored_quiz_topic_index(self, index: ActiveIndex) -> Optional[QuizTopicIndex]:
+        """The persisted quiz-topic index of ``index``, whatever quiz corpus it was built for."""
+        path = self.versions.directory(index.version) / QUIZ_INDEX_FILE
+        if not path.exists():
+            return None
+        quiz_index = QuizTopicIndex.load(path)
+        if (
+            quiz_index is None
+            or quiz_index.version != index.version
+            or quiz_index.max_distance != self.max_distance
+        ):
+            return None
+        return quiz_index
+
+    def load_quiz_topic_index(self, fingerprint: str) -> Optional[QuizTopicIndex]:
+        """Return the persisted quiz-topic index for the active version, if still current."""
+        quiz_index = self._stored_quiz_topic_index(self._ensure_index())
+        if quiz_index is None or quiz_index.fingerprint != fingerprint:
+            return None
+        return quiz_index
+
+    def build_quiz_topic_index(
+        self,
+        quizzes: Sequence[Tuple[str, str]],
+        *,
+        fingerprint: str,
+        k: int = 5,
+        vectors: Optional[Sequence[np.ndarray]] = None,
+        stamps: Optional[Sequence[str]] = None,
+    ) -> Optional[QuizTopicIndex]:
+        """Precompute each quiz's ``k`` nearest textbook chunks and persist them.
+
+        Quizzes are chunked, all chunks are embedded in one batch and searched in
+        one index call; a quiz's neighbourhood is the ``k`` rows with the best
+        similarity to any of its chunks, limited to ``max_distance``. ``vectors``
+        gives each quiz's chunk embeddings (see :class:`QuizCorpus`) so none are
+        computed here. Quizzes whose name and ``stamps`` entry match the index
+        already stored for this version keep their neighbourhoods. Returns
+        ``None`` for stores that predate ``chunk_id`` row ids or have no lexical
+        index (the neighbourhoods are stored as its term ids).
+        """
+        index = self._ensure_index()
+        if not index.row_ids or index.lexical is None:
+            return None
+        stamps = list(stamps) if stamps is not None else [""] * len(quizzes)
+        previous = self._stored_quiz_topic_index(index) if any(stamps) else None
+        kept: Dict[int, int] = {}
+        if previous is not None:
+            stored = {
+                (name, stamp): position
+                for position, (name, stamp) in enumerate(zip(previous.names, previous.stamps))
+                if stamp
             }
-            for doc in docs
+            for position, ((name, _), stamp) in enumerate(zip(quizzes, stamps)):
+                if (name, stamp) in stored:
+                    kept[position] = stored[name, stamp]
+        owners: List[int] = []
+        pieces: List[str] = []
+        piece_vectors: List[List[float]] = []
+        for position, (_, text) in enumerate(quizzes):
+            if position in kept:
+                continue
+            if vectors is not None:
+                # Chroma only accepts plain floats.
+                rows = np.asarray(vectors[position], dtype=np.float32).tolist()
+                piece_vectors.extend(rows)
+                owners.extend([position] * len(rows))
+                continue
+            for piece in self.text_splitter.split_text(text):
+                owners.append(position)
+                pieces.append(piece)
+        if pieces:
+            piece_vectors = self.embeddings.embed_documents(pieces)
+
+        best: List[Dict[int, float]] = [{} for _ in quizzes]
+        hits_per_piece = self._nearest_rows(
+            index.store, piece_vectors, k, max_distance=self.max_distance
+        )
+        for owner, hits in zip(owners, hits_per_piece):
+            for row, similarity in hits:
+                if similarity > best[owner].get(row, float("-inf")):
+                    best[owner][row] = similarity
+        neighbours = [
+            [row for row, _ in sorted(scores.items(), key=lambda item: item[1], reverse=True)[:k]]
+            for scores in best
         ]
+        neighbour_terms = [index.lexical.row_terms(rows)[0] for rows in neighbours]
+        for position, stored_position in kept.items():
+            neighbours[position] = previous.neighbours[stored_position]
+            neighbour_terms[position] = previous.quiz_terms(stored_position)
+        quiz_index = QuizTopicIndex.build(
+            version=index.version,
+            fingerprint=fingerprint,
+            max_distance=self.max_distance,
+            names=[name for name, _ in quizzes],
+            neighbours=neighbours,
+            neighbour_terms=neighbour_terms,
+            stamps=stamps,
+        )
+        quiz_index.save(self.versions.directory(index.version) / QUIZ_INDEX_FILE)
+        return quiz_index
 
-    def analyze_quiz(self, quiz_text: str) -> Dict:
-        self._ensure_vectorstore()
-        similar_content = self.search_similar_content(quiz_text, k=10)
-        topics_found = len(similar_content) > 0
-        coverage_score = (
-            min(len(similar_content) / 10.0, 1.0) if similar_content else 0.0
+    def _covered(self, matches: List[Dict]) -> int:
+        """How many of ``matches`` lie within ``coverage_max_distance``.
+
+        Lexical-only hits carry no distance and count as covered.
+        """
+        return sum(
+            match["score"] is None or match["score"] <= self.coverage_max_distance
+            for match in matches
         )
+
+    def analyze_quiz(self, quiz_text: str) -> Dict:
+        """Coverage of a quiz by the textbook.
+
+        ``coverage_score`` is the share of the top 10 chunks lying within
+        ``coverage_max_distance`` of the quiz, so unrelated quizzes score low
+        even though the top-k is always filled.
+        """
+        similar_content = self.search_long_text(quiz_text, k=10, max_distance=self.max_distance)
+        distances = [match["score"] for match in similar_content if match["score"] is not None]
         return {
-            "topics_found": topics_found,
-            "coverage_score": coverage_score,
+            "topics_found": len(similar_content) > 0,
+            "coverage_score": min(self._covered(similar_content) / 10.0, 1.0),
             "relevant_sections": similar_content[:5],
             "total_matches": len(similar_content),
+            "best_score": min(distances) if distances else None,
+            "max_distance": self.max_distance,
+            "coverage_max_distance": self.coverage_max_distance,
         }
 
     def check_high_occurrence_in_tests(
-        self, assignment_content: str, *, quiz_texts: Optional[List[str]] = None
+        self,
+        assignment_content: str,
+        *,
+        quiz_texts: Optional[List[str]] = None,
+        quiz_search_mode: Optional[str] = None,
+        quiz_index: Optional[QuizTopicIndex] = None,
     ) -> Dict:
-        self._ensure_vectorstore()
-        assignment_matches = self.search_similar_content(assignment_content, k=10)
+        """Judge whether the assignment's topics show up in quizzes/exams.
+
+        With ``quiz_index`` the quiz comparison is a single lookup against the
+        precomputed quiz neighbourhoods; otherwise each of ``quiz_texts`` is
+        searched individually. Textbook and quiz matches only count chunks
+        within ``max_distance``; textbook coverage and ``confidence`` only count
+        those within ``coverage_max_distance``.
+        """
+        index = self._ensure_index()
+        if index.lexical is None:
+            quiz_search_mode = "dense"
+        quiz_search_mode = quiz_search_mode or "dense"
+        use_quiz_index = (
+            quiz_index is not None and len(quiz_index) > 0 and index.lexical is not None
+        )
+        if self.search_mode == "dense":
+            assignment_matches = self.search_long_text(
+                assignment_content, k=10, max_distance=self.max_distance
+            )
+        else:
+            assignment_matches = self.search_similar_content(
+                assignment_content, k=10, max_distance=self.max_distance
+            )
 
         quiz_similarity = 0.0
-        if quiz_texts:
-            total_similarity = 0.0
-            assignment_topics = set(assignment_content.lower().split())
-            for quiz_text in quiz_texts:
-                quiz_matches = self.search_similar_content(quiz_text, k=5)
-                for match in quiz_matches:
-                    match_words = set(match["content"].lower().split())
-                    if assignment_topics.intersection(match_words):
-                        total_similarity += 1.0
-                        break
-            quiz_similarity = total_similarity / len(quiz_texts)
-
-        has_textbook_coverage = len(assignment_matches) >= 5
+        if use_quiz_index:
+            quiz_texts = quiz_index.names
+            quiz_similarity = quiz_index.similarity(
+                index.lexical.topic_terms(assignment_content)
+            )
+        elif quiz_texts:
+            if quiz_search_mode == "dense":
+                # One embedding call and one index query for all quiz texts.
+                all_quiz_matches = self.search_similar_content_batch(
+                    quiz_texts, k=5, mode="dense", max_distance=self.max_distance
+                )
+            else:
+                # "lexical" avoids embedding the quiz texts at all.
+                all_quiz_matches = [
+                    self.search_similar_content(quiz_text, k=5, mode=quiz_search_mode)
+                    for quiz_text in quiz_texts
+                ]
+            if index.lexical is not None:
+                # Term ids of every matched chunk were stored at ingestion:
+                # count shared topic terms for all quizzes' chunks at once.
+                rows = [match["chunk_id"] for matches in all_quiz_matches for match in matches]
+                owners = np.repeat(
+                    np.arange(len(all_quiz_matches)),
+                    [len(matches) for matches in all_quiz_matches],
+                )
+                overlap = index.lexical.overlap(
+                    index.lexical.topic_terms(assignment_content), rows
+                )
+                quiz_hits = np.bincount(owners[overlap > 0], minlength=len(quiz_texts)) > 0
+                quiz_similarity = float(quiz_hits.mean())
+            else:
+                assignment_topics = topic_tokens(assignment_content)
+                quiz_similarity = sum(
+                    any(assignment_topics & topic_tokens(match["content"]) for match in matches)
+                    for matches in all_quiz_matches
+                ) / len(quiz_texts)
+
+        covered = self._covered(assignment_matches)
+        has_textbook_coverage = covered >= 5
         is_high_occurrence = (
             has_textbook_coverage and quiz_similarity > 0.5
             if quiz_texts
@@ -177,12 +1514,19 @@ class TextbookRAG:
 
         return {
             "is_high_occurrence": is_high_occurrence,
+            "version": index.version,
             "textbook_coverage": {
                 "matches_found": len(assignment_matches),
                 "relevant_sections": assignment_matches[:5],
+                # Every matched chunk, for task-scoped follow-up questions.
+                "chunk_ids": [
+                    match["chunk_id"]
+                    for match in assignment_matches
+                    if match.get("chunk_id") is not None
+                ],
             },
             "quiz_similarity": quiz_similarity if quiz_texts else None,
-            "confidence": min(len(assignment_matches) / 10.0, 1.0),
+            "confidence": min(covered / 10.0, 1.0),
         }
 
 
@@ -0,0 +1,174 @@
+"""Model tiers for assignment analysis, routed by input size and requested detail."""
+from __future__ import annotations
+
+import re
+import threading
+from dataclasses import dataclass
+from typing import Dict, List, Optional, Sequence, Tuple
+
+DETAIL_LEVELS = ("low", "standard", "high")
+# List prices in USD per million (input, output) tokens, for the cost estimates
+# in the stats. Dated model names match by prefix; unknown models cost ``None``.
+MODEL_PRICES: Dict[str, Tuple[float, float]] = {
+    "gpt-4o-mini": (0.15, 0.60),
+    "gpt-4o": (2.50, 10.00),
+    "gpt-4.1-nano": (0.10, 0.40),
+    "gpt-4.1-mini": (0.40, 1.60),
+    "gpt-4.1": (2.00, 8.00),
+    "gpt-3.5-turbo": (0.50, 1.50),
+}
+# Kana, CJK ideographs, Hangul and full-width forms: about one token per character.
+_CJK_RE = re.compile(r"[\u3040-\u30ff\u3400-\u4dbf\u4e00-\u9fff\uac00-\ud7af\uff00-\uffef]")
+
+
+def estimate_tokens(text: str) -> int:
+    """Rough token count without loading a tokenizer: one per CJK character,
+    one per four other characters."""
+    cjk = len(_CJK_RE.findall(text))
+    return cjk + (len(text) - cjk + 3) // 4
+
+
+def model_price(model: str) -> Optional[Tuple[float, float]]:
+    for name in sorted(MODEL_PRICES, key=len, reverse=True):
+        if model.startswith(name):
+            return MODEL_PRICES[name]
+    return None
+
+
+@dataclass(frozen=True)
+class ModelTier:
+    model: str
+    # Inputs up to this many (estimated) tokens start here; ``None`` for the last tier.
+    max_input_tokens: Optional[int] = None
+
+
+def parse_tiers(spec: str, default_model: str) -> List[ModelTier]:
+    """``"gpt-4o-mini:8000,gpt-4o"`` as tiers, smallest first.
+
+    Every tier but the last needs a token limit, and the limits must increase.
+    An empty ``spec`` is ``default_model`` alone.
+    """
+    tiers: List[ModelTier] = []
+    for part in (part.strip() for part in spec.split(",")):
+        if not part:
+            continue
+        model, _, limit = part.partition(":")
+        try:
+            max_input_tokens = int(limit) if limit else None
+        except ValueError:
+            raise ValueError(f"Invalid token limit in model tier {part!r}") from None
+        tiers.append(ModelTier(model=model.strip(), max_input_tokens=max_input_tokens))
+    if not tiers:
+        return [ModelTier(model=default_model)]
+    limits = [tier.max_input_tokens for tier in tiers[:-1]]
+    if None in limits or limits != sorted(set(limits)):
+        raise ValueError(
+            "Every model tier but the last needs a token limit, in increasing order."
+        )
+    if len({tier.model for tier in tiers}) != len(tiers):
+        raise ValueError("Model tiers must use different models.")
+    return tiers
+
+
+class ModelRouter:
+    """Picks the model tier for an analysis and records what each tier cost.
+
+    A request starts at the first tier whose limit covers its input tokens;
+    ``detail="low"`` starts one tier smaller and ``"high"`` one tier larger.
+    The caller moves to the next tier when a reply is not valid JSON. Per tier
+    the stats count routed requests, calls, API errors, invalid replies and
+    fallbacks, plus latency, token usage and the estimated cost.
+    """
+
+    def __init__(self, tiers: Sequence[ModelTier], *, config_error: Optional[str] = None) -> None:
+        if not tiers:
+            raise ValueError("At least one model tier is required.")
+        self.tiers = list(tiers)
+        # Why the configured tiers were not used, if they were not.
+        self.config_error = config_error
+        self._lock = threading.Lock()
+        self._stats: List[Dict] = [
+            {
+                "routed": 0,
+                "input_tokens": 0,
+                "calls": 0,
+                "errors": 0,
+                "invalid_json": 0,
+                "fallbacks": 0,
+                "total_latency_ms": 0.0,
+                "max_latency_ms": 0.0,
+                "prompt_tokens": 0,
+                "completion_tokens": 0,
+                "cost_usd": 0.0,
+            }
+            for _ in self.tiers
+        ]
+
+    def route(self, input_tokens: int, detail: str = "standard") -> int:
+        """Position of the tier a request of ``input_tokens`` starts at."""
+        if detail not in DETAIL_LEVELS:
+            raise ValueError(f"Unknown detail level: {detail!r}")
+        position = next(
+            (
+                position
+                for position, tier in enumerate(self.tiers)
+                if tier.max_input_tokens is None or input_tokens <= tier.max_input_tokens
+            ),
+            len(self.tiers) - 1,
+        )
+        position += {"low": -1, "standard": 0, "high": 1}[detail]
+        position = min(max(position, 0), len(self.tiers) - 1)
+        with self._lock:
+            self._stats[position]["routed"] += 1
+            self._stats[position]["input_tokens"] += input_tokens
+        return position
+
+    def record(
+        self,
+        position: int,
+        *,
+        latency_ms: float,
+        prompt_tokens: int = 0,
+        completion_tokens: int = 0,
+        error: bool = False,
+        valid_json: bool = True,
+        fell_back: bool = False,
+    ) -> None:
+        """Record one call to tier ``position``."""
+        price = model_price(self.tiers[position].model)
+        with self._lock:
+            stats = self._stats[position]
+            stats["calls"] += 1
+            stats["errors"] += error
+            stats["invalid_json"] += not error and not valid_json
+            stats["fallbacks"] += fell_back
+            stats["total_latency_ms"] += latency_ms
+            stats["max_latency_ms"] = max(stats["max_latency_ms"], latency_ms)
+            stats["prompt_tokens"] += prompt_tokens
+            stats["completion_tokens"] += completion_tokens
+            if price is not None:
+                stats["cost_usd"] += (
+                    prompt_tokens * price[0] + completion_tokens * price[1]
+                ) / 1_000_000
+
+    def stats(self) -> Dict:
+        with self._lock:
+            snapshot = [dict(stats) for stats in self._stats]
+        tiers = []
+        for tier, stats in zip(self.tiers, snapshot):
+            calls = stats["calls"]
+            priced = model_price(tier.model) is not None
+            tiers.append(
+                {
+                    "model": tier.model,
+                    "max_input_tokens": tier.max_input_tokens,
+                    **stats,
+                    "cost_usd": round(stats["cost_usd"], 6) if priced else None,
+                    "mean_latency_ms": stats["total_latency_ms"] / calls if calls else None,
+                    "mean_input_tokens": (
+                        stats["input_tokens"] / stats["routed"] if stats["routed"] else None
+                    ),
+                    "fallback_rate": stats["fallbacks"] / calls if calls else None,
+                }
+            )
+        return {"tiers": tiers, "config_error": self.config_error}
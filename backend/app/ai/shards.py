@@ -0,0 +1,325 @@
+"""One textbook index per subject directory, with query routing between them."""
+from __future__ import annotations
+
+import threading
+from pathlib import Path
+from typing import Any, Dict, List, Optional, Sequence, Tuple
+
+import numpy as np
+
+from .lexical import reciprocal_rank_fusion, topic_tokens
+from .metadata_index import ChunkFilter
+from .rag import TextbookRAG
+from .snapshot import SNAPSHOT_SUFFIX
+
+
+def discover_subjects(textbook_dir: str | Path) -> List[str]:
+    """Names of the subdirectories of ``textbook_dir`` that contain PDFs."""
+    root = Path(textbook_dir)
+    if not root.is_dir():
+        return []
+    return sorted(
+        child.name
+        for child in root.iterdir()
+        if child.is_dir() and any(child.glob("*.pdf"))
+    )
+
+
+class ShardedRAG:
+    """Per-subject :class:`TextbookRAG` shards behind the ``TextbookRAG`` interface.
+
+    ``<textbook_dir>/<subject>/*.pdf`` is indexed into
+    ``<persist_directory>/<subject>`` with its own versions, builds and
+    rollbacks. Searches go to the ``subject`` given, or to the shards picked by
+    :meth:`route`; results carry a ``subject`` field. Snapshots are one
+    ``<subject>.ragsnap`` file per shard in the ``snapshot_path`` directory.
+    """
+
+    def __init__(
+        self,
+        *,
+        textbook_dir: str | Path,
+        persist_directory: str | Path,
+        max_routed: int = 2,
+        route_margin: float = 0.5,
+        snapshot_path: Optional[str | Path] = None,
+        **options: Any,
+    ) -> None:
+        self.textbook_dir = Path(textbook_dir)
+        self.persist_directory = Path(persist_directory)
+        self.subjects = discover_subjects(self.textbook_dir)
+        if not self.subjects:
+            raise ValueError(f"No subject directories with PDFs under {self.textbook_dir}")
+        self.shards: Dict[str, TextbookRAG] = {
+            subject: TextbookRAG(
+                textbook_dir=self.textbook_dir / subject,
+                persist_directory=self.persist_directory / subject,
+                snapshot_path=snapshot_path and self._snapshot_file(snapshot_path, subject),
+                **options,
+            )
+            for subject in self.subjects
+        }
+        # Queries go to the best shard plus any whose mean per-token log
+        # likelihood is within ``route_margin`` of it, at most ``max_routed``.
+        self.max_routed = max_routed
+        self.route_margin = route_margin
+        # Subjects last reported as skipped by routing for lack of an index.
+        self._unindexed: List[str] = []
+
+    @staticmethod
+    def _snapshot_file(directory: str | Path, subject: str) -> Path:
+        return Path(directory) / f"{subject}{SNAPSHOT_SUFFIX}"
+
+    def shard(self, subject: str) -> TextbookRAG:
+        try:
+            return self.shards[subject]
+        except KeyError:
+            raise ValueError(f"Unknown subject: {subject!r}") from None
+
+    # ------------------------------------------------------------------
+    # Routing
+    # ------------------------------------------------------------------
+    def indexed_subjects(self) -> List[str]:
+        """Subjects whose index is loaded or on disk.
+
+        Routing only considers these, so a query never builds (and embeds) a
+        shard; the others are logged once until they get an index.
+        """
+        indexed = [subject for subject in self.subjects if self.shards[subject].has_index]
+        unindexed = [subject for subject in self.subjects if subject not in indexed]
+        if unindexed != self._unindexed:
+            self._unindexed = unindexed
+            if unindexed:
+                print(f"Routing skips subjects without an index: {', '.join(unindexed)}")
+        return indexed
+
+    def route_scores(self, text: str) -> Dict[str, float]:
+        """Naive Bayes log likelihood of ``text`` per shard, averaged over its tokens.
+
+        Each shard is modelled by the chunk frequencies of its BM25 index
+        (add-one smoothed); tokens unknown to every shard are ignored. Shards
+        without a lexical index, or without any index yet, are left out, and
+        the result is empty when no token is known.
+        """
+        tokens = sorted(topic_tokens(text))
+        lexicals = {
+            subject: index.lexical
+            for subject, index in (
+                (s, self.shards[s]._ensure_index()) for s in self.indexed_subjects()
+            )
+            if index.lexical is not None
+        }
+        if not tokens or not lexicals:
+            return {}
+        freqs = {subject: lexical.doc_freqs(tokens) for subject, lexical in lexicals.items()}
+        known = np.any(np.stack(list(freqs.values())) > 0, axis=0)
+        if not known.any():
+            return {}
+        return {
+            subject: float(np.mean(np.log((freqs[subject][known] + 1) / (lexical.count + 2))))
+            for subject, lexical in lexicals.items()
+        }
+
+    def route(self, text: str, *, subject: Optional[str] = None) -> List[str]:
+        """Subjects to search for ``text``, most likely first."""
+        if subject is not None:
+            self.shard(subject)
+            return [subject]
+        if len(self.subjects) == 1:
+            return list(self.subjects)
+        indexed = self.indexed_subjects()
+        if not indexed:
+            raise ValueError(
+                "No subject has a vectorstore yet; build one with /ai/rag/build-vectorstore."
+            )
+        scores = self.route_scores(text)
+        # Indexed shards the classifier cannot judge are always searched.
+        unscored = [s for s in indexed if s not in scores]
+        if not scores:
+            return unscored
+        ranked = sorted(scores, key=scores.get, reverse=True)
+        best = scores[ranked[0]]
+        routed = [s for s in ranked if scores[s] >= best - self.route_margin][: self.max_routed]
+        return routed + unscored
+
+    # ------------------------------------------------------------------
+    # Retrieval
+    # ------------------------------------------------------------------
+    @staticmethod
+    def _merge(per_subject: Sequence[Tuple[str, List[Dict]]], k: int) -> List[Dict]:
+        tagged = [
+            [{**result, "subject": subject} for result in results]
+            for subject, results in per_subject
+        ]
+        if len(tagged) == 1:
+            return tagged[0][:k]
+        flat = [result for results in tagged for result in results]
+        if all(result["score"] is not None for result in flat):
+            # Same embedding model everywhere, so cosine distances compare across shards.
+            return sorted(flat, key=lambda result: result["score"])[:k]
+        offsets = np.cumsum([0] + [len(results) for results in tagged])
+        rankings = [
+            list(range(offset, offset + len(results)))
+            for offset, results in zip(offsets, tagged)
+        ]
+        return [flat[row] for row, _ in reciprocal_rank_fusion(rankings)[:k]]
+
+    def search_similar_content(
+        self,
+        query: str,
+        *,
+        k: int = 5,
+        mode: Optional[str] = None,
+        max_distance: Optional[float] = None,
+        filters: Optional[ChunkFilter] = None,
+        subject: Optional[str] = None,
+    ) -> List[Dict]:
+        per_subject = [
+            (
+                routed,
+                self.shards[routed].search_similar_content(
+                    query, k=k, mode=mode, max_distance=max_distance, filters=filters
+                ),
+            )
+            for routed in self.route(query, subject=subject)
+        ]
+        return self._merge(per_subject, k)
+
+    def search_similar_content_batch(
+        self,
+        queries: Sequence[str],
+        *,
+        k: int = 5,
+        mode: Optional[str] = None,
+        max_distance: Optional[float] = None,
+        filters: Optional[ChunkFilter] = None,
+        subject: Optional[str] = None,
+    ) -> List[List[Dict]]:
+        """Route every query, then run one batched search per shard."""
+        routes = [self.route(query, subject=subject) for query in queries]
+        positions: Dict[str, List[int]] = {}
+        for position, routed in enumerate(routes):
+            for name in routed:
+                positions.setdefault(name, []).append(position)
+        found: Dict[Tuple[str, int], List[Dict]] = {}
+        for name, members in positions.items():
+            batch = self.shards[name].search_similar_content_batch(
+                [queries[position] for position in members],
+                k=k,
+                mode=mode,
+                max_distance=max_distance,
+                filters=filters,
+            )
+            for position, results in zip(members, batch):
+                found[name, position] = results
+        return [
+            self._merge([(name, found[name, position]) for name in routed], k)
+            for position, routed in enumerate(routes)
+        ]
+
+    def query(
+        self,
+        question: str,
+        *,
+        openai_api_key: Optional[str] = None,
+        subject: Optional[str] = None,
+        task_id: Optional[str] = None,
+    ) -> Dict:
+        """Answer ``question`` from the single most likely subject.
+
+        A ``task_id`` with a stored context pins the question to that task's shard.
+        """
+        if subject is None and task_id is not None:
+            subject = next(
+                (name for name, shard in self.shards.items() if shard.has_task_context(task_id)),
+                None,
+            )
+        routed = self.route(question, subject=subject)[0]
+        answer = self.shards[routed].query(
+            question, openai_api_key=openai_api_key, task_id=task_id
+        )
+        return {**answer, "subject": routed}
+
+    def analyze_quiz(self, quiz_text: str, *, subject: Optional[str] = None) -> Dict:
+        routed = self.route(quiz_text, subject=subject)[0]
+        return {**self.shards[routed].analyze_quiz(quiz_text), "subject": routed}
+
+    # ------------------------------------------------------------------
+    # Maintenance
+    # ------------------------------------------------------------------
+    @property
+    def is_building(self) -> bool:
+        return any(shard.is_building for shard in self.shards.values())
+
+    @property
+    def version(self) -> Dict[str, Optional[str]]:
+        return {subject: shard.version for subject, shard in self.shards.items()}
+
+    def build_vectorstore(self, *, force_rebuild: bool = False) -> None:
+        """Load or build every shard; one failing subject does not stop the others."""
+        errors = []
+        for subject, shard in self.shards.items():
+            try:
+                shard.build_vectorstore(force_rebuild=force_rebuild)
+            except Exception as exc:
+                errors.append(f"{subject}: {exc}")
+        if errors:
+            raise ValueError("; ".join(errors))
+
+    def try_start_build(self, *, force_rebuild: bool = False) -> bool:
+        """Claim every shard's build and run them in a background thread;
+        ``False`` when any shard is already building."""
+        claimed = []
+        for shard in self.shards.values():
+            if not shard._claim_build():
+                for other in claimed:
+                    other._release_build()
+                return False
+            claimed.append(shard)
+        threading.Thread(
+            target=self._build_claimed_shards,
+            kwargs={"force_rebuild": force_rebuild},
+            name="rag-build",
+            daemon=True,
+        ).start()
+        return True
+
+    def _build_claimed_shards(self, *, force_rebuild: bool) -> None:
+        for subject, shard in self.shards.items():
+            try:
+                shard._run_claimed_build(force_rebuild=force_rebuild)
+            except Exception as exc:
+                print(f"Vectorstore build failed for {subject}: {exc}")
+
+    def build_digests(self) -> Dict:
+        return {subject: shard.build_digests() for subject, shard in self.shards.items()}
+
+    def rollback(self) -> str:
+        raise ValueError("Pass a subject to roll back one shard.")
+
+    def export_snapshot(self, directory: str | Path) -> Dict:
+        return {
+            subject: shard.export_snapshot(self._snapshot_file(directory, subject))
+            for subject, shard in self.shards.items()
+        }
+
+    def import_snapshot(self, directory: str | Path) -> Dict:
+        return {
+            subject: shard.import_snapshot(self._snapshot_file(directory, subject))
+            for subject, shard in self.shards.items()
+        }
+
+    def status(self) -> Dict:
+        shards = {subject: shard.status() for subject, shard in self.shards.items()}
+        states = {status["state"] for status in shards.values()}
+        state = next(
+            (s for s in ("building", "failed") if s in states),
+            "ready" if states == {"ready"} else "idle",
+        )
+        return {"state": state, "shards": shards}
+
+    def cache_stats(self) -> Dict:
+        return {subject: shard.cache_stats() for subject, shard in self.shards.items()}
+
+    def warm_up(self, probe: str) -> Dict:
+        return {subject: shard.warm_up(probe) for subject, shard in self.shards.items()}
@@ -0,0 +1,216 @@
+"""Single-file, checksummed snapshots of one RAG index version.
+
+A snapshot is a deflate-compressed zip holding the chunk embeddings
+(``embeddings.npy``, float32), the chunk texts and metadata (``chunks.jsonl``,
+one chunk per line in row order), the backend-independent side files of the
+version directory (BM25 postings, metadata index, dedup provenance, quiz-topic
+index, chapter digests) and ``manifest.json`` with the format number, the
+source version and a SHA-256 per member. Importing re-creates the index for the configured backend
+from the stored embeddings, so a new replica needs no embedding calls.
+
+Run from ``backend/`` with the usual RAG settings::
+
+    python -m app.ai.snapshot export /tmp/textbooks.ragsnap
+    python -m app.ai.snapshot import /tmp/textbooks.ragsnap
+    python -m app.ai.snapshot cold-start /tmp/textbooks.ragsnap
+
+With ``RAG_SHARD_BY_SUBJECT`` the path is a directory holding one
+``<subject>.ragsnap`` per shard.
+"""
+from __future__ import annotations
+
+import argparse
+import hashlib
+import io
+import json
+import os
+import sys
+import tempfile
+import time
+import zipfile
+from datetime import datetime, timezone
+from pathlib import Path
+from typing import Dict, List, NamedTuple, Optional, Sequence
+
+import numpy as np
+
+from .dedup import PROVENANCE_FILE
+from .digests import DIGESTS_FILE
+from .lexical import POSTINGS_FILE, VOCAB_FILE
+from .metadata_index import METADATA_INDEX_FILE
+from .quiz_index import QUIZ_INDEX_FILE
+
+SNAPSHOT_FORMAT = 1
+SNAPSHOT_SUFFIX = ".ragsnap"
+MANIFEST_FILE = "manifest.json"
+EMBEDDINGS_FILE = "embeddings.npy"
+CHUNKS_FILE = "chunks.jsonl"
+# Written last into a version directory installed from a snapshot.
+INSTALLED_FILE = "snapshot_installed.json"
+# Version-directory files that do not depend on the vector backend; copied as-is.
+SIDE_FILES = (
+    POSTINGS_FILE,
+    VOCAB_FILE,
+    METADATA_INDEX_FILE,
+    PROVENANCE_FILE,
+    QUIZ_INDEX_FILE,
+    DIGESTS_FILE,
+)
+
+
+class Snapshot(NamedTuple):
+    manifest: Dict
+    texts: List[str]
+    metadatas: List[Dict]
+    vectors: np.ndarray
+    side_files: Dict[str, bytes]
+
+
+def _sha256(data: bytes) -> str:
+    return hashlib.sha256(data).hexdigest()
+
+
+def write_snapshot(
+    path: str | Path,
+    *,
+    version: str,
+    texts: Sequence[str],
+    metadatas: Sequence[Dict],
+    vectors: np.ndarray,
+    directory: str | Path,
+    info: Optional[Dict] = None,
+) -> Dict:
+    """Write one index version to ``path`` (atomically replaced); returns the manifest."""
+    if len(texts) != len(metadatas) or len(texts) != len(vectors):
+        raise ValueError("Snapshot texts, metadata and embeddings differ in length.")
+    buffer = io.BytesIO()
+    np.save(buffer, np.ascontiguousarray(vectors, dtype=np.float32))
+    members = {
+        EMBEDDINGS_FILE: buffer.getvalue(),
+        CHUNKS_FILE: "".join(
+            json.dumps({"text": text, "metadata": metadata}, ensure_ascii=False) + "\n"
+            for text, metadata in zip(texts, metadatas)
+        ).encode("utf-8"),
+    }
+    for name in SIDE_FILES:
+        side_path = Path(directory) / name
+        if side_path.exists():
+            members[name] = side_path.read_bytes()
+    manifest = {
+        "format": SNAPSHOT_FORMAT,
+        "version": version,
+        "created_at": datetime.now(timezone.utc).isoformat(),
+        "count": len(texts),
+        "dim": int(vectors.shape[1]) if len(vectors) else 0,
+        **(info or {}),
+        "files": {
+            name: {"sha256": _sha256(data), "bytes": len(data)} for name, data in members.items()
+        },
+    }
+    path = Path(path)
+    path.parent.mkdir(parents=True, exist_ok=True)
+    tmp_path = path.with_name(f".{path.name}.tmp")
+    with zipfile.ZipFile(tmp_path, "w", compression=zipfile.ZIP_DEFLATED) as archive:
+        for name, data in members.items():
+            archive.writestr(name, data)
+        archive.writestr(MANIFEST_FILE, json.dumps(manifest, indent=2))
+    os.replace(tmp_path, path)
+    return manifest
+
+
+def read_manifest(path: str | Path) -> Dict:
+    with zipfile.ZipFile(path) as archive:
+        manifest = json.loads(archive.read(MANIFEST_FILE))
+    if manifest.get("format") != SNAPSHOT_FORMAT:
+        raise ValueError(f"Unsupported snapshot format: {manifest.get('format')!r}")
+    return manifest
+
+
+def read_snapshot(path: str | Path) -> Snapshot:
+    """Read and verify a snapshot; raises ``ValueError`` if any member is corrupt."""
+    try:
+        with zipfile.ZipFile(path) as archive:
+            manifest = json.loads(archive.read(MANIFEST_FILE))
+            if manifest.get("format") != SNAPSHOT_FORMAT:
+                raise ValueError(f"Unsupported snapshot format: {manifest.get('format')!r}")
+            members = {name: archive.read(name) for name in manifest["files"]}
+    except (zipfile.BadZipFile, KeyError) as exc:
+        raise ValueError(f"Not a RAG snapshot: {path}") from exc
+    for name, data in members.items():
+        if _sha256(data) != manifest["files"][name]["sha256"]:
+            raise ValueError(f"Snapshot checksum mismatch for {name}")
+    chunks = [json.loads(line) for line in members.pop(CHUNKS_FILE).decode("utf-8").splitlines()]
+    vectors = np.load(io.BytesIO(members.pop(EMBEDDINGS_FILE)))
+    return Snapshot(
+        manifest=manifest,
+        texts=[chunk["text"] for chunk in chunks],
+        metadatas=[chunk["metadata"] for chunk in chunks],
+        vectors=vectors,
+        side_files=members,
+    )
+
+
+def cold_start(path: str | Path, **options) -> Dict:
+    """Time a new replica coming up from ``path``: import into an empty persist
+    directory, then answer a first search (probed with a stored embedding, so
+    no provider call). ``options`` are :class:`TextbookRAG` arguments.
+    """
+    from .rag import TextbookRAG
+
+    with tempfile.TemporaryDirectory() as tmp:
+        started = time.perf_counter()
+        rag = TextbookRAG(persist_directory=tmp, snapshot_path=path, **options)
+        init_ms = (time.perf_counter() - started) * 1000
+        index = rag._ensure_index()
+        ready_ms = (time.perf_counter() - started) * 1000
+        probe = rag._probe_vector(index.store)
+        query_started = time.perf_counter()
+        rag._nearest_rows(index.store, [probe], 5)
+        first_query_ms = (time.perf_counter() - query_started) * 1000
+        return {
+            "version": index.version,
+            "backend": rag.index_backend,
+            "snapshot_bytes": Path(path).stat().st_size,
+            "init_ms": init_ms,
+            **rag.build_status.get("snapshot", {}),
+            "ready_ms": ready_ms,
+            "first_query_ms": first_query_ms,
+        }
+
+
+def main(argv: Sequence[str] | None = None) -> int:
+    parser = argparse.ArgumentParser(prog="python -m app.ai.snapshot")
+    parser.add_argument("command", choices=("export", "import", "cold-start"))
+    parser.add_argument("path")
+    args = parser.parse_args(argv)
+
+    from ..config import settings
+    from .analysis import AssignmentAIService
+
+    if args.command == "cold-start":
+        # Same settings as the API, but an empty persist directory.
+        options = AssignmentAIService._rag_options()
+        options.pop("persist_directory")
+        options.pop("snapshot_path")
+        if not settings.RAG_SHARD_BY_SUBJECT:
+            report = cold_start(args.path, **options)
+        else:
+            from .shards import discover_subjects
+
+            report = {
+                subject: cold_start(Path(args.path) / f"{subject}{SNAPSHOT_SUFFIX}", **options)
+                for subject in discover_subjects(settings.RAG_TEXTBOOK_DIR)
+            }
+    else:
+        rag = AssignmentAIService._create_rag()
+        if args.command == "export":
+            rag.build_vectorstore()
+            report = rag.export_snapshot(args.path)
+        else:
+            report = rag.import_snapshot(args.path)
+    print(json.dumps(report, indent=2, default=str))
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,391 @@
+"""In-process NumPy vector index used as a lightweight alternative to Chroma."""
+from __future__ import annotations
+
+import json
+from pathlib import Path
+from typing import Any, Iterable, List, Optional, Sequence, Tuple
+
+import numpy as np
+from langchain_core.documents import Document
+from langchain_core.embeddings import Embeddings
+from langchain_core.vectorstores import VectorStore
+
+VECTORS_FILE = "vectors.npy"
+SCALES_FILE = "scales.npy"
+FULL_VECTORS_FILE = "vectors_f32.npy"
+CHUNK_META_FILE = "chunk_meta.npy"
+CHUNKS_FILE = "chunks.json"
+TEXTS_FILE = "texts.bin"
+TEXT_OFFSETS_FILE = "text_offsets.npy"
+
+# start/end: character offsets of the chunk within its page (-1 if unknown).
+CHUNK_META_DTYPE = np.dtype([("source", "<i4"), ("page", "<i4"), ("start", "<i4"), ("end", "<i4")])
+STORAGE_DTYPES = ("float32", "float16", "int8")
+# Rows scored per block when the stored matrix must be widened to float32.
+SCORE_BLOCK_ROWS = 8192
+
+
+def normalize_rows(matrix: np.ndarray) -> np.ndarray:
+    norms = np.linalg.norm(matrix, axis=1, keepdims=True)
+    norms[norms == 0] = 1.0
+    return matrix / norms
+
+
+def quantize(matrix: np.ndarray, dtype: str) -> Tuple[np.ndarray, Optional[np.ndarray]]:
+    """Convert normalised float32 rows to ``dtype``; int8 also returns per-row scales."""
+    if dtype == "float32":
+        return matrix, None
+    if dtype == "float16":
+        return matrix.astype(np.float16), None
+    if dtype == "int8":
+        scales = np.abs(matrix).max(axis=1) / 127.0
+        scales[scales == 0] = 1.0
+        quantized = np.rint(matrix / scales[:, None]).astype(np.int8)
+        return quantized, scales.astype(np.float32)
+    raise ValueError(f"Unsupported index storage dtype: {dtype!r}")
+
+
+def top_k_indices(scores: np.ndarray, k: int) -> np.ndarray:
+    """Indices of the ``k`` highest scores, best first, without a full sort."""
+    k = min(k, scores.shape[0])
+    if k <= 0:
+        return np.empty(0, dtype=np.int64)
+    if k < scores.shape[0]:
+        candidates = np.argpartition(-scores, k - 1)[:k]
+    else:
+        candidates = np.arange(scores.shape[0])
+    return candidates[np.argsort(-scores[candidates], kind="stable")]
+
+
+class ChunkTexts:
+    """Read-only sequence of chunk texts backed by a memory-mapped UTF-8 blob."""
+
+    def __init__(self, blob: np.ndarray, offsets: np.ndarray) -> None:
+        self._blob = blob
+        self._offsets = offsets
+
+    @staticmethod
+    def save(directory: Path, texts: Sequence[str]) -> None:
+        encoded = [text.encode("utf-8") for text in texts]
+        offsets = np.zeros(len(encoded) + 1, dtype=np.int64)
+        np.cumsum([len(data) for data in encoded], out=offsets[1:])
+        (directory / TEXTS_FILE).write_bytes(b"".join(encoded))
+        np.save(directory / TEXT_OFFSETS_FILE, offsets)
+
+    @classmethod
+    def load(cls, directory: Path) -> "ChunkTexts":
+        offsets = np.load(directory / TEXT_OFFSETS_FILE, mmap_mode="r")
+        path = directory / TEXTS_FILE
+        # np.memmap cannot map an empty file.
+        blob = (
+            np.memmap(path, dtype=np.uint8, mode="r")
+            if path.stat().st_size
+            else np.zeros(0, dtype=np.uint8)
+        )
+        return cls(blob, offsets)
+
+    def __len__(self) -> int:
+        return int(self._offsets.shape[0]) - 1
+
+    def __getitem__(self, row: int) -> str:
+        start, end = int(self._offsets[row]), int(self._offsets[row + 1])
+        return self._blob[start:end].tobytes().decode("utf-8")
+
+
+class NumpyVectorIndex(VectorStore):
+    """Exact cosine-similarity search over a contiguous float32 matrix.
+
+    Embeddings are L2-normalised at build time and persisted as ``vectors.npy``,
+    which is opened memory-mapped and read-only so loading is effectively free
+    and every worker process shares the same page-cache copy. Per-chunk
+    source/page ids live in a small structured array next to it, chunk texts in
+    one UTF-8 blob addressed by an offsets array (also memory-mapped), and the
+    source-name table in ``chunks.json``. Scores returned by the
+    ``*_with_score`` methods are cosine distances (``1 - cosine similarity``).
+
+    The matrix can be stored as float16 or per-row-scaled int8 to cut memory.
+    Quantized builds keep a float32 copy in ``vectors_f32.npy``; when
+    ``rescore`` is set, the best ``rescore`` candidates are re-ranked against it,
+    which only pages in those rows.
+    """
+
+    def __init__(
+        self,
+        *,
+        directory: str | Path,
+        embedding: Embeddings,
+        vectors: np.ndarray,
+        chunk_meta: np.ndarray,
+        texts: ChunkTexts,
+        sources: List[str],
+        scales: Optional[np.ndarray] = None,
+        full_vectors: Optional[np.ndarray] = None,
+        rescore: int = 0,
+    ) -> None:
+        self.directory = Path(directory)
+        self._embedding = embedding
+        self.vectors = vectors
+        self.scales = scales
+        self.full_vectors = full_vectors
+        self.rescore = rescore
+        self.chunk_meta = chunk_meta
+        self.texts = texts
+        self.sources = sources
+
+    # ------------------------------------------------------------------
+    # Persistence
+    # ------------------------------------------------------------------
+    @classmethod
+    def load(
+        cls, directory: str | Path, embedding: Embeddings, *, rescore: int = 0
+    ) -> "NumpyVectorIndex":
+        directory = Path(directory)
+        vectors = np.load(directory / VECTORS_FILE, mmap_mode="r")
+        scales_path = directory / SCALES_FILE
+        full_path = directory / FULL_VECTORS_FILE
+        chunk_meta = np.load(directory / CHUNK_META_FILE, mmap_mode="r")
+        payload = json.loads((directory / CHUNKS_FILE).read_text(encoding="utf-8"))
+        return cls(
+            directory=directory,
+            embedding=embedding,
+            vectors=vectors,
+            chunk_meta=chunk_meta,
+            texts=ChunkTexts.load(directory),
+            sources=payload["sources"],
+            scales=np.load(scales_path, mmap_mode="r") if scales_path.exists() else None,
+            full_vectors=np.load(full_path, mmap_mode="r") if full_path.exists() else None,
+            rescore=rescore,
+        )
+
+    @staticmethod
+    def exists(directory: str | Path) -> bool:
+        return (Path(directory) / VECTORS_FILE).exists()
+
+    @classmethod
+    def from_embeddings(
+        cls,
+        texts: Sequence[str],
+        vectors: np.ndarray | Sequence[Sequence[float]],
+        metadatas: Sequence[dict],
+        *,
+        directory: str | Path,
+        embedding: Embeddings,
+        dtype: str = "float32",
+        rescore: int = 0,
+    ) -> "NumpyVectorIndex":
+        directory = Path(directory)
+        directory.mkdir(parents=True, exist_ok=True)
+        matrix = normalize_rows(np.ascontiguousarray(vectors, dtype=np.float32))
+        stored, scales = quantize(matrix, dtype)
+
+        source_ids: dict = {}
+        chunk_meta = np.zeros(len(texts), dtype=CHUNK_META_DTYPE)
+        for row, metadata in enumerate(metadatas):
+            source = str(metadata.get("source", "unknown"))
+            chunk_meta[row]["source"] = source_ids.setdefault(source, len(source_ids))
+            page = metadata.get("page")
+            chunk_meta[row]["page"] = page if isinstance(page, int) else -1
+            chunk_meta[row]["start"] = metadata.get("start", -1)
+            chunk_meta[row]["end"] = metadata.get("end", -1)
+
+        np.save(directory / VECTORS_FILE, stored)
+        if scales is not None:
+            np.save(directory / SCALES_FILE, scales)
+        if dtype != "float32":
+            np.save(directory / FULL_VECTORS_FILE, matrix)
+        np.save(directory / CHUNK_META_FILE, chunk_meta)
+        ChunkTexts.save(directory, texts)
+        (directory / CHUNKS_FILE).write_text(
+            json.dumps({"sources": list(source_ids)}),
+            encoding="utf-8",
+        )
+        return cls.load(directory, embedding, rescore=rescore)
+
+    @classmethod
+    def from_documents(
+        cls,
+        documents: List[Document],
+        embedding: Embeddings,
+        *,
+        directory: str | Path,
+        dtype: str = "float32",
+        rescore: int = 0,
+        **kwargs: Any,
+    ) -> "NumpyVectorIndex":
+        texts = [doc.page_content for doc in documents]
+        vectors = embedding.embed_documents(texts) if texts else np.zeros((0, 1))
+        return cls.from_embeddings(
+            texts,
+            vectors,
+            [doc.metadata for doc in documents],
+            directory=directory,
+            embedding=embedding,
+            dtype=dtype,
+            rescore=rescore,
+        )
+
+    @classmethod
+    def from_texts(
+        cls,
+        texts: List[str],
+        embedding: Embeddings,
+        metadatas: Optional[List[dict]] = None,
+        *,
+        directory: str | Path,
+        **kwargs: Any,
+    ) -> "NumpyVectorIndex":
+        metadatas = metadatas or [{} for _ in texts]
+        documents = [
+            Document(page_content=text, metadata=metadata)
+            for text, metadata in zip(texts, metadatas)
+        ]
+        return cls.from_documents(documents, embedding, directory=directory, **kwargs)
+
+    def add_texts(
+        self,
+        texts: Iterable[str],
+        metadatas: Optional[List[dict]] = None,
+        **kwargs: Any,
+    ) -> List[str]:
+        raise NotImplementedError("NumpyVectorIndex is immutable; rebuild the index instead.")
+
+    # ------------------------------------------------------------------
+    # Search
+    # ------------------------------------------------------------------
+    @property
+    def embeddings(self) -> Embeddings:
+        return self._embedding
+
+    @property
+    def count(self) -> int:
+        return int(self.vectors.shape[0])
+
+    @property
+    def dtype(self) -> str:
+        return str(self.vectors.dtype)
+
+    @property
+    def nbytes(self) -> int:
+        """Bytes of the matrix searched on every query (excludes the rescoring copy)."""
+        return int(self.vectors.nbytes + (self.scales.nbytes if self.scales is not None else 0))
+
+    def _scores(self, queries: np.ndarray, rows: Optional[np.ndarray] = None) -> np.ndarray:
+        """Similarity of every row (or only ``rows``) to each column of ``queries`` (dim, m)."""
+        count = self.count if rows is None else len(rows)
+        if self.vectors.dtype == np.float32 and rows is None:
+            return self.vectors @ queries
+        scores = np.empty((count, queries.shape[1]), dtype=np.float32)
+        for start in range(0, count, SCORE_BLOCK_ROWS):
+            if rows is None:
+                block = self.vectors[start : start + SCORE_BLOCK_ROWS]
+            else:
+                # Gathering from the memory map only pages in the selected rows.
+                block = self.vectors[rows[start : start + SCORE_BLOCK_ROWS]]
+            scores[start : start + len(block)] = block.astype(np.float32) @ queries
+        if self.scales is not None:
+            scores *= (self.scales if rows is None else self.scales[rows])[:, None]
+        return scores
+
+    def _top_rows(
+        self,
+        scores: np.ndarray,
+        query: np.ndarray,
+        k: int,
+        min_similarity: Optional[float] = None,
+        rows: Optional[np.ndarray] = None,
+    ) -> List[Tuple[int, float]]:
+        # ``scores[i]`` belongs to row ``rows[i]`` (row ``i`` when ``rows`` is None).
+        # The cutoff is applied before top-k selection, so a strict threshold
+        # shrinks the candidate set instead of filtering a full result list.
+        if min_similarity is not None:
+            eligible = np.flatnonzero(scores >= min_similarity)
+            scores = scores[eligible]
+            rows = eligible if rows is None else rows[eligible]
+        if self.rescore and self.full_vectors is not None:
+            candidates = top_k_indices(scores, max(k, self.rescore))
+            candidate_rows = candidates if rows is None else rows[candidates]
+            exact = self.full_vectors[candidate_rows] @ query
+            order = np.argsort(-exact, kind="stable")[:k]
+            return [
+                (int(candidate_rows[i]), float(exact[i]))
+                for i in order
+                if min_similarity is None or exact[i] >= min_similarity
+            ]
+        top = top_k_indices(scores, k)
+        top_rows = top if rows is None else rows[top]
+        return [(int(row), float(score)) for row, score in zip(top_rows, scores[top])]
+
+    def document(self, row: int) -> Document:
+        meta = self.chunk_meta[row]
+        page = int(meta["page"])
+        metadata = {
+            "source": self.sources[int(meta["source"])],
+            "page": page if page >= 0 else "unknown",
+            "chunk_id": int(row),
+        }
+        # Indexes built before page offsets were recorded lack these fields.
+        if "start" in meta.dtype.names and meta["start"] >= 0:
+            metadata["start"] = int(meta["start"])
+            metadata["end"] = int(meta["end"])
+        return Document(page_content=self.texts[row], metadata=metadata)
+
+    def search_rows(
+        self,
+        vector: Sequence[float],
+        k: int,
+        *,
+        max_distance: Optional[float] = None,
+        rows: Optional[np.ndarray] = None,
+    ) -> List[Tuple[int, float]]:
+        """Return ``(row, cosine similarity)`` pairs for the ``k`` nearest chunks.
+
+        With ``max_distance`` only chunks within that cosine distance are
+        returned, so the result may hold fewer than ``k`` rows. With ``rows``
+        (e.g. from a metadata filter) only those rows are scored.
+        """
+        return self.search_rows_batch([vector], k, max_distance=max_distance, rows=rows)[0]
+
+    def search_rows_batch(
+        self,
+        vectors: Sequence[Sequence[float]],
+        k: int,
+        *,
+        max_distance: Optional[float] = None,
+        rows: Optional[np.ndarray] = None,
+    ) -> List[List[Tuple[int, float]]]:
+        """:meth:`search_rows` for many queries with a single matrix product."""
+        if self.count == 0 or len(vectors) == 0 or (rows is not None and len(rows) == 0):
+            return [[] for _ in vectors]
+        queries = normalize_rows(np.asarray(vectors, dtype=np.float32))
+        scores = self._scores(queries.T, rows)
+        min_similarity = None if max_distance is None else 1.0 - max_distance
+        return [
+            self._top_rows(scores[:, column], queries[column], k, min_similarity, rows)
+            for column in range(queries.shape[0])
+        ]
+
+    def similarity_search_by_vector_with_score(
+        self, embedding: Sequence[float], k: int = 4, *, max_distance: Optional[float] = None
+    ) -> List[Tuple[Document, float]]:
+        return [
+            (self.document(row), 1.0 - similarity)
+            for row, similarity in self.search_rows(embedding, k, max_distance=max_distance)
+        ]
+
+    def similarity_search_by_vector(
+        self, embedding: List[float], k: int = 4, **kwargs: Any
+    ) -> List[Document]:
+        return [doc for doc, _ in self.similarity_search_by_vector_with_score(embedding, k)]
+
+    def similarity_search_with_score(
+        self, query: str, k: int = 4, **kwargs: Any
+    ) -> List[Tuple[Document, float]]:
+        return self.similarity_search_by_vector_with_score(
+            self._embedding.embed_query(query), k
+        )
+
+    def similarity_search(self, query: str, k: int = 4, **kwargs: Any) -> List[Document]:
+        return [doc for doc, _ in self.similarity_search_with_score(query, k)]
+
+    def _select_relevance_score_fn(self):
+        return lambda distance: 1.0 - distance
@@ -0,0 +1,170 @@
+"""Versioned on-disk layout for RAG indexes (blue/green rebuilds)."""
+from __future__ import annotations
+
+import fcntl
+import json
+import os
+import shutil
+import threading
+from contextlib import contextmanager
+from datetime import datetime, timezone
+from pathlib import Path
+from typing import Dict, Iterator, List, Optional, Tuple
+
+ACTIVE_FILE = "ACTIVE"
+VERSIONS_DIR = "versions"
+LEGACY_VERSION = "legacy"
+# Held (``flock``) by the worker installing a snapshot; dot-prefixed, so not a legacy store.
+INSTALL_LOCK_FILE = ".install.lock"
+# Extracted quiz texts and embeddings, kept next to the versions (see ``quiz_corpus``).
+QUIZ_CORPUS_DIR = "quiz_corpus"
+
+
+class IndexVersions:
+    """Tracks index builds stored under ``<root>/versions/<version>``.
+
+    ``<root>/ACTIVE`` records the live version and the previously active ones
+    (newest first) so a bad build can be rolled back. The pointer file is
+    rewritten with ``os.replace`` so readers never observe a partial update, and
+    carries a ``generation`` counter that other worker processes poll to notice
+    that a different version became active.
+    """
+
+    def __init__(self, root: str | Path, *, keep: int = 3) -> None:
+        self.root = Path(root)
+        self.root.mkdir(parents=True, exist_ok=True)
+        self.versions_dir = self.root / VERSIONS_DIR
+        self.keep = max(keep, 1)
+        self._lock = threading.Lock()
+
+    # ------------------------------------------------------------------
+    # Pointer file
+    # ------------------------------------------------------------------
+    def _read_pointer(self) -> Dict:
+        path = self.root / ACTIVE_FILE
+        try:
+            data = json.loads(path.read_text(encoding="utf-8"))
+        except (FileNotFoundError, json.JSONDecodeError):
+            return {}
+        return data if isinstance(data, dict) else {}
+
+    def _write_pointer(self, data: Dict) -> None:
+        tmp_path = self.root / f".{ACTIVE_FILE}.tmp"
+        tmp_path.write_text(json.dumps(data), encoding="utf-8")
+        os.replace(tmp_path, self.root / ACTIVE_FILE)
+
+    def active(self) -> Optional[str]:
+        version = self._read_pointer().get("active")
+        if version:
+            return version
+        if self._has_legacy_store():
+            return LEGACY_VERSION
+        return None
+
+    def generation(self) -> int:
+        value = self._read_pointer().get("generation")
+        return value if isinstance(value, int) else 0
+
+    def history(self) -> List[str]:
+        history = self._read_pointer().get("history") or []
+        return [version for version in history if isinstance(version, str)]
+
+    def directory(self, version: str) -> Path:
+        if version == LEGACY_VERSION:
+            return self.root
+        return self.versions_dir / version
+
+    def active_directory(self) -> Optional[Path]:
+        version = self.active()
+        return self.directory(version) if version else None
+
+    def _has_legacy_store(self) -> bool:
+        # Stores built before versioning live directly in the persist root.
+        return any(
+            path.name not in {ACTIVE_FILE, VERSIONS_DIR, QUIZ_CORPUS_DIR}
+            and not path.name.startswith(".")
+            for path in self.root.iterdir()
+        )
+
+    # ------------------------------------------------------------------
+    # Lifecycle
+    # ------------------------------------------------------------------
+    def new_version(self, version: Optional[str] = None) -> Tuple[str, Path]:
+        """Create a version directory, named by build time unless ``version`` is given."""
+        version = version or datetime.now(timezone.utc).strftime("%Y%m%dT%H%M%S%fZ")
+        directory = self.versions_dir / version
+        directory.mkdir(parents=True, exist_ok=False)
+        return version, directory
+
+    def activate(self, version: str) -> None:
+        with self._lock:
+            pointer = self._read_pointer()
+            previous = pointer.get("active") or self.active()
+            history = [v for v in self.history() if v != version]
+            if previous and previous != version:
+                history.insert(0, previous)
+            self._write_pointer(
+                {
+                    "active": version,
+                    "history": history[: self.keep],
+                    "generation": pointer.get("generation", 0) + 1,
+                }
+            )
+            self._prune()
+
+    def touch(self, version: str) -> bool:
+        """Bump the generation if ``version`` is still active, so workers reload its files."""
+        with self._lock:
+            pointer = self._read_pointer()
+            if pointer.get("active") != version:
+                return False
+            self._write_pointer({**pointer, "generation": pointer.get("generation", 0) + 1})
+            return True
+
+    def previous(self) -> str:
+        """The version a rollback would switch to; nothing is written."""
+        for version in self.history():
+            if self.directory(version).exists():
+                return version
+        raise ValueError("No previous index version available for rollback.")
+
+    def activate_rollback(self, version: str) -> None:
+        """Point ``ACTIVE`` at ``version`` (from :meth:`previous`, once its store
+        was validated); it and the newer history entries are dropped."""
+        with self._lock:
+            pointer = self._read_pointer()
+            history = self.history()
+            if version not in history:
+                raise ValueError(f"Index version {version} is no longer in the rollback history.")
+            self._write_pointer(
+                {
+                    "active": version,
+                    "history": history[history.index(version) + 1 :],
+                    "generation": pointer.get("generation", 0) + 1,
+                }
+            )
+
+    @contextmanager
+    def install_lock(self) -> Iterator[None]:
+        """Exclusive across the worker processes sharing ``root``."""
+        with open(self.root / INSTALL_LOCK_FILE, "a") as handle:
+            fcntl.flock(handle, fcntl.LOCK_EX)
+            try:
+                yield
+            finally:
+                fcntl.flock(handle, fcntl.LOCK_UN)
+
+    def discard(self, version: str) -> None:
+        if version == LEGACY_VERSION:
+            return
+        shutil.rmtree(self.directory(version), ignore_errors=True)
+
+    def _prune(self) -> None:
+        if not self.versions_dir.exists():
+            return
+        active = self._read_pointer().get("active") or ""
+        retained = {active, *self.history()}
+        for path in self.versions_dir.iterdir():
+            # Versions newer than the active one may be builds still in flight.
+            if path.is_dir() and path.name not in retained and path.name < active:
+                shutil.rmtree(path, ignore_errors=True)
@@ -1,5 +1,6 @@
+from pydantic import field_validator
 from pydantic_settings import BaseSettings
-from typing import List
+from typing import List, Optional
 import os
 from pathlib import Path
 
@@ -8,6 +9,11 @@ def _parse_origins(value: str) -> List[str]:
     return [v.strip() for v in value.split(',') if v.strip()]
 
 
+def _optional_float(name: str) -> Optional[float]:
+    value = os.getenv(name, "").strip()
+    return float(value) if value else None
+
+
 BASE_DIR = Path(__file__).resolve().parents[2]
 DEFAULT_RAG_DIR = BASE_DIR / "SUMABackend" / "RAG_textbook"
 
@@ -21,9 +27,66 @@ class Settings(BaseSettings):
     CORS_ORIGINS: List[str] = _parse_origins(os.getenv("CORS_ORIGINS", "http://localhost:3000"))
     OPENAI_API_KEY: str = os.getenv("OPENAI_API_KEY", "")
     OPENAI_MODEL: str = os.getenv("OPENAI_MODEL", "gpt-4o-mini")
+    # "small-model:max_tokens,...,large-model"; empty uses OPENAI_MODEL for everything.
+    OPENAI_MODEL_TIERS: str = os.getenv("OPENAI_MODEL_TIERS", "")
     RAG_TEXTBOOK_DIR: str = os.getenv("RAG_TEXTBOOK_DIR", str(DEFAULT_RAG_DIR))
     RAG_PERSIST_DIR: str = os.getenv("RAG_PERSIST_DIR", str(DEFAULT_RAG_DIR / "chroma_db"))
     RAG_QUIZ_DIR: str = os.getenv("RAG_QUIZ_DIR", str(DEFAULT_RAG_DIR))
+    RAG_INDEX_BACKEND: str = os.getenv("RAG_INDEX_BACKEND", "chroma")  # chroma | numpy
+    RAG_INDEX_DTYPE: str = os.getenv("RAG_INDEX_DTYPE", "float32")  # float32 | float16 | int8
+    RAG_INDEX_RESCORE: int = int(os.getenv("RAG_INDEX_RESCORE", "0"))
+    RAG_RELOAD_INTERVAL: float = float(os.getenv("RAG_RELOAD_INTERVAL", "5"))
+    RAG_SEARCH_MODE: str = os.getenv("RAG_SEARCH_MODE", "dense")  # dense | lexical | hybrid
+    RAG_QUIZ_SEARCH_MODE: str = os.getenv("RAG_QUIZ_SEARCH_MODE", "dense")
+    RAG_QUIZ_SCAN_INTERVAL: float = float(os.getenv("RAG_QUIZ_SCAN_INTERVAL", "30"))
+    RAG_EMBEDDING_CACHE_SIZE: int = int(os.getenv("RAG_EMBEDDING_CACHE_SIZE", "1024"))
+    RAG_RESULT_CACHE_SIZE: int = int(os.getenv("RAG_RESULT_CACHE_SIZE", "1024"))
+    RAG_QUERY_WINDOW_CHARS: int = int(os.getenv("RAG_QUERY_WINDOW_CHARS", "2000"))
+    RAG_QUERY_MAX_WINDOWS: int = int(os.getenv("RAG_QUERY_MAX_WINDOWS", "8"))
+    RAG_LONG_QUERY_AGGREGATE: str = os.getenv("RAG_LONG_QUERY_AGGREGATE", "max")  # max | rrf
+    RAG_ANSWER_CACHE_SIZE: int = int(os.getenv("RAG_ANSWER_CACHE_SIZE", "256"))
+    RAG_ANSWER_CACHE_THRESHOLD: float = float(os.getenv("RAG_ANSWER_CACHE_THRESHOLD", "0.95"))
+    RAG_ANSWER_CACHE_TTL: float = float(os.getenv("RAG_ANSWER_CACHE_TTL", "3600"))
+    RAG_CONTEXT_TOKENS: int = int(os.getenv("RAG_CONTEXT_TOKENS", "1500"))
+    RAG_CONTEXT_CANDIDATES: int = int(os.getenv("RAG_CONTEXT_CANDIDATES", "8"))
+    RAG_CHUNKER: str = os.getenv("RAG_CHUNKER", "fast")  # fast | sentences | langchain
+    RAG_DEDUP_THRESHOLD: float = float(os.getenv("RAG_DEDUP_THRESHOLD", "0.9"))  # 0 disables
+    RAG_SHARD_BY_SUBJECT: bool = os.getenv("RAG_SHARD_BY_SUBJECT", "false").lower() in (
+        "1",
+        "true",
+        "yes",
+    )
+    RAG_SHARD_MAX_ROUTED: int = int(os.getenv("RAG_SHARD_MAX_ROUTED", "2"))
+    RAG_SHARD_ROUTE_MARGIN: float = float(os.getenv("RAG_SHARD_ROUTE_MARGIN", "0.5"))
+    RAG_HNSW_SPACE: str = os.getenv("RAG_HNSW_SPACE", "l2")  # l2 | cosine | ip
+    RAG_HNSW_M: int = int(os.getenv("RAG_HNSW_M", "16"))
+    RAG_HNSW_CONSTRUCTION_EF: int = int(os.getenv("RAG_HNSW_CONSTRUCTION_EF", "100"))
+    RAG_HNSW_SEARCH_EF: int = int(os.getenv("RAG_HNSW_SEARCH_EF", "10"))
+    RAG_SNAPSHOT_PATH: str = os.getenv("RAG_SNAPSHOT_PATH", "")
+    RAG_DIGEST_FAST_PATH: bool = os.getenv("RAG_DIGEST_FAST_PATH", "true").lower() in (
+        "1",
+        "true",
+        "yes",
+    )
+    RAG_TASK_CONTEXT_SIZE: int = int(os.getenv("RAG_TASK_CONTEXT_SIZE", "256"))  # 0 disables
+    # Cosine distance within which a task's chunks answer a follow-up question.
+    RAG_TASK_CONTEXT_MAX_DISTANCE: float = float(
+        os.getenv("RAG_TASK_CONTEXT_MAX_DISTANCE", "0.25")
+    )
+    RAG_WARMUP: bool = os.getenv("RAG_WARMUP", "false").lower() in ("1", "true", "yes")
+    RAG_WARMUP_QUERY: str = os.getenv("RAG_WARMUP_QUERY", "warm-up probe")
+    # Seconds before retrying a failed warm-up; doubles up to the max.
+    RAG_WARMUP_RETRY_DELAY: float = float(os.getenv("RAG_WARMUP_RETRY_DELAY", "5"))
+    RAG_WARMUP_RETRY_MAX_DELAY: float = float(os.getenv("RAG_WARMUP_RETRY_MAX_DELAY", "300"))
+    # Cosine distance, 0..2; unset or empty keeps every top-k hit.
+    RAG_MAX_DISTANCE: Optional[float] = _optional_float("RAG_MAX_DISTANCE")
+    # Cosine distance within which a hit counts towards coverage/confidence.
+    RAG_COVERAGE_MAX_DISTANCE: float = float(os.getenv("RAG_COVERAGE_MAX_DISTANCE", "0.25"))
+
+    @field_validator("RAG_MAX_DISTANCE", mode="before")
+    @classmethod
+    def _empty_is_none(cls, value):
+        return None if isinstance(value, str) and not value.strip() else value
 
 
 settings = Settings()
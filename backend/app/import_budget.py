@@ -0,0 +1,113 @@
+"""Import-time budget check for the API process.
+
+Imports ``app.main`` in fresh interpreters under ``python -X importtime`` and
+exits non-zero when the median import time exceeds the budget or when a module
+of the lazily imported AI stack is loaded at start-up. Run from ``backend/``::
+
+    python -m app.import_budget --budget-ms 1000 --runs 5
+"""
+from __future__ import annotations
+
+import argparse
+import json
+import statistics
+import subprocess
+import sys
+from pathlib import Path
+from typing import Dict, List, NamedTuple, Sequence
+
+BACKEND_DIR = Path(__file__).resolve().parents[1]
+DEFAULT_MODULE = "app.main"
+DEFAULT_BUDGET_MS = 1000.0
+# Top-level packages only the AI code paths need; importing ``app.main`` must not load them.
+LAZY_PACKAGES = (
+    "chromadb",
+    "langchain",
+    "langchain_community",
+    "langchain_core",
+    "langchain_openai",
+    "langchain_text_splitters",
+    "openai",
+    "PyPDF2",
+    "tiktoken",
+)
+
+
+class ImportRecord(NamedTuple):
+    module: str
+    self_us: int
+    cumulative_us: int
+    depth: int
+
+
+def parse_importtime(stderr: str) -> List[ImportRecord]:
+    """Parse ``-X importtime`` output (``import time: self | cumulative | name`` lines)."""
+    records: List[ImportRecord] = []
+    for line in stderr.splitlines():
+        if not line.startswith("import time:"):
+            continue
+        fields = line[len("import time:") :].split("|")
+        if len(fields) != 3 or not fields[0].strip().isdigit():
+            continue  # the header line
+        name = fields[2].rstrip()
+        # One space after the bar, then two more per nesting level.
+        depth = (len(name) - len(name.lstrip(" ")) - 1) // 2
+        records.append(ImportRecord(name.strip(), int(fields[0]), int(fields[1]), depth))
+    return records
+
+
+def measure(module: str = DEFAULT_MODULE) -> List[ImportRecord]:
+    result = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", f"import {module}"],
+        cwd=BACKEND_DIR,
+        capture_output=True,
+        text=True,
+        check=False,
+    )
+    if result.returncode != 0:
+        raise RuntimeError(f"importing {module} failed:\n{result.stderr[-2000:]}")
+    return parse_importtime(result.stderr)
+
+
+def check(
+    *,
+    module: str = DEFAULT_MODULE,
+    budget_ms: float = DEFAULT_BUDGET_MS,
+    runs: int = 3,
+    lazy_packages: Sequence[str] = LAZY_PACKAGES,
+) -> Dict:
+    totals: List[float] = []
+    records: List[ImportRecord] = []
+    for _ in range(runs):
+        records = measure(module)
+        # Top-level entries cover every import once, interpreter start-up included.
+        totals.append(sum(r.cumulative_us for r in records if r.depth == 0) / 1000)
+    top_level = sorted(
+        (r for r in records if r.depth == 0), key=lambda r: r.cumulative_us, reverse=True
+    )
+    loaded = sorted({r.module.split(".")[0] for r in records} & set(lazy_packages))
+    total_ms = statistics.median(totals)
+    return {
+        "module": module,
+        "runs": runs,
+        "total_ms": total_ms,
+        "budget_ms": budget_ms,
+        "slowest": {r.module: r.cumulative_us / 1000 for r in top_level[:5]},
+        "eagerly_imported": loaded,
+        "ok": total_ms <= budget_ms and not loaded,
+    }
+
+
+def main(argv: Sequence[str] | None = None) -> int:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--module", default=DEFAULT_MODULE)
+    parser.add_argument("--budget-ms", type=float, default=DEFAULT_BUDGET_MS)
+    parser.add_argument("--runs", type=int, default=3, help="median of this many interpreters")
+    args = parser.parse_args(argv)
+    report = check(module=args.module, budget_ms=args.budget_ms, runs=args.runs)
+    print(json.dumps(report, indent=2))
+    return 0 if report["ok"] else 1
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -10,6 +10,7 @@ from .security import hash_password, verify_password, create_access_token, creat
 from .init_db import init_db
 from .deps import get_db
 from .routes_ai import router as ai_router
+from .ai.analysis import ai_service
 
 app = FastAPI(title="Suma API")
 
@@ -25,11 +26,21 @@ app.add_middleware(
 @app.on_event("startup")
 def on_startup():
     init_db()
+    if settings.RAG_WARMUP:
+        # Load the RAG stack in the background; /ready reports 503 until it is done.
+        ai_service.start_warm_up()
 
 
 app.include_router(ai_router)
 
 
+@app.get("/ready")
+def ready(response: Response):
+    if not ai_service.is_ready:
+        response.status_code = status.HTTP_503_SERVICE_UNAVAILABLE
+    return {"ready": ai_service.is_ready, "warmup": ai_service.warmup_status}
+
+
 REFRESH_COOKIE_NAME = "suma_refresh"
 # 開發環境 secure=False；上線請改為 True 並使用 HTTPS
 COOKIE_PARAMS = dict(httponly=True, samesite="lax", secure=False, path="/")
@@ -4,13 +4,16 @@ import json
 from typing import List, Optional
 
 from fastapi import APIRouter, Depends, File, Form, HTTPException, UploadFile
+from fastapi.concurrency import run_in_threadpool
 from sqlalchemy.orm import Session
 
 from .ai.analysis import ai_service
+from .config import settings
 from .deps import get_db
 from .models import AssignmentAnalysis
 from .schemas import (
     AssignmentAnalysisOut,
+    RagBatchSearchRequest,
     RagBuildRequest,
     RagCheckRequest,
     RagQueryRequest,
@@ -40,6 +43,42 @@ def _load_dict(value: Optional[str]) -> Optional[dict]:
         return None
 
 
+def _subject_kwargs(subject: Optional[str]) -> dict:
+    """``subject=...`` for the per-subject RAG service; rejected without sharding."""
+    if subject is None:
+        return {}
+    if not settings.RAG_SHARD_BY_SUBJECT:
+        raise HTTPException(
+            status_code=400,
+            detail="Subjects require per-subject shards (RAG_SHARD_BY_SUBJECT).",
+        )
+    return {"subject": subject}
+
+
+def _rag_target(subject: Optional[str]):
+    """The RAG service, or one subject's shard of it for maintenance endpoints."""
+    rag = ai_service.get_rag()
+    if not _subject_kwargs(subject):
+        return rag
+    try:
+        return rag.shard(subject)
+    except ValueError as exc:
+        raise HTTPException(status_code=404, detail=str(exc)) from exc
+
+
+def _filter_kwargs(payload) -> dict:
+    """``filters=...`` from the source/page/doc_type fields of a search request."""
+    from .ai.metadata_index import ChunkFilter
+
+    filters = ChunkFilter(
+        source=payload.source,
+        page_from=payload.page_from,
+        page_to=payload.page_to,
+        doc_type=payload.doc_type,
+    )
+    return {"filters": filters} if filters else {}
+
+
 def _to_schema(model: AssignmentAnalysis) -> AssignmentAnalysisOut:
     return AssignmentAnalysisOut(
         task_id=model.task_id,
@@ -62,6 +101,7 @@ async def analyze_assignment(
     file: UploadFile = File(...),
     task_id: Optional[str] = Form(default=None),
     force_refresh: bool = Form(default=False),
+    detail: str = Form(default="standard"),
     db: Session = Depends(get_db),
 ):
     resolved_task_id = ai_service.generate_task_id(task_id)
@@ -80,9 +120,13 @@ async def analyze_assignment(
     if not pdf_text.strip():
         raise HTTPException(status_code=400, detail="Unable to extract text from PDF.")
 
-    analysis_payload = ai_service.analyze_assignment(pdf_text)
+    try:
+        analysis_payload = ai_service.analyze_assignment(pdf_text, detail=detail)
+    except ValueError as exc:
+        raise HTTPException(status_code=400, detail=str(exc)) from exc
     tags = ai_service.generate_tags(analysis_payload)
     rag_report = ai_service.check_high_occurrence(pdf_text)
+    ai_service.remember_task(resolved_task_id, rag_report)
     ai_comment = ai_service.compose_ai_comment(analysis_payload, rag_report)
 
     difficulty_value = analysis_payload.get("difficulty")
@@ -141,29 +185,105 @@ async def list_analyses(db: Session = Depends(get_db)):
     return [_to_schema(record) for record in records]
 
 
-@router.post("/rag/build-vectorstore")
+@router.get("/model-stats")
+async def model_stats():
+    return ai_service.model_router.stats()
+
+
+@router.post("/rag/build-vectorstore", status_code=202)
 async def build_vectorstore(payload: RagBuildRequest):
-    rag = ai_service.get_rag()
-    rag.build_vectorstore(force_rebuild=payload.force_rebuild)
-    return {"status": "ok"}
+    rag = _rag_target(payload.subject)
+    # Builds run off the event loop into a new version directory; searches keep
+    # using the active store until the new one validates and is swapped in.
+    if not rag.try_start_build(force_rebuild=payload.force_rebuild):
+        raise HTTPException(status_code=409, detail="A vectorstore build is already running.")
+    return {"status": "accepted", "active_version": rag.version}
+
+
+@router.get("/rag/build-status")
+async def build_status(subject: Optional[str] = None):
+    return _rag_target(subject).status()
+
+
+@router.get("/rag/cache-stats")
+async def rag_cache_stats(subject: Optional[str] = None):
+    return _rag_target(subject).cache_stats()
+
+
+@router.post("/rag/rollback")
+async def rollback_vectorstore(subject: Optional[str] = None):
+    rag = _rag_target(subject)
+    try:
+        version = await run_in_threadpool(rag.rollback)
+    except ValueError as exc:
+        raise HTTPException(status_code=409, detail=str(exc)) from exc
+    return {"status": "ok", "active_version": version}
 
 
 @router.post("/rag/query")
-async def rag_query(payload: RagQueryRequest):
+async def rag_query(payload: RagQueryRequest, db: Session = Depends(get_db)):
     rag = ai_service.get_rag()
-    return rag.query(payload.question, openai_api_key=None)
+    task_kwargs = {}
+    if payload.task_id:
+        task_kwargs = {"task_id": payload.task_id}
+        if not ai_service.has_task_context(payload.task_id):
+            # Analyzed before a restart or by another worker: reload from the stored report.
+            record = (
+                db.query(AssignmentAnalysis)
+                .filter(AssignmentAnalysis.task_id == payload.task_id)
+                .first()
+            )
+            if record:
+                ai_service.remember_task(payload.task_id, _load_dict(record.rag_summary))
+    try:
+        return rag.query(
+            payload.question,
+            openai_api_key=None,
+            **task_kwargs,
+            **_subject_kwargs(payload.subject),
+        )
+    except ValueError as exc:
+        raise HTTPException(status_code=400, detail=str(exc)) from exc
 
 
 @router.post("/rag/search")
 async def rag_search(payload: RagSearchRequest):
     rag = ai_service.get_rag()
-    return rag.search_similar_content(payload.query, k=payload.k)
+    try:
+        return rag.search_similar_content(
+            payload.query,
+            k=payload.k,
+            mode=payload.mode,
+            max_distance=payload.max_distance,
+            **_filter_kwargs(payload),
+            **_subject_kwargs(payload.subject),
+        )
+    except ValueError as exc:
+        raise HTTPException(status_code=400, detail=str(exc)) from exc
+
+
+@router.post("/rag/search-batch")
+async def rag_search_batch(payload: RagBatchSearchRequest):
+    rag = ai_service.get_rag()
+    try:
+        results = rag.search_similar_content_batch(
+            payload.queries,
+            k=payload.k,
+            mode=payload.mode,
+            max_distance=payload.max_distance,
+            **_filter_kwargs(payload),
+            **_subject_kwargs(payload.subject),
+        )
+    except ValueError as exc:
+        raise HTTPException(status_code=400, detail=str(exc)) from exc
+    return {"results": results}
 
 
 @router.post("/rag/analyze-quiz")
 async def rag_analyze_quiz(
     file: UploadFile = File(default=None),
     text: Optional[str] = Form(default=None),
+    subject: Optional[str] = Form(default=None),
 ):
     if file is None and not text:
         raise HTTPException(status_code=400, detail="Provide a quiz PDF or text content.")
@@ -172,15 +292,22 @@ async def rag_analyze_quiz(
         file_bytes = await file.read()
         quiz_text = ai_service.extract_text_from_pdf(file_bytes)
     rag = ai_service.get_rag()
-    return rag.analyze_quiz(quiz_text)
+    try:
+        return rag.analyze_quiz(quiz_text, **_subject_kwargs(subject))
+    except ValueError as exc:
+        raise HTTPException(status_code=400, detail=str(exc)) from exc
 
 
 @router.post("/rag/check-high-occurrence")
 async def rag_check_high_occurrence(payload: RagCheckRequest):
-    report = ai_service.check_high_occurrence(
-        payload.assignment_text,
-        quiz_texts=payload.quiz_texts,
-    )
+    try:
+        report = ai_service.check_high_occurrence(
+            payload.assignment_text,
+            quiz_texts=payload.quiz_texts,
+            **_subject_kwargs(payload.subject),
+        )
+    except ValueError as exc:
+        raise HTTPException(status_code=400, detail=str(exc)) from exc
     if report is None:
         raise HTTPException(status_code=400, detail="Assignment text cannot be empty.")
     return report
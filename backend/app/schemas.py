@@ -1,5 +1,5 @@
 from datetime import datetime
-from typing import Dict, List, Optional
+from typing import Dict, List, Literal, Optional
 
 from pydantic import BaseModel, EmailStr
 
@@ -41,17 +41,52 @@ class AssignmentAnalysisOut(BaseModel):
 
 class RagBuildRequest(BaseModel):
     force_rebuild: bool = False
+    # With RAG_SHARD_BY_SUBJECT: build only this subject's shard.
+    subject: Optional[str] = None
 
 
 class RagQueryRequest(BaseModel):
     question: str
+    # Follow-up to this /ai/analyze task: rank its textbook sections first.
+    task_id: Optional[str] = None
+    # With RAG_SHARD_BY_SUBJECT: answer from this subject instead of routing.
+    subject: Optional[str] = None
 
 
 class RagSearchRequest(BaseModel):
     query: str
     k: int = 5
+    mode: Optional[Literal["dense", "lexical", "hybrid"]] = None
+    # Only return chunks within this cosine distance (up to k).
+    max_distance: Optional[float] = None
+    # Only search chunks of this source PDF, page range (inclusive, numbered like
+    # the results' ``page``) and/or document type.
+    source: Optional[str] = None
+    page_from: Optional[int] = None
+    page_to: Optional[int] = None
+    doc_type: Optional[Literal["textbook", "quiz", "homework"]] = None
+    # With RAG_SHARD_BY_SUBJECT: search this subject instead of routing.
+    subject: Optional[str] = None
+
+
+class RagBatchSearchRequest(BaseModel):
+    queries: List[str]
+    k: int = 5
+    mode: Optional[Literal["dense", "lexical", "hybrid"]] = None
+    # Only return chunks within this cosine distance (up to k).
+    max_distance: Optional[float] = None
+    # Only search chunks of this source PDF, page range (inclusive, numbered like
+    # the results' ``page``) and/or document type.
+    source: Optional[str] = None
+    page_from: Optional[int] = None
+    page_to: Optional[int] = None
+    doc_type: Optional[Literal["textbook", "quiz", "homework"]] = None
+    # With RAG_SHARD_BY_SUBJECT: search this subject instead of routing.
+    subject: Optional[str] = None
 
 
 class RagCheckRequest(BaseModel):
     assignment_text: str
     quiz_texts: Optional[List[str]] = None
+    # With RAG_SHARD_BY_SUBJECT: check against this subject instead of routing.
+    subject: Optional[str] = None
@@ -0,0 +1,130 @@
+"""SpanChunker must reproduce LangChain's RecursiveCharacterTextSplitter exactly."""
+import random
+
+import pytest
+from langchain.text_splitter import RecursiveCharacterTextSplitter
+from langchain_core.documents import Document
+
+from app.ai.chunker import SENTENCE_ENDINGS, SpanChunker
+
+# (chunk_size, chunk_overlap) of ingestion and of the long-query windows.
+SETTINGS = [(512, 50), (2000, 200)]
+
+CASES = {
+    "empty": "",
+    "whitespace": " \n\n \n  ",
+    "no_separators": "x" * 5000,
+    "no_separators_cjk": "酸化還元反応" * 900,
+    "cjk_punctuation": (
+        "電子を失う変化を酸化という。電子を受け取る変化を還元という！本当か？はい；" * 120
+    ),
+    "separator_runs": ("word " * 30 + "\n" * 7 + " " * 9 + "\n\n\n\n") * 40,
+    "long_word_between_spaces": "short words " * 20 + "y" * 3000 + " tail words" * 30,
+    "long_paragraph": "Oxidation is the loss of electrons. Reduction is the gain! Why? "
+    * 80,
+    "mixed": (
+        "1.2 Redox reactions\n\nOxidation is the loss of electrons. Reduction is the gain! "
+        "Why? 酸化数が増える。\n" * 60
+    ),
+}
+
+
+def _fuzz_texts(count: int, seed: int = 0):
+    rng = random.Random(seed)
+    alphabet = ["a", "b", "化", "学", " ", " ", "\n", "\n\n", "。", ". ", "?", "\t"]
+    for _ in range(count):
+        yield "".join(
+            rng.choice(alphabet) * rng.choice((1, 1, 1, 3, 40))
+            for _ in range(rng.randint(0, 3000))
+        )
+
+
+def _langchain_chunks(text: str, chunk_size: int, chunk_overlap: int):
+    splitter = RecursiveCharacterTextSplitter(
+        chunk_size=chunk_size,
+        chunk_overlap=chunk_overlap,
+        length_function=len,
+        add_start_index=True,
+    )
+    return [
+        (doc.page_content, doc.metadata["start_index"])
+        for doc in splitter.create_documents([text])
+    ]
+
+
+def _assert_matches_langchain(text: str, chunk_size: int, chunk_overlap: int) -> None:
+    chunker = SpanChunker(chunk_size=chunk_size, chunk_overlap=chunk_overlap)
+    expected = _langchain_chunks(text, chunk_size, chunk_overlap)
+    spans = list(chunker.split_spans(text))
+    assert chunker.split_text(text) == [chunk for chunk, _ in expected]
+    previous_end = 0
+    for (start, end), (chunk, start_index) in zip(spans, expected):
+        assert text[start:end] == chunk
+        # LangChain finds offsets by searching for the chunk text, which is only
+        # reliable when the chunk occurs once; repeated text is checked by order.
+        if text.find(chunk) == text.rfind(chunk):
+            assert start == start_index
+        # Chunks advance and skip nothing but whitespace between them.
+        assert start >= previous_end - chunk_overlap
+        assert not text[previous_end:start].strip()
+        previous_end = end
+    assert not text[previous_end:].strip()
+
+
+@pytest.mark.parametrize("chunk_size,chunk_overlap", SETTINGS)
+@pytest.mark.parametrize("name", sorted(CASES))
+def test_matches_langchain(name, chunk_size, chunk_overlap):
+    _assert_matches_langchain(CASES[name], chunk_size, chunk_overlap)
+
+
+@pytest.mark.parametrize("chunk_size,chunk_overlap", SETTINGS + [(20, 5), (7, 0)])
+def test_matches_langchain_fuzz(chunk_size, chunk_overlap):
+    for text in _fuzz_texts(100, seed=chunk_size):
+        _assert_matches_langchain(text, chunk_size, chunk_overlap)
+
+
+def test_split_documents_records_offsets():
+    text = CASES["mixed"]
+    doc = Document(page_content=text, metadata={"source": "book.pdf", "page": 3})
+    chunks = SpanChunker().split_documents([doc])
+    assert [chunk.page_content for chunk in chunks] == SpanChunker().split_text(text)
+    for chunk in chunks:
+        assert chunk.metadata["source"] == "book.pdf" and chunk.metadata["page"] == 3
+        assert text[chunk.metadata["start"] : chunk.metadata["end"]] == chunk.page_content
+
+
+@pytest.mark.parametrize("name", ["no_separators", "separator_runs", "whitespace"])
+def test_sentences_mode_unchanged_without_sentence_endings(name):
+    text = CASES[name]
+    assert not any(ending in text for ending in SENTENCE_ENDINGS)
+    assert SpanChunker(sentences=True).split_text(text) == SpanChunker().split_text(text)
+
+
+@pytest.mark.parametrize("name", ["cjk_punctuation", "long_paragraph"])
+def test_sentences_mode_cuts_after_sentence_endings(name):
+    text = CASES[name]
+    default = SpanChunker().split_text(text)
+    chunker = SpanChunker(sentences=True)
+    chunks = chunker.split_text(text)
+    assert chunks != default
+    for start, end in chunker.split_spans(text):
+        # Still offsets into the page, within the size limit, and every cut inside
+        # a line falls right after a sentence ending rather than mid-sentence.
+        assert end - start <= chunker.chunk_size
+        tail = text[:end].rstrip()
+        if end < len(text) and "\n" not in text[end - 1 : end + 1]:
+            assert tail.endswith(tuple(ending.strip() for ending in SENTENCE_ENDINGS))
+
+
+def test_sentences_mode_keeps_paragraph_splits():
+    # Paragraphs that fit are split on blank lines before sentence endings matter.
+    text = "First sentence. Second one.\n\nThird sentence. Fourth one."
+    assert SpanChunker(chunk_size=30, chunk_overlap=0, sentences=True).split_text(text) == [
+        "First sentence. Second one.",
+        "Third sentence. Fourth one.",
+    ]
+
+
+def test_overlap_larger_than_size_is_rejected():
+    with pytest.raises(ValueError):
+        SpanChunker(chunk_size=10, chunk_overlap=11)
@@ -0,0 +1,69 @@
+"""Which questions the digest fast path answers, and from which digest."""
+import pytest
+
+from app.ai.digests import Digest, DigestIndex
+
+
+def _digest(chapter, section, title):
+    return Digest(
+        source="chem.pdf",
+        chapter=chapter,
+        section=section,
+        title=title,
+        page_from=0,
+        page_to=1,
+        summary=f"Summary of {title}.",
+        key_concepts=[title],
+    )
+
+
+INDEX = DigestIndex(
+    [
+        _digest(1, None, "物質的組成"),
+        _digest(1, 2, "原子結構"),
+        _digest(2, None, "化學反應"),
+        _digest(2, 1, "化學計量"),
+        _digest(3, None, "氣體"),
+        _digest(3, 5, "理想氣體方程式"),
+    ]
+)
+
+
+@pytest.mark.parametrize(
+    "question,heading,intent",
+    [
+        ("Summarize chapter 3", "Chapter 3 氣體", "summary"),
+        ("第二章的重點", "Chapter 2 化學反應", "concepts"),
+        ("Key concepts of section 2-1", "2-1 化學計量", "concepts"),
+        ("summarize §3.5", "3-5 理想氣體方程式", "summary"),
+        ("sec. 1.2 overview", "1-2 原子結構", "summary"),
+        ("2-1節的重點是什麼", "2-1 化學計量", "concepts"),
+        ("第三章第五節摘要", "3-5 理想氣體方程式", "summary"),
+        ("chapter 1 section 2 summary", "1-2 原子結構", "summary"),
+        ("化學計量 summary", "2-1 化學計量", "summary"),
+    ],
+)
+def test_overview_questions_match_one_digest(question, heading, intent):
+    digest, matched_intent = INDEX.match(question)
+    assert (digest.heading, matched_intent) == (heading, intent)
+
+
+@pytest.mark.parametrize(
+    "question",
+    [
+        # Decimals and ranges are not section references.
+        "summarize 3.5",
+        "summarize the 1-2 problems",
+        "key concepts for a pH of 2.1",
+        "overview of questions 1-2 and 3.5 mol",
+        "summarize section 3.5.1",
+        # Specific questions and questions without an overview intent.
+        "why does chapter 3 matter",
+        "what is in section 2-1",
+        # Unknown chapters and sections.
+        "summarize chapter 9",
+        "summarize section 2-4",
+    ],
+)
+def test_other_questions_are_not_matched(question):
+    assert INDEX.match(question) is None
@@ -0,0 +1,39 @@
+"""Row filters of ChunkMetadataIndex and their Chroma ``where`` equivalents."""
+from app.ai.metadata_index import ChunkFilter, ChunkMetadataIndex
+
+METADATAS = [
+    {"source": "chem.pdf", "page": 0},
+    {"source": "chem.pdf", "page": 2},
+    {"source": "chem.pdf"},  # unknown page
+    {"source": "exam.pdf", "page": 1},
+    {"source": "chem.pdf", "page": 5},
+    {"source": "exam.pdf", "page": "iv"},  # unknown page
+]
+
+
+def _rows(**filters):
+    return ChunkMetadataIndex.build(METADATAS).rows(ChunkFilter(**filters)).tolist()
+
+
+def test_without_page_bounds_unknown_pages_match():
+    assert _rows(source="chem.pdf") == [0, 1, 2, 4]
+    assert _rows(source="exam.pdf") == [3, 5]
+
+
+def test_page_bounds_exclude_unknown_pages():
+    assert _rows(page_to=2) == [0, 1, 3]
+    assert _rows(source="chem.pdf", page_to=4) == [0, 1]
+    assert _rows(page_from=1) == [1, 3, 4]
+    assert _rows(page_from=1, page_to=2) == [1, 3]
+
+
+def test_where_clause_excludes_unknown_pages():
+    index = ChunkMetadataIndex.build(METADATAS)
+    assert index.where(ChunkFilter(source="chem.pdf")) == {"source": {"$in": ["chem.pdf"]}}
+    assert index.where(ChunkFilter(page_to=2)) == {
+        "$and": [
+            {"source": {"$in": ["chem.pdf", "exam.pdf"]}},
+            {"page": {"$gte": 0}},
+            {"page": {"$lte": 2}},
+        ]
+    }
@@ -0,0 +1,89 @@
+"""Follow-up questions with a ``task_id`` and their fallback to the whole index."""
+import hashlib
+import math
+import re
+
+import pytest
+from langchain_community.chat_models.fake import FakeListChatModel
+from langchain_core.documents import Document
+from langchain_core.embeddings import Embeddings
+
+from app.ai import rag as rag_module
+from app.ai.rag import TextbookRAG
+
+REDOX = "oxidation reduction electrons redox transfer oxidizing agent reducing agent"
+GAS = "ideal gas law pressure volume temperature moles boyle charles"
+PAGES = [REDOX, GAS, "acid base titration indicator neutralization burette"]
+
+
+class HashEmbeddings(Embeddings):
+    """Signed bag-of-words hashing, so distances follow word overlap offline."""
+
+    dim = 256
+
+    def _embed(self, text):
+        vector = [0.0] * self.dim
+        for token in re.findall(r"\w+", text.lower()):
+            value = int(hashlib.md5(token.encode()).hexdigest(), 16)
+            vector[value % self.dim] += 1.0 if (value >> 8) & 1 else -1.0
+        norm = math.sqrt(sum(x * x for x in vector)) or 1.0
+        return [x / norm for x in vector]
+
+    def embed_documents(self, texts):
+        return [self._embed(text) for text in texts]
+
+    def embed_query(self, text):
+        return self._embed(text)
+
+
+class WordEncoding:
+    """Whitespace tokens, so the context packer needs no tiktoken download."""
+
+    encode = staticmethod(str.split)
+    decode = staticmethod(" ".join)
+
+
+@pytest.fixture
+def rag(tmp_path, monkeypatch):
+    monkeypatch.setattr(
+        rag_module, "ChatOpenAI", lambda **kwargs: FakeListChatModel(responses=["answer"] * 10)
+    )
+    rag = TextbookRAG(
+        textbook_dir=tmp_path / "books",
+        persist_directory=tmp_path / "index",
+        openai_api_key="sk-test",
+        index_backend="numpy",
+        answer_cache_size=0,
+        dedup_threshold=0,
+    )
+    rag.embeddings = HashEmbeddings()
+    rag.context_packer._encoding = WordEncoding()
+    monkeypatch.setattr(
+        rag,
+        "load_textbooks",
+        lambda: [
+            Document(page_content=text, metadata={"source": "chem.pdf", "page": page})
+            for page, text in enumerate(PAGES)
+        ],
+    )
+    rag.build_vectorstore()
+    redox_row = rag.search_similar_content(REDOX, k=1)[0]["chunk_id"]
+    assert rag.remember_task("task", [redox_row])
+    return rag
+
+
+def test_on_topic_question_uses_task_context(rag):
+    question = "redox oxidation reduction electrons transfer oxidizing agent"
+    answer = rag.query(question, task_id="task")
+    assert answer["task_context"]
+    assert [source["page"] for source in answer["sources"]] == [0]
+    assert rag.qa_stats["task_context_answers"] == 1
+    assert rag.qa_stats["task_context_fallbacks"] == 0
+
+
+def test_off_topic_question_falls_back_to_the_whole_index(rag):
+    answer = rag.query("ideal gas law pressure volume temperature", task_id="task")
+    assert not answer["task_context"]
+    assert 1 in [source["page"] for source in answer["sources"]]
+    assert rag.qa_stats["task_context_answers"] == 0
+    assert rag.qa_stats["task_context_fallbacks"] == 1